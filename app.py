@@ -1,21 +1,62 @@
 # app.py - Fixed Backend API with Rate Limiting
-from flask import Flask, request, jsonify, make_response
+from flask import Flask, Response, request, jsonify, make_response, send_file, stream_with_context
 from flask_cors import CORS
 from flask_limiter import Limiter
 from flask_limiter.util import get_remote_address
 import os
 import json
+import atexit
 import logging
 import google.generativeai as genai
 import base64
-from PIL import Image, ImageDraw, ImageFont
+from PIL import features
 from io import BytesIO
 from datetime import datetime, timedelta
 import uuid
 import time
 import statistics
+from urllib.parse import quote
 from lineup_backend.metrics import metrics, track_performance
 from lineup_backend.services.barber_matcher import BarberMatcher
+from lineup_backend.perceptual_cache import PerceptualHashCache
+from lineup_backend.moderation_cache import ModerationVerdictCache
+from lineup_backend.image_pipeline import (
+    IngestedImage,
+    ImageIngestError,
+    ingest_base64_image,
+    ingest_image_bytes,
+    image_mime_type,
+    transcode_image,
+    ANALYSIS_MAX_EDGE,
+    MODERATION_MAX_EDGE,
+    TRYON_MAX_EDGE,
+    STORAGE_MAX_EDGE,
+    THUMBNAIL_MAX_EDGE,
+)
+from lineup_backend.post_pipeline import PostPipeline
+from lineup_backend.tryon_jobs import TryOnJobQueue, UserSlots
+from lineup_backend.fake_replicate import FakeReplicate
+from lineup_backend.tryon_cache import TryOnResultCache, tryon_cache_key
+from lineup_backend.preview_renderer import PREVIEW_MAX_EDGE, render_preview
+from lineup_backend.response_cache import PreencodedResponseCache
+from lineup_backend.feed_index import FeedIndex, decode_cursor, encode_cursor
+from lineup_backend.feed_cache import FeedPageCache
+from lineup_backend.blob_store import BlobStore
+from lineup_backend.counter_aggregator import CounterAggregator
+from lineup_backend.storage import IndexedCollection
+from lineup_backend.trending import TrendingHashtags
+from lineup_backend.follow_graph import FollowGraph
+from lineup_backend.middleware.compression import ResponseCompressor
+from lineup_backend.middleware.conditional_get import ConditionalGet
+from lineup_backend.style_resolver import StyleResolver
+from lineup_backend.services.gemini_service import (
+    CircuitBreaker,
+    ResilientGeminiClient,
+    structured_generation_config,
+    structured_prompt,
+)
+from lineup_backend.schemas.base import ValidationError
+from lineup_backend.schemas.gemini import StreamingResponseParser, parse_structured_response
 # Firebase import will be conditional
 
 # Set up logging FIRST
@@ -36,12 +77,14 @@ except ImportError:
 try:
     import firebase_admin
     from firebase_admin import credentials, firestore, storage
+    from google.api_core.exceptions import NotFound as FirestoreNotFound
     logger.info("Firebase Admin SDK loaded successfully")
     FIREBASE_AVAILABLE = True
 except ImportError:
     firebase_admin = None
     firestore = None
     storage = None
+    FirestoreNotFound = None
     FIREBASE_AVAILABLE = False
     logger.warning("Firebase not installed. Will use in-memory storage.")
 
@@ -89,14 +132,24 @@ if not ALLOWED_ORIGINS or ALLOWED_ORIGINS == [""]:
 CORS(app, 
      origins=ALLOWED_ORIGINS,
      methods=["GET", "POST", "PUT", "DELETE", "OPTIONS"],
-     allow_headers=["Content-Type", "Accept", "Authorization"],
+     allow_headers=["Content-Type", "Accept", "Authorization", "X-LineUp-Cache", "Prefer"],
      supports_credentials=False)
 
 # Configure Gemini API
 GEMINI_API_KEY = os.environ.get("GEMINI_API_KEY")
 if GEMINI_API_KEY:
     genai.configure(api_key=GEMINI_API_KEY)
-    model = genai.GenerativeModel('gemini-2.0-flash')
+    # Deadlines, jittered retries and a circuit breaker so a slow/down Gemini can't tie up workers
+    model = ResilientGeminiClient(
+        genai.GenerativeModel('gemini-2.0-flash'),
+        timeout=float(os.environ.get("LINEUP_GEMINI_TIMEOUT", 20)),
+        max_retries=int(os.environ.get("LINEUP_GEMINI_RETRIES", 2)),
+        stream_chunk_timeout=float(os.environ.get("LINEUP_GEMINI_STREAM_CHUNK_TIMEOUT", 10)),
+        breaker=CircuitBreaker(
+            failure_threshold=int(os.environ.get("LINEUP_GEMINI_BREAKER_THRESHOLD", 5)),
+            reset_timeout=float(os.environ.get("LINEUP_GEMINI_BREAKER_RESET", 30)),
+        ),
+    )
     logger.info("Gemini API configured successfully")
 else:
     model = None
@@ -161,15 +214,15 @@ if FIREBASE_AVAILABLE:
         storage_bucket = None
 
 # In-memory storage (fallback when database not available)
-social_posts = []
+# List-like collections with O(1) lookups by id (.get) and by the listed fields (.find)
+social_posts = IndexedCollection(indexes=("username", "hashtags"))
 barber_portfolios = {}
-appointments = []
+appointments = IndexedCollection(indexes=("barberId", "clientId"))
 barber_profiles = {}
-subscription_packages = []  # Barber subscription packages
-client_subscriptions = []   # Client active subscriptions
+subscription_packages = IndexedCollection(indexes=("barberId",))  # Barber subscription packages
+client_subscriptions = IndexedCollection(indexes=("clientId", "barberId"))  # Client active subscriptions
 barber_reviews = {}  # Reviews for barbers: {barber_id: [reviews]}
-post_comments = {}  # Comments on posts: {post_id: [comments]}
-user_follows = {}  # Follow relationships: {user_id: [followed_user_ids]}
+post_comments = {}  # Comments on posts: {post_id: FeedIndex of comments}
 hair_trends = {}  # AI insights on trending styles
 
 # Rate limiting cache for Google Places API
@@ -184,6 +237,62 @@ api_usage_tracker = {
     'daily_reset': datetime.now().date()
 }
 
+# Perceptual-hash cache for /analyze results (near-duplicate selfies skip Gemini)
+# Clients can send "X-LineUp-Cache: bypass" to force a fresh analysis
+ANALYSIS_CACHE_BYPASS_HEADER = 'X-LineUp-Cache'
+analysis_cache = PerceptualHashCache(
+    max_entries=int(os.environ.get("LINEUP_ANALYSIS_CACHE_SIZE", 256)),
+    ttl_seconds=int(os.environ.get("LINEUP_ANALYSIS_CACHE_TTL", 24 * 3600)),
+    max_distance=int(os.environ.get("LINEUP_ANALYSIS_CACHE_DISTANCE", 4)),
+)
+
+# Moderation verdicts keyed by image content/perceptual hash (persists across restarts)
+moderation_cache = ModerationVerdictCache(
+    max_entries=int(os.environ.get("LINEUP_MODERATION_CACHE_SIZE", 5000)),
+)
+
+# Local content-addressed image store used when Cloudinary/Firebase Storage aren't configured
+blob_store = BlobStore(
+    max_bytes=int(os.environ.get("LINEUP_BLOB_STORE_BYTES", 1024 * 1024 * 1024)),
+)
+
+# gzip/brotli for JSON/text responses above a size threshold. Registered before conditional_get
+# (after_request hooks run in reverse) so 304s are decided on the uncompressed body.
+response_compressor = ResponseCompressor(
+    app,
+    min_size=int(os.environ.get("LINEUP_COMPRESSION_MIN_BYTES", 1024)),
+    gzip_level=int(os.environ.get("LINEUP_GZIP_LEVEL", 6)),
+    brotli_quality=int(os.environ.get("LINEUP_BROTLI_QUALITY", 5)),
+    cache_bytes=int(os.environ.get("LINEUP_COMPRESSION_CACHE_BYTES", 16 * 1024 * 1024)),
+)
+
+# Pre-encoded JSON + ETag for constant/fallback payloads (mock data, defaults, / and /config)
+response_cache = PreencodedResponseCache(
+    max_entries=int(os.environ.get("LINEUP_RESPONSE_CACHE_SIZE", 512)),
+)
+
+def cached_json_response(key, builder, status=200):
+    """Serve a payload that is serialized once per key (builder is only called on a miss)"""
+    payload = response_cache.get_or_build(key, builder)
+    response = Response(payload.body, status=status, mimetype='application/json')
+    response.set_etag(payload.etag)
+    response.headers['Access-Control-Allow-Origin'] = '*'
+    response = response.make_conditional(request)
+    # Compressed once per payload and encoding, then reused from the cache entry
+    return response_compressor.compress_payload(response, payload.compressed)
+
+# ETag / If-None-Match for polled read endpoints. Successful writes under a resource's prefix
+# bump its version; data held only in this process gets version ETags checked before the view
+# runs, Firestore-backed data (other workers write too) gets body-hash ETags.
+conditional_get = ConditionalGet(app)
+conditional_get.register("social", ("social", "handle_comments"), ("/social",), versioned=lambda: db is None)
+conditional_get.register("portfolio", ("portfolio",), ("/portfolio",))
+conditional_get.register("appointments", ("handle_appointments",), ("/appointments",))
+conditional_get.register("barber_services", ("manage_services",), ("/barbers/<barber_id>/services",),
+                         versioned=lambda: db is None)
+conditional_get.register("barber_availability", ("manage_availability",), ("/barbers/<barber_id>/availability",),
+                         versioned=lambda: db is None)
+
 def reset_daily_counters():
     """Reset API usage counters daily"""
     global api_usage_tracker
@@ -226,6 +335,7 @@ def clear_all_cache():
     global places_api_cache
     cache_size = len(places_api_cache)
     places_api_cache.clear()
+    cache_size += analysis_cache.clear()
     logger.info(f"All cache cleared: removed {cache_size} entries")
     return cache_size
 
@@ -249,6 +359,13 @@ def increment_gemini_api_usage():
     reset_daily_counters()
     api_usage_tracker['gemini_api_calls'] += 1
 
+# Maps try-on style descriptions to Replicate haircut names (Gemini only for novel ones)
+style_resolver = StyleResolver(
+    gemini_model=model,
+    can_call_gemini=can_make_gemini_api_call,
+    record_gemini_call=increment_gemini_api_usage,
+)
+
 # ========================================
 # IMAGE STORAGE AND CONTENT MODERATION
 # ========================================
@@ -256,7 +373,7 @@ def increment_gemini_api_usage():
 def upload_image_to_storage(image_bytes, filename=None):
     """
     Upload image to FREE Cloudinary storage and return public URL
-    Falls back to base64 if Cloudinary is not configured
+    Falls back to Firebase Storage, then the local blob store (a /media/<hash> URL), then base64
     """
     # Try Cloudinary first (FREE - 25GB free tier)
     if cloudinary_config and CLOUDINARY_AVAILABLE:
@@ -291,12 +408,54 @@ def upload_image_to_storage(image_bytes, filename=None):
         except Exception as e:
             logger.error(f"Error uploading to Firebase Storage: {str(e)}")
     
+    # Local content-addressed store: records carry a short URL instead of the base64 image
+    digest, created = blob_store.put(image_bytes)
+    if digest:
+        logger.info(f"Image {'stored in' if created else 'already in'} local blob store: {digest}")
+        return f"/media/{digest}"
+    
     # Return None to use base64 fallback
     return None
 
-def moderate_image_content(image_bytes):
+def delete_image_from_storage(image_url):
+    """
+    Best-effort removal of an image previously returned by upload_image_to_storage
+    Returns True if the asset was deleted
+    """
+    if not image_url:
+        return False
+    
+    try:
+        if image_url.startswith('/media/'):
+            # Shared by identical uploads: drop this upload's reference, the file goes with the last one
+            return blob_store.release(image_url[len('/media/'):])
+        
+        if cloudinary_config and CLOUDINARY_AVAILABLE and '/upload/' in image_url:
+            # .../image/upload/v1712345678/lineup-community/abc123.jpg -> lineup-community/abc123
+            path = image_url.split('/upload/', 1)[1]
+            parts = path.split('/')
+            if parts[0].startswith('v') and parts[0][1:].isdigit():
+                parts = parts[1:]
+            public_id = '/'.join(parts).rsplit('.', 1)[0]
+            result = cloudinary.uploader.destroy(public_id)
+            logger.info(f"Deleted Cloudinary image {public_id}: {result.get('result')}")
+            return result.get('result') == 'ok'
+        
+        if storage_bucket and f"/{storage_bucket.name}/" in image_url:
+            from urllib.parse import unquote
+            blob_name = unquote(image_url.split(f"/{storage_bucket.name}/", 1)[1])
+            storage_bucket.blob(blob_name).delete()
+            logger.info(f"Deleted Firebase Storage image {blob_name}")
+            return True
+    except Exception as e:
+        logger.error(f"Error deleting stored image {image_url}: {str(e)}")
+    
+    return False
+
+def moderate_image_content(image):
     """
     Moderate image content using Gemini Vision API
+    Accepts an IngestedImage (preferred) or raw image bytes
     Returns: (is_approved, reason) tuple
     - is_approved: True if content passes moderation
     - reason: Error message if rejected, None if approved
@@ -306,73 +465,95 @@ def moderate_image_content(image_bytes):
         return (True, None)
     
     try:
-        # Decode image from bytes
-        image = Image.open(BytesIO(image_bytes))
-        
-        # Moderation prompt - check for explicit content and hair-related content
-        moderation_prompt = """Analyze this image and determine:
-1. Is there any explicit, adult, violent, or inappropriate content? (yes/no)
-2. Is this image related to hair, haircuts, hairstyles, or barber/stylist work? (yes/no)
-
-Respond with ONLY a JSON object in this exact format (no markdown, no explanation):
-{
-    "explicit_content": true/false,
-    "hair_related": true/false,
-    "confidence": "high" | "medium" | "low"
-}
-
-If explicit_content is true, the image must be rejected.
-If hair_related is false, the image must be rejected as it's not relevant to a hair/barber community."""
-
+        # Reuse the already-decoded upload; only decode if we were handed raw bytes
+        ingested = image if isinstance(image, IngestedImage) else ingest_image_bytes(image)
+        
+        # Known-good / known-bad images skip the Gemini round-trip and quota charge
+        lookup_start = time.time()
+        cached_verdict = moderation_cache.get(ingested.content_hash, ingested.phash)
+        if cached_verdict is not None:
+            metrics.record_cache_hit("moderation_verdict", response_time_ms=(time.time() - lookup_start) * 1000)
+            logger.info(f"Content moderation: cached verdict (approved={cached_verdict[0]})")
+            return cached_verdict
+        metrics.record_cache_miss("moderation_verdict")
+        
+        if not model.is_available():
+            logger.warning("Gemini circuit open, skipping moderation (permissive mode)")
+            return (True, None)
+        
         increment_gemini_api_usage()
-        response = model.generate_content([moderation_prompt, image])
-        response_text = response.text.strip()
-        
-        # Parse response
-        if "```json" in response_text:
-            start = response_text.find("```json") + 7
-            end = response_text.rfind("```")
-            if end > start:
-                response_text = response_text[start:end].strip()
-        elif "```" in response_text:
-            start = response_text.find("```") + 3
-            end = response_text.rfind("```")
-            if end > start:
-                response_text = response_text[start:end].strip()
+        gemini_start = time.time()
+        response = model.generate_content(
+            [structured_prompt("moderation"), ingested.gemini_part(MODERATION_MAX_EDGE)],
+            generation_config=structured_generation_config("moderation"),
+        )
+        metrics.record_api_call_time("moderation_verdict", (time.time() - gemini_start) * 1000)
         
         try:
-            moderation_result = json.loads(response_text)
-        except json.JSONDecodeError:
-            # If parsing fails, try to extract JSON from response
-            import re
-            json_match = re.search(r'\{[^}]+\}', response_text)
-            if json_match:
-                moderation_result = json.loads(json_match.group())
-            else:
-                logger.error(f"Failed to parse moderation response: {response_text}")
-                # Permissive fallback - approve if we can't parse
-                return (True, None)
+            moderation_result = parse_structured_response(response.text, "moderation")
+        except ValidationError as e:
+            logger.error(f"Failed to parse moderation response: {e.errors}")
+            # Permissive fallback - approve if we can't parse
+            return (True, None)
         
-        explicit_content = moderation_result.get("explicit_content", False)
-        hair_related = moderation_result.get("hair_related", False)
+        explicit_content = moderation_result["explicit_content"]
+        hair_related = moderation_result["hair_related"]
         
         # Check for explicit content
         if explicit_content:
             logger.warning("Content moderation: Rejected - Explicit/inappropriate content detected")
-            return (False, "Your image contains inappropriate or explicit content and cannot be posted.")
-        
+            verdict = (False, "Your image contains inappropriate or explicit content and cannot be posted.")
         # Check if hair-related
-        if not hair_related:
+        elif not hair_related:
             logger.warning("Content moderation: Rejected - Image is not hair-related")
-            return (False, "Your image must be related to hair, haircuts, or hairstyles. Please post hair-related content only.")
+            verdict = (False, "Your image must be related to hair, haircuts, or hairstyles. Please post hair-related content only.")
+        else:
+            logger.info("Content moderation: Approved")
+            verdict = (True, None)
         
-        logger.info("Content moderation: Approved")
-        return (True, None)
+        # Only real Gemini verdicts are cached, never the permissive fallbacks
+        moderation_cache.set(ingested.content_hash, ingested.phash, *verdict)
+        return verdict
         
     except Exception as e:
         logger.error(f"Error in content moderation: {str(e)}")
         # Permissive fallback - approve if moderation fails
         return (True, None)
+# Newest-first (timestamp, id) index over social_posts, maintained on insert for cursor pagination
+feed_index = FeedIndex()
+FEED_DEFAULT_LIMIT = 20
+FEED_MAX_LIMIT = 50
+
+# Hashtag trend scores, bumped as posts are created so /ai-insights never rescans the feed
+trending_hashtags = TrendingHashtags(
+    half_life=float(os.environ.get("LINEUP_TRENDING_HALF_LIFE", 6 * 3600)),
+    max_tags=int(os.environ.get("LINEUP_TRENDING_MAX_TAGS", 5000)),
+)
+# A tag needs more than one recent use (decayed score) to count as trending
+TRENDING_MIN_SCORE = 1.5
+
+# Follower/followee sets and per-user home timelines: posts are pushed to followers' timelines
+# on publish, except for accounts with more followers than this, whose posts are merged in on read
+follow_graph = FollowGraph(
+    fanout_max_followers=int(os.environ.get("LINEUP_FANOUT_MAX_FOLLOWERS", 1000)),
+    timeline_size=int(os.environ.get("LINEUP_TIMELINE_SIZE", 500)),
+)
+
+# Comments are paged the same way, per post (newest first)
+COMMENTS_DEFAULT_LIMIT = 20
+COMMENTS_MAX_LIMIT = 100
+
+def comment_index(comments):
+    """In-memory comment thread for one post, ordered like the feed"""
+    index = FeedIndex()
+    index.rebuild(comments)
+    return index
+
+# Firestore feed pages; exact for this worker's writes, TTL-bounded for other workers'
+feed_cache = FeedPageCache(
+    max_entries=int(os.environ.get("LINEUP_FEED_CACHE_SIZE", 64)),
+    ttl_seconds=float(os.environ.get("LINEUP_FEED_CACHE_TTL", 15)),
+)
 
 # ========================================
 # FIREBASE/FIRESTORE DATABASE FUNCTIONS
@@ -456,16 +637,70 @@ def db_query(collection_name, field, operator, value):
         logger.error(f"Error querying {collection_name}: {str(e)}")
         return []
 
+def db_get_page(collection_name, order_field, limit, start_after=None):
+    """Documents ordered by (order_field, document id) descending, limited, starting after a (value, id) cursor"""
+    if not db:
+        return None
+    try:
+        query = paged_query(get_collection(collection_name), order_field, start_after)
+        docs = query.limit(limit).stream()
+        return [{**doc.to_dict(), 'id': doc.id} for doc in docs]
+    except Exception as e:
+        logger.error(f"Error paging {collection_name}: {str(e)}")
+        return None
+
+def paged_query(collection, order_field, start_after=None):
+    """Descending order on order_field with the document id as tie-break, so documents sharing a
+    value are neither skipped nor repeated across pages; start_after is a (value, document id) pair"""
+    query = collection.order_by(order_field, direction=firestore.Query.DESCENDING).order_by(
+        '__name__', direction=firestore.Query.DESCENDING)  # '__name__' is the document id
+    if start_after is not None:
+        query = query.start_after(list(start_after))
+    return query
+
+def get_subcollection(collection_name, doc_id, subcollection_name):
+    """Get a Firestore subcollection (e.g. post_comments/<post_id>/comments) or None"""
+    if db:
+        return db.collection(collection_name).document(doc_id).collection(subcollection_name)
+    return None
+
+def db_add_subdoc(collection_name, doc_id, subcollection_name, data, sub_doc_id=None):
+    """Add a document to a subcollection; a single write however large the subcollection is"""
+    if not db:
+        return None
+    try:
+        subcollection = get_subcollection(collection_name, doc_id, subcollection_name)
+        if sub_doc_id:
+            subcollection.document(sub_doc_id).set(data)
+            return {**data, 'id': sub_doc_id}
+        doc_ref = subcollection.add(data)[1]
+        return {**data, 'id': doc_ref.id}
+    except Exception as e:
+        logger.error(f"Error adding doc to {collection_name}/{doc_id}/{subcollection_name}: {str(e)}")
+        return None
+
+def db_get_subpage(collection_name, doc_id, subcollection_name, order_field, limit, start_after=None):
+    """Subcollection documents ordered by (order_field, document id) descending, limited, starting after a (value, id) cursor"""
+    if not db:
+        return None
+    try:
+        query = paged_query(get_subcollection(collection_name, doc_id, subcollection_name), order_field, start_after)
+        docs = query.limit(limit).stream()
+        return [{**doc.to_dict(), 'id': doc.id} for doc in docs]
+    except Exception as e:
+        logger.error(f"Error paging {collection_name}/{doc_id}/{subcollection_name}: {str(e)}")
+        return None
+
 # ========================================
 # END DATABASE FUNCTIONS
 # ========================================
 
 # Initialize with mock data
 def initialize_mock_data():
-    global social_posts, barber_portfolios, appointments, barber_profiles, barber_reviews, post_comments, user_follows, hair_trends
+    global barber_portfolios, barber_profiles, barber_reviews, post_comments, hair_trends
     
     # Mock social posts with hashtags and engagement metrics
-    social_posts = [
+    social_posts.reset([
         {
             "id": "1",
             "username": "mike_style",
@@ -494,7 +729,11 @@ def initialize_mock_data():
             "timestamp": (datetime.now() - timedelta(hours=4)).isoformat(),
             "hashtags": ["bob", "hairstyle", "freshcut"]
         }
-    ]
+    ])
+    feed_index.rebuild(social_posts)
+    trending_hashtags.reset()
+    for post in social_posts:
+        trending_hashtags.add(post.get("hashtags", []), at=datetime.fromisoformat(post["timestamp"]).timestamp())
     
     # Mock reviews for barbers
     barber_reviews = {
@@ -510,20 +749,23 @@ def initialize_mock_data():
     
     # Mock comments on posts
     post_comments = {
-        "1": [
-            {"id": "c1", "username": "alex_taylor", "text": "Looking sharp! 🔥", "timeAgo": "1h"},
-            {"id": "c2", "username": "john_doe", "text": "What's the fade number?", "timeAgo": "30m"}
-        ],
-        "2": [
-            {"id": "c3", "username": "mike_style", "text": "Beautiful cut!", "timeAgo": "3h"}
-        ]
+        "1": comment_index([
+            {"id": "c1", "username": "alex_taylor", "text": "Looking sharp! 🔥", "timeAgo": "1h",
+             "timestamp": (datetime.now() - timedelta(hours=1)).isoformat()},
+            {"id": "c2", "username": "john_doe", "text": "What's the fade number?", "timeAgo": "30m",
+             "timestamp": (datetime.now() - timedelta(minutes=30)).isoformat()}
+        ]),
+        "2": comment_index([
+            {"id": "c3", "username": "mike_style", "text": "Beautiful cut!", "timeAgo": "3h",
+             "timestamp": (datetime.now() - timedelta(hours=3)).isoformat()}
+        ])
     }
     
-    # Mock follow relationships
-    user_follows = {
+    # Mock follow relationships (timelines are rebuilt from the mock posts)
+    follow_graph.reset({
         "current_user": ["mike_style", "sarah_hair"],
         "mike_style": ["sarah_hair", "jason_cuts"]
-    }
+    }, posts=social_posts)
     
     # Mock hair trends/insights
     hair_trends = {
@@ -549,7 +791,7 @@ def initialize_mock_data():
     }
     
     # Mock appointments
-    appointments = [
+    appointments.reset([
         {
             "id": str(uuid.uuid4()),
             "clientName": "Alex Johnson",
@@ -564,7 +806,7 @@ def initialize_mock_data():
             "notes": "Looking for a modern fade",
             "timestamp": datetime.now().isoformat()
         }
-    ]
+    ])
 
 initialize_mock_data()
 
@@ -658,11 +900,38 @@ def getMockBarbersForLocation(location):
     ]
     return base_barbers
 
+def get_default_availability(barber_id):
+    """Availability used until a barber saves their own"""
+    return {
+        "barberId": barber_id,
+        "workingHours": {
+            "monday": {"enabled": True, "start": "09:00", "end": "18:00"},
+            "tuesday": {"enabled": True, "start": "09:00", "end": "18:00"},
+            "wednesday": {"enabled": True, "start": "09:00", "end": "18:00"},
+            "thursday": {"enabled": True, "start": "09:00", "end": "18:00"},
+            "friday": {"enabled": True, "start": "09:00", "end": "18:00"},
+            "saturday": {"enabled": True, "start": "09:00", "end": "17:00"},
+            "sunday": {"enabled": False, "start": "09:00", "end": "17:00"}
+        },
+        "breakTimes": [],
+        "blockedDates": [],
+        "serviceDuration": 30,  # Default 30 minutes
+        "bufferTime": 15,  # 15 minutes between appointments
+        "timezone": "America/New_York"
+    }
+
+# Services listed until a barber adds their own
+DEFAULT_SERVICES = [
+    {"id": "1", "name": "Haircut", "price": 30, "duration": 30, "category": "Hair"},
+    {"id": "2", "name": "Beard Trim", "price": 15, "duration": 15, "category": "Beard"},
+    {"id": "3", "name": "Haircut + Beard", "price": 40, "duration": 45, "category": "Package"}
+]
+
 # Root endpoint
 @app.route('/')
 @limiter.limit("100 per minute")
 def index():
-    return jsonify({
+    return cached_json_response("index", lambda: {
         "service": "LineUp AI Backend",
         "status": "running",
         "version": "2.0",
@@ -785,6 +1054,20 @@ def get_metrics():
     
     all_metrics["summary"] = summary
     all_metrics["cache_summary"] = cache_summary
+    all_metrics["analysis_cache"] = analysis_cache.stats()
+    all_metrics["moderation_cache"] = moderation_cache.stats()
+    all_metrics["style_resolver"] = style_resolver.stats()
+    all_metrics["response_cache"] = response_cache.stats()
+    all_metrics["tryon_cache"] = tryon_cache.stats()
+    all_metrics["feed_cache"] = feed_cache.stats()
+    all_metrics["blob_store"] = blob_store.stats()
+    all_metrics["social_counters"] = social_counters.stats()
+    all_metrics["trending_hashtags"] = trending_hashtags.stats()
+    all_metrics["follow_graph"] = follow_graph.stats()
+    all_metrics["post_pipeline"] = post_pipeline.stats()
+    all_metrics["conditional_get"] = conditional_get.stats()
+    all_metrics["compression"] = response_compressor.stats()
+    all_metrics["tryon_user_slots"] = tryon_user_slots.stats()
     
     response = make_response(jsonify(all_metrics), 200)
     response.headers['Access-Control-Allow-Origin'] = '*'
@@ -802,6 +1085,7 @@ def health():
         "timestamp": datetime.now().isoformat(),
         "cors_enabled": True,
         "gemini_configured": model is not None,
+        "gemini_circuit": model.breaker.snapshot() if model else None,
         "places_api_configured": bool(os.environ.get("GOOGLE_PLACES_API_KEY")),
         "cache_size": len(places_api_cache),
         "frontend_url": "https://lineupai.onrender.com",
@@ -829,7 +1113,9 @@ def get_config():
         return response, 200
     
     # SECURITY: Only expose capability flags, NEVER expose actual API keys
-    response = make_response(jsonify({
+    places_remaining = max(0, 100 - api_usage_tracker['places_api_calls'])
+    gemini_remaining = max(0, 50 - api_usage_tracker['gemini_api_calls'])
+    return cached_json_response(("config", places_remaining, gemini_remaining), lambda: {
         "hasPlacesApi": bool(os.environ.get("GOOGLE_PLACES_API_KEY")),
         "hasGeminiApi": model is not None,
         "hasCloudinary": cloudinary_config is not None,
@@ -838,133 +1124,107 @@ def get_config():
         "features": {
             "aiAnalysis": model is not None,
             "barberSearch": bool(os.environ.get("GOOGLE_PLACES_API_KEY")),
-            "virtualTryOn": bool(os.environ.get("REPLICATE_API_TOKEN")),
+            "virtualTryOn": replicate_client is not None,
             "imageStorage": cloudinary_config is not None or storage_bucket is not None,
             "contentModeration": model is not None
         },
         "rateLimits": {
-            "places_api_remaining": max(0, 100 - api_usage_tracker['places_api_calls']),
-            "gemini_api_remaining": max(0, 50 - api_usage_tracker['gemini_api_calls'])
+            "places_api_remaining": places_remaining,
+            "gemini_api_remaining": gemini_remaining
         }
-    }), 200)
-    response.headers['Access-Control-Allow-Origin'] = '*'
-    return response
+    })
 
 # Main analyze endpoint with rate limiting
+def extract_analyze_image(data):
+    """Pull the base64 photo out of an /analyze request body (Gemini-style payload)"""
+    try:
+        payload = data.get("payload", {})
+        contents = payload.get("contents", [{}])[0]
+        parts = contents.get("parts", [])
+        
+        if len(parts) < 2:
+            raise ValueError("No image data provided")
+        
+        image_data = parts[1].get("inlineData", {})
+        base64_image = image_data.get("data", "")
+        
+        if not base64_image:
+            raise ValueError("Empty image data")
+        
+    except (KeyError, IndexError) as e:
+        raise ValueError(f"Invalid request format: {str(e)}")
+    return base64_image
+
 @app.route('/analyze', methods=['POST', 'OPTIONS'])
 @limiter.limit("10 per hour")  # Strict limit for AI analysis
 def analyze():
     if request.method == 'OPTIONS':
         response = make_response('')
         response.headers.add('Access-Control-Allow-Origin', '*')
-        response.headers.add('Access-Control-Allow-Headers', 'Content-Type')
+        response.headers.add('Access-Control-Allow-Headers', f'Content-Type, {ANALYSIS_CACHE_BYPASS_HEADER}')
         response.headers.add('Access-Control-Allow-Methods', 'POST, OPTIONS')
         return response, 200
     
     logger.info("ANALYZE endpoint called")
     
-    # Check if we can make Gemini API call
-    if not can_make_gemini_api_call():
-        logger.warning("Gemini API daily limit reached, using mock data")
-        response = make_response(jsonify(get_mock_data()), 200)
-        response.headers['Content-Type'] = 'application/json'
-        response.headers['Access-Control-Allow-Origin'] = '*'
-        return response
-    
     try:
         data = request.get_json(force=True)
         
         if not model:
             logger.info("Using mock data (Gemini not configured)")
-            response = make_response(jsonify(get_mock_data()), 200)
-            response.headers['Content-Type'] = 'application/json'
-            response.headers['Access-Control-Allow-Origin'] = '*'
-            return response
+            return cached_json_response("mock_analysis", get_mock_data)
+        
+        # Decode once, orient and downscale to what Gemini needs
+        ingested = ingest_base64_image(extract_analyze_image(data), max_edge=ANALYSIS_MAX_EDGE)
+        
+        # Serve re-submitted / near-identical photos from the perceptual-hash cache
+        use_cache = request.headers.get(ANALYSIS_CACHE_BYPASS_HEADER, '').lower() != 'bypass'
+        if use_cache:
+            lookup_start = time.time()
+            cached = analysis_cache.get(ingested.phash)
+            if cached:
+                cached_data, distance = cached
+                metrics.record_cache_hit("analysis_phash", response_time_ms=(time.time() - lookup_start) * 1000)
+                logger.info(f"Returning cached analysis (hamming distance {distance})")
+                response = make_response(jsonify({**cached_data, "cached": True}), 200)
+                response.headers['Content-Type'] = 'application/json'
+                response.headers['Access-Control-Allow-Origin'] = '*'
+                return response
+            metrics.record_cache_miss("analysis_phash")
         
-        # Extract image data from request
-        try:
-            payload = data.get("payload", {})
-            contents = payload.get("contents", [{}])[0]
-            parts = contents.get("parts", [])
-            
-            if len(parts) < 2:
-                raise ValueError("No image data provided")
-            
-            image_data = parts[1].get("inlineData", {})
-            base64_image = image_data.get("data", "")
-            
-            if not base64_image:
-                raise ValueError("Empty image data")
-            
-        except (KeyError, IndexError) as e:
-            raise ValueError(f"Invalid request format: {str(e)}")
+        # Check if we can make Gemini API call
+        if not can_make_gemini_api_call():
+            logger.warning("Gemini API daily limit reached, using mock data")
+            return cached_json_response("mock_analysis", get_mock_data)
         
-        # Decode base64 image
-        try:
-            image_bytes = base64.b64decode(base64_image)
-            image = Image.open(BytesIO(image_bytes))
-        except Exception as e:
-            raise ValueError(f"Invalid image data: {str(e)}")
+        # Fail fast (without charging quota) while Gemini is known to be down
+        if not model.is_available():
+            logger.warning("Gemini circuit open, using mock data")
+            return cached_json_response("mock_analysis", get_mock_data)
         
-        # Create Gemini prompt
-        prompt = """You are an expert hairstylist and facial analysis AI. Analyze this person's face and hair in the photo and provide personalized haircut recommendations.
-
-IMPORTANT: Return ONLY a valid JSON response with NO additional text, NO markdown formatting, NO code blocks.
-
-Return this EXACT JSON structure:
-{
-    "analysis": {
-        "faceShape": "[one of: oval, round, square, heart, oblong, diamond, triangle]",
-        "hairTexture": "[one of: straight, wavy, curly, coily, kinky]",
-        "hairColor": "[one of: black, dark-brown, brown, light-brown, blonde, red, gray, white, other]",
-        "estimatedGender": "[one of: male, female, non-binary]",
-        "estimatedAge": "[one of: under-20, 20-25, 25-30, 30-35, 35-40, 40-45, 45-50, 50-55, 55-60, over-60]"
-    },
-    "recommendations": [
-        {
-            "styleName": "[Specific haircut name]",
-            "description": "[2-3 sentence description of the haircut style and how it's achieved]",
-            "reason": "[1-2 sentences explaining why this works for their specific face shape, hair texture, and features]"
-        }
-    ]
-}
-
-Provide exactly 6 haircut recommendations that would work best for this person's features."""
-
         # Call Gemini API
         try:
             increment_gemini_api_usage()  # Track API usage
-            response = model.generate_content([prompt, image])
-            response_text = response.text.strip()
+            gemini_start = time.time()
+            response = model.generate_content(
+                [structured_prompt("analysis"), ingested.gemini_part(ANALYSIS_MAX_EDGE)],
+                generation_config=structured_generation_config("analysis"),
+            )
+            response_text = response.text
+            metrics.record_api_call_time("analysis_phash", (time.time() - gemini_start) * 1000)
             
         except Exception as e:
             logger.error(f"Gemini API error: {str(e)}")
-            response = make_response(jsonify(get_mock_data()), 200)
-            response.headers['Content-Type'] = 'application/json'
-            response.headers['Access-Control-Allow-Origin'] = '*'
-            return response
-        
-        # Clean and parse response
-        if "```json" in response_text:
-            start = response_text.find("```json") + 7
-            end = response_text.rfind("```")
-            if end > start:
-                response_text = response_text[start:end].strip()
+            return cached_json_response("mock_analysis", get_mock_data)
         
+        # One strict parser validates the reply against the analysis schema
         try:
-            analysis_data = json.loads(response_text)
-        except json.JSONDecodeError:
-            response = make_response(jsonify(get_mock_data()), 200)
-            response.headers['Content-Type'] = 'application/json'
-            response.headers['Access-Control-Allow-Origin'] = '*'
-            return response
+            analysis_data = parse_structured_response(response_text, "analysis")
+        except ValidationError as e:
+            logger.error(f"Invalid Gemini analysis response: {e.errors}")
+            return cached_json_response("mock_analysis", get_mock_data)
         
-        # Validate and return response
-        if "analysis" not in analysis_data or "recommendations" not in analysis_data:
-            response = make_response(jsonify(get_mock_data()), 200)
-            response.headers['Content-Type'] = 'application/json'
-            response.headers['Access-Control-Allow-Origin'] = '*'
-            return response
+        analysis_cache.set(ingested.phash, analysis_data)
         
         response = make_response(jsonify(analysis_data), 200)
         response.headers['Content-Type'] = 'application/json'
@@ -973,10 +1233,236 @@ Provide exactly 6 haircut recommendations that would work best for this person's
         
     except Exception as e:
         logger.error(f"Error in analyze endpoint: {str(e)}")
-        response = make_response(jsonify(get_mock_data()), 200)
-        response.headers['Content-Type'] = 'application/json'
-        response.headers['Access-Control-Allow-Origin'] = '*'
-        return response
+        return cached_json_response("mock_analysis", get_mock_data)
+
+def sse_event(event, data):
+    """Format one server-sent event"""
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+def sse_response(events):
+    """Streaming text/event-stream response for a generator of sse_event() strings"""
+    response = Response(stream_with_context(events), mimetype='text/event-stream')
+    response.headers['Cache-Control'] = 'no-cache'
+    response.headers['X-Accel-Buffering'] = 'no'  # Don't let proxies buffer the stream
+    response.headers['Access-Control-Allow-Origin'] = '*'
+    return response
+
+def complete_analysis_events(analysis_data):
+    """SSE sequence for an analysis that is already complete (cache hits, mock data)"""
+    yield sse_event("analysis", analysis_data["analysis"])
+    for index, recommendation in enumerate(analysis_data["recommendations"]):
+        yield sse_event("recommendation", {"index": index, **recommendation})
+    yield sse_event("result", analysis_data)
+
+def fallback_analysis_events(partial_sent):
+    """Mock result after a failed Gemini stream; a "reset" first tells the client to drop partial events"""
+    if partial_sent:
+        yield sse_event("reset", {"reason": "AI analysis failed mid-stream, showing default recommendations"})
+    yield sse_event("result", get_mock_data())
+
+def streamed_analysis_events(ingested):
+    """SSE sequence that forwards each part of the Gemini reply as soon as it validates"""
+    parser = StreamingResponseParser("analysis")
+    recommendation_count = 0
+    partial_sent = False
+    try:
+        increment_gemini_api_usage()  # Track API usage
+        gemini_start = time.time()
+        response = model.generate_content(
+            [structured_prompt("analysis"), ingested.gemini_part(ANALYSIS_MAX_EDGE)],
+            generation_config=structured_generation_config("analysis"),
+            stream=True,
+        )
+        for chunk in response:
+            for field, value in parser.feed(chunk.text):
+                if field == "analysis":
+                    logger.info(f"Streaming analysis block after {(time.time() - gemini_start) * 1000:.0f}ms")
+                    partial_sent = True
+                    yield sse_event("analysis", value)
+                elif field == "recommendations":
+                    partial_sent = True
+                    yield sse_event("recommendation", {"index": recommendation_count, **value})
+                    recommendation_count += 1
+        analysis_data = parser.result()
+        metrics.record_api_call_time("analysis_phash", (time.time() - gemini_start) * 1000)
+    except ValidationError as e:
+        logger.error(f"Invalid Gemini analysis response: {e.errors}")
+        yield from fallback_analysis_events(partial_sent)
+        return
+    except Exception as e:
+        logger.error(f"Gemini streaming error: {str(e)}")
+        yield from fallback_analysis_events(partial_sent)
+        return
+    
+    analysis_cache.set(ingested.phash, analysis_data)
+    yield sse_event("result", analysis_data)
+
+@app.route('/analyze/stream', methods=['POST', 'OPTIONS'])
+@limiter.limit("10 per hour")  # Same budget as /analyze
+def analyze_stream():
+    """
+    Progressive /analyze over server-sent events:
+    "analysis" (face/hair block) -> "recommendation" (one per style) -> "result" (full validated payload).
+    If Gemini fails after partial events were sent, a "reset" event precedes the fallback "result".
+    """
+    if request.method == 'OPTIONS':
+        response = make_response('')
+        response.headers.add('Access-Control-Allow-Origin', '*')
+        response.headers.add('Access-Control-Allow-Headers', f'Content-Type, {ANALYSIS_CACHE_BYPASS_HEADER}')
+        response.headers.add('Access-Control-Allow-Methods', 'POST, OPTIONS')
+        return response, 200
+    
+    logger.info("ANALYZE STREAM endpoint called")
+    
+    try:
+        data = request.get_json(force=True)
+        
+        if not model:
+            logger.info("Using mock data (Gemini not configured)")
+            return sse_response(complete_analysis_events(get_mock_data()))
+        
+        ingested = ingest_base64_image(extract_analyze_image(data), max_edge=ANALYSIS_MAX_EDGE)
+        
+        if request.headers.get(ANALYSIS_CACHE_BYPASS_HEADER, '').lower() != 'bypass':
+            lookup_start = time.time()
+            cached = analysis_cache.get(ingested.phash)
+            if cached:
+                cached_data, distance = cached
+                metrics.record_cache_hit("analysis_phash", response_time_ms=(time.time() - lookup_start) * 1000)
+                logger.info(f"Streaming cached analysis (hamming distance {distance})")
+                return sse_response(complete_analysis_events({**cached_data, "cached": True}))
+            metrics.record_cache_miss("analysis_phash")
+        
+        if not can_make_gemini_api_call() or not model.is_available():
+            logger.warning("Gemini unavailable or daily limit reached, using mock data")
+            return sse_response(complete_analysis_events(get_mock_data()))
+        
+        return sse_response(streamed_analysis_events(ingested))
+        
+    except Exception as e:
+        logger.error(f"Error in analyze stream endpoint: {str(e)}")
+        return sse_response(complete_analysis_events(get_mock_data()))
+
+def publish_social_post(post):
+    """Persist a moderated post (Firestore when available) and add it to the in-memory feed"""
+    if db:
+        db_add_doc('social_posts', {k: v for k, v in post.items() if k != 'id'}, doc_id=post['id'])
+        feed_cache.invalidate()
+    social_posts.insert(0, post)
+    feed_index.add(post)
+    trending_hashtags.add(post.get("hashtags", []))
+    follow_graph.publish(post)
+    conditional_get.bump("social")  # also called from the background post pipeline, outside any request
+    return post
+
+def flush_social_counters(increments, sets):
+    """
+    Apply aggregated like/share/comment changes as atomic increments, in batched writes
+    Returns the post ids that are done (written, or dropped because the post no longer exists);
+    social_counters re-queues the rest, so a committed chunk is never incremented twice
+    """
+    done, updates = set(), []
+    for post_id in set(increments) | set(sets):
+        fields = {field: firestore.Increment(delta) for field, delta in increments.get(post_id, {}).items() if delta}
+        fields.update(sets.get(post_id, {}))
+        if fields:
+            updates.append((post_id, fields))
+        else:
+            done.add(post_id)
+    
+    for start in range(0, len(updates), 500):  # Firestore batch limit
+        chunk = updates[start:start + 500]
+        batch = db.batch()
+        for post_id, fields in chunk:
+            batch.update(get_collection('social_posts').document(post_id), fields)
+        try:
+            batch.commit()
+            done.update(post_id for post_id, _ in chunk)
+            continue
+        except Exception as e:
+            if not (FirestoreNotFound and isinstance(e, FirestoreNotFound)):
+                logger.error(f"Counter batch of {len(chunk)} posts failed, retrying next flush: {str(e)}")
+                continue
+        
+        # A batch fails as a whole: write this chunk post by post so one deleted post can't block the rest
+        for post_id, fields in chunk:
+            try:
+                get_collection('social_posts').document(post_id).update(fields)
+                done.add(post_id)
+            except Exception as e:
+                if FirestoreNotFound and isinstance(e, FirestoreNotFound):
+                    logger.warning(f"Dropping counter changes for missing post {post_id}")
+                    done.add(post_id)
+                else:
+                    logger.error(f"Counter update for post {post_id} failed, retrying next flush: {str(e)}")
+    return done
+
+# Likes/shares/comment counts are applied locally and flushed to Firestore every few hundred ms
+social_counters = CounterAggregator(
+    flush=flush_social_counters,
+    interval=float(os.environ.get("LINEUP_COUNTER_FLUSH_INTERVAL", 0.25)),
+    max_events=int(os.environ.get("LINEUP_COUNTER_FLUSH_EVENTS", 100)),
+)
+atexit.register(social_counters.flush_now)
+
+def get_social_post(post_id):
+    """(post, from_db): Firestore state merged with unflushed counters, else the in-memory post"""
+    if db:
+        post = social_counters.view(post_id, lambda: db_get_doc('social_posts', post_id))
+        if post:
+            return post, True
+    return social_posts.get(post_id), False
+
+def update_social_post(post_id, increments=None, sets=None):
+    """Queue counter/flag changes for Firestore and patch cached feed pages holding the post"""
+    post = social_counters.apply(post_id, increments=increments, sets=sets)
+    feed_cache.patch(post_id, {field: post.get(field) for field in {**(increments or {}), **(sets or {})}})
+    return post
+
+# Posts whose comment thread this worker has already checked for the legacy array layout
+migrated_comment_threads = set()
+
+def migrate_legacy_comments(post_id):
+    """
+    Move a post's comments out of the old single-document array (post_comments/<post_id>.comments)
+    into its comments subcollection. One-off per post; returns the number of comments moved
+    """
+    if post_id in migrated_comment_threads:
+        return 0
+    legacy = db_get_doc('post_comments', post_id)
+    comments = legacy.get('comments') if legacy else None
+    if not isinstance(comments, list) or not comments:
+        migrated_comment_threads.add(post_id)
+        return 0
+    
+    subcollection = get_subcollection('post_comments', post_id, 'comments')
+    parent = get_collection('post_comments').document(post_id)
+    batch, writes = db.batch(), 0
+    for position, comment in enumerate(comments):
+        # Array order was insertion order; keep it for entries written before comments had timestamps
+        comment = {**comment, "timestamp": comment.get("timestamp") or f"0000-{position:06d}"}
+        batch.set(subcollection.document(str(comment.get("id") or uuid.uuid4())), comment)
+        writes += 1
+        if writes == 499:
+            batch.commit()
+            batch, writes = db.batch(), 0
+    batch.update(parent, {"comments": firestore.DELETE_FIELD})
+    batch.commit()
+    migrated_comment_threads.add(post_id)
+    logger.info(f"Migrated {len(comments)} comments on post {post_id} to a subcollection")
+    return len(comments)
+
+# Background moderation + upload for posts submitted with "Prefer: respond-async"
+post_pipeline = PostPipeline(
+    moderate=moderate_image_content,
+    upload=upload_image_to_storage,
+    delete_upload=delete_image_from_storage,
+    publish=publish_social_post,
+    max_workers=int(os.environ.get("LINEUP_POST_WORKERS", 4)),
+)
+
+# Synchronous posts: start the storage upload alongside moderation (deleted again if rejected)
+SPECULATIVE_POST_UPLOAD = os.environ.get("LINEUP_SPECULATIVE_UPLOAD", "1") != "0"
 
 # Social feed endpoints with rate limiting
 @app.route('/social', methods=['GET', 'POST', 'OPTIONS'])
@@ -992,15 +1478,41 @@ def social():
         # Lighter rate limit for GET requests
         limiter.limit("100 per hour")(lambda: None)()
         
-        # Try to get from database, fallback to in-memory
+        # One page per request: ?limit=<n>&before=<nextCursor from the previous page>
+        try:
+            limit = min(max(int(request.args.get('limit', FEED_DEFAULT_LIMIT)), 1), FEED_MAX_LIMIT)
+            before = decode_cursor(request.args['before']) if request.args.get('before') else None
+        except ValueError as e:
+            response = make_response(jsonify({"error": f"Invalid pagination parameters: {str(e)}"}), 400)
+            response.headers['Access-Control-Allow-Origin'] = '*'
+            return response
+        
+        # Firestore: ordered, limited query (one extra doc tells us whether there is a next page)
+        posts = None
         if db:
-            posts = db_get_all('social_posts') or []
-        else:
-            posts = social_posts
+            cache_start = time.time()
+            cache_key = (limit, request.args.get('before') or None)
+            cached_page = feed_cache.get(cache_key)
+            if cached_page:
+                posts, next_cursor = cached_page
+                metrics.record_cache_hit("social_feed", response_time_ms=(time.time() - cache_start) * 1000)
+            else:
+                metrics.record_cache_miss("social_feed")
+                page = db_get_page('social_posts', 'timestamp', limit + 1, start_after=before)
+                if page is not None:
+                    posts = page[:limit]
+                    next_cursor = encode_cursor(posts[-1]['timestamp'], posts[-1]['id']) if len(page) > limit else None
+                    feed_cache.put(cache_key, posts, next_cursor, documents_read=len(page))
         
-        # Return social posts sorted by timestamp
-        sorted_posts = sorted(posts, key=lambda x: x['timestamp'], reverse=True)
-        response = make_response(jsonify({"posts": sorted_posts}), 200)
+        # In-memory: slice of the pre-sorted index, no per-request sort
+        if posts is None:
+            posts, next_cursor = feed_index.page(limit, before)
+        
+        response = make_response(jsonify({
+            "posts": posts,
+            "nextCursor": next_cursor,
+            "hasMore": next_cursor is not None
+        }), 200)
         response.headers['Access-Control-Allow-Origin'] = '*'
         return response
     
@@ -1020,41 +1532,50 @@ def social():
                 response.headers['Access-Control-Allow-Origin'] = '*'
                 return response
             
-            # Decode base64 image
+            # Decode once, enforce size budgets, orient and downscale
             try:
-                # Remove data URL prefix if present
-                if ',' in image_base64:
-                    image_base64 = image_base64.split(',')[1]
-                
-                image_bytes = base64.b64decode(image_base64)
-                
-                # Validate image
-                try:
-                    img = Image.open(BytesIO(image_bytes))
-                    img.verify()
-                except Exception as e:
-                    logger.error(f"Invalid image format: {str(e)}")
-                    response = make_response(jsonify({
-                        "success": False,
-                        "error": "Invalid image format. Please upload a valid image."
-                    }), 400)
-                    response.headers['Access-Control-Allow-Origin'] = '*'
-                    return response
-                
-                # Re-open image after verification (verify() closes it)
-                image_bytes = base64.b64decode(image_base64.split(',')[-1] if ',' in image_base64 else image_base64)
-                
-            except Exception as e:
-                logger.error(f"Error decoding image: {str(e)}")
+                ingested = ingest_base64_image(image_base64, max_edge=STORAGE_MAX_EDGE)
+            except ImageIngestError as e:
+                logger.error(f"Invalid image format: {str(e)}")
                 response = make_response(jsonify({
                     "success": False,
-                    "error": "Failed to process image. Please try again."
+                    "error": "Invalid image format. Please upload a valid image."
                 }), 400)
                 response.headers['Access-Control-Allow-Origin'] = '*'
                 return response
             
-            # Content moderation - check for explicit and non-hair-related content
-            is_approved, rejection_reason = moderate_image_content(image_bytes)
+            # Async mode: accept as pending with a local thumbnail, moderate + upload in the background
+            if data.get("async") or 'respond-async' in request.headers.get('Prefer', ''):
+                pending_post = {
+                    "id": str(uuid.uuid4()),
+                    "username": data.get("username", "anonymous"),
+                    "avatar": data.get("avatar", "https://images.unsplash.com/photo-1535713875002-d1d0cf377fde?w=100&h=100&fit=crop&crop=face"),
+                    "image": ingested.to_base64(THUMBNAIL_MAX_EDGE, quality=70),
+                    "caption": data.get("caption", ""),
+                    "likes": 0,
+                    "timeAgo": "now",
+                    "liked": False,
+                    "timestamp": datetime.now().isoformat(),
+                    "shares": 0,
+                    "comments": 0,
+                    "hashtags": data.get("hashtags", []),
+                    "status": "pending"
+                }
+                job = post_pipeline.submit(pending_post, ingested)
+                response = make_response(jsonify({
+                    "success": True,
+                    "status": job["status"],
+                    "post": job["post"],
+                    "statusUrl": f"/social/{pending_post['id']}/status"
+                }), 202)
+                response.headers['Access-Control-Allow-Origin'] = '*'
+                return response
+            
+            # Content moderation (explicit / non-hair-related content) and the storage upload;
+            # in speculative mode they run concurrently and a rejected upload is deleted
+            is_approved, rejection_reason, image_url = post_pipeline.moderate_and_upload(
+                ingested, speculative=SPECULATIVE_POST_UPLOAD
+            )
             
             if not is_approved:
                 response = make_response(jsonify({
@@ -1065,13 +1586,11 @@ def social():
                 response.headers['Access-Control-Allow-Origin'] = '*'
                 return response
             
-            # Upload image to Cloudinary (FREE) or Firebase Storage, or keep base64
-            image_url = upload_image_to_storage(image_bytes)
-            
-            # Use storage URL if available, otherwise use base64
-            final_image = image_url if image_url else image_base64
+            # Use storage URL if available, otherwise the compact re-encoded base64
+            final_image = image_url if image_url else ingested.to_base64(STORAGE_MAX_EDGE)
             
             new_post = {
+                "id": str(uuid.uuid4()),
                 "username": data.get("username", "anonymous"),
                 "avatar": data.get("avatar", "https://images.unsplash.com/photo-1535713875002-d1d0cf377fde?w=100&h=100&fit=crop&crop=face"),
                 "image": final_image,
@@ -1086,13 +1605,8 @@ def social():
                 "stored_in_storage": bool(image_url)  # Track if using storage
             }
             
-            # Try to save to database, fallback to in-memory
-            if db:
-                result = db_add_doc('social_posts', new_post)
-                new_post['id'] = result['id'] if result else str(uuid.uuid4())
-            else:
-                new_post['id'] = str(uuid.uuid4())
-            social_posts.insert(0, new_post)
+            # Same publish path as the background pipeline (database when available, in-memory feed)
+            publish_social_post(new_post)
             
             logger.info(f"Social post created successfully: {new_post['id']}")
             response = make_response(jsonify({"success": True, "post": new_post}), 201)
@@ -1109,6 +1623,54 @@ def social():
             response.headers['Access-Control-Allow-Origin'] = '*'
             return response
 
+# Status of a post submitted in async mode (poll, or long-poll with ?wait=<seconds>)
+@app.route('/social/<post_id>/status', methods=['GET', 'OPTIONS'])
+@limiter.limit("600 per hour")
+def social_post_status(post_id):
+    if request.method == 'OPTIONS':
+        response = make_response('')
+        response.headers.add('Access-Control-Allow-Origin', '*')
+        response.headers.add('Access-Control-Allow-Methods', 'GET, OPTIONS')
+        return response, 200
+    
+    try:
+        wait_seconds = min(max(float(request.args.get('wait', 0)), 0), 25)
+    except ValueError:
+        wait_seconds = 0
+    
+    job = post_pipeline.wait(post_id, wait_seconds) if wait_seconds else post_pipeline.get(post_id)
+    if not job:
+        response = make_response(jsonify({"error": "Post not found"}), 404)
+        response.headers['Access-Control-Allow-Origin'] = '*'
+        return response
+    
+    response = make_response(jsonify({"success": job["status"] != "failed", **job}), 200)
+    response.headers['Access-Control-Allow-Origin'] = '*'
+    return response
+
+# Locally stored post/portfolio image; content-addressed, so it never changes (supports Range requests)
+@app.route('/media/<digest>', methods=['GET', 'OPTIONS'])
+@limiter.limit("3000 per hour")
+def media(digest):
+    if request.method == 'OPTIONS':
+        response = make_response('')
+        response.headers.add('Access-Control-Allow-Origin', '*')
+        response.headers.add('Access-Control-Allow-Methods', 'GET, OPTIONS')
+        return response, 200
+    
+    path = blob_store.locate(digest)
+    if not path:
+        response = make_response(jsonify({"error": "Media not found"}), 404)
+        response.headers['Access-Control-Allow-Origin'] = '*'
+        return response
+    
+    with open(path, 'rb') as f:
+        mimetype = image_mime_type(f.read(12))
+    response = send_file(path, mimetype=mimetype, conditional=True, etag=digest, max_age=31536000)
+    response.headers['Cache-Control'] = "public, max-age=31536000, immutable"
+    response.headers['Access-Control-Allow-Origin'] = '*'
+    return response
+
 # Like/unlike post with rate limiting
 @app.route('/social/<post_id>/like', methods=['POST', 'OPTIONS'])
 @limiter.limit("60 per hour")  # Allow frequent likes but prevent spam
@@ -1121,16 +1683,8 @@ def toggle_like(post_id):
         return response, 200
     
     try:
-        # Try to get post from database first, then fallback to in-memory
-        post = None
-        if db:
-            post_doc = db_get_doc('social_posts', post_id)
-            if post_doc:
-                post = post_doc
-        
-        # Fallback to in-memory if not in database
-        if not post:
-            post = next((p for p in social_posts if str(p.get("id")) == str(post_id)), None)
+        # Database first (only the first tap in a while reads Firestore), then in-memory
+        post, from_db = get_social_post(post_id)
         
         if not post:
             response = make_response(jsonify({"error": "Post not found"}), 404)
@@ -1141,18 +1695,14 @@ def toggle_like(post_id):
         current_liked = post.get("liked", False)
         new_liked = not current_liked
         current_likes = post.get("likes", 0)
-        new_likes = current_likes + (1 if new_liked else -1)
-        
-        # Update post
-        post["liked"] = new_liked
-        post["likes"] = max(0, new_likes)  # Ensure likes don't go negative
+        new_likes = max(0, current_likes + (1 if new_liked else -1))  # Ensure likes don't go negative
         
-        # Save to database if using database
-        if db:
-            db_update_doc('social_posts', post_id, {
-                "liked": new_liked,
-                "likes": post["likes"]
-            })
+        # Write-behind increment when using the database, otherwise update the post directly
+        if from_db:
+            post = update_social_post(post_id, increments={"likes": new_likes - current_likes}, sets={"liked": new_liked})
+        else:
+            post["liked"] = new_liked
+            post["likes"] = new_likes
         
         response = make_response(jsonify({
             "success": True, 
@@ -1186,9 +1736,9 @@ def handle_appointments():
         user_id = request.args.get('user_id', 'current_user')
         
         if user_type == 'client':
-            user_appointments = [apt for apt in appointments if apt.get('clientId') == user_id]
+            user_appointments = appointments.find('clientId', user_id)
         else:  # barber
-            user_appointments = [apt for apt in appointments if apt.get('barberId') == user_id]
+            user_appointments = appointments.find('barberId', user_id)
         
         response = make_response(jsonify({"appointments": user_appointments}), 200)
         response.headers['Access-Control-Allow-Origin'] = '*'
@@ -1250,7 +1800,7 @@ def update_appointment_status(appointment_id):
         
         # Fallback to in-memory
         if not appointment:
-            appointment = next((apt for apt in appointments if apt.get("id") == appointment_id), None)
+            appointment = appointments.get(appointment_id)
         
         if not appointment:
             response = make_response(jsonify({"error": "Appointment not found"}), 404)
@@ -1298,7 +1848,7 @@ def accept_appointment(appointment_id):
         if db:
             appointment = db_get_doc('appointments', appointment_id)
         if not appointment:
-            appointment = next((apt for apt in appointments if apt.get("id") == appointment_id), None)
+            appointment = appointments.get(appointment_id)
         
         if not appointment:
             response = make_response(jsonify({"error": "Appointment not found"}), 404)
@@ -1341,7 +1891,7 @@ def reject_appointment(appointment_id):
         if db:
             appointment = db_get_doc('appointments', appointment_id)
         if not appointment:
-            appointment = next((apt for apt in appointments if apt.get("id") == appointment_id), None)
+            appointment = appointments.get(appointment_id)
         
         if not appointment:
             response = make_response(jsonify({"error": "Appointment not found"}), 404)
@@ -1393,7 +1943,7 @@ def reschedule_appointment(appointment_id):
         if db:
             appointment = db_get_doc('appointments', appointment_id)
         if not appointment:
-            appointment = next((apt for apt in appointments if apt.get("id") == appointment_id), None)
+            appointment = appointments.get(appointment_id)
         
         if not appointment:
             response = make_response(jsonify({"error": "Appointment not found"}), 404)
@@ -1453,7 +2003,7 @@ def cancel_appointment(appointment_id):
         if db:
             appointment = db_get_doc('appointments', appointment_id)
         if not appointment:
-            appointment = next((apt for apt in appointments if apt.get("id") == appointment_id), None)
+            appointment = appointments.get(appointment_id)
         
         if not appointment:
             response = make_response(jsonify({"error": "Appointment not found"}), 404)
@@ -1500,7 +2050,7 @@ def add_appointment_notes(appointment_id):
         if db:
             appointment = db_get_doc('appointments', appointment_id)
         if not appointment:
-            appointment = next((apt for apt in appointments if apt.get("id") == appointment_id), None)
+            appointment = appointments.get(appointment_id)
         
         if not appointment:
             response = make_response(jsonify({"error": "Appointment not found"}), 404)
@@ -1585,28 +2135,22 @@ def get_barbers():
     
     if not GOOGLE_PLACES_API_KEY:
         logger.warning("Google Places API key not configured, using mock data")
-        mock_barbers = getMockBarbersForLocation(location)
-        response = make_response(jsonify({
-            "barbers": mock_barbers, 
+        return cached_json_response(("mock_barbers", location, "API key not configured"), lambda: {
+            "barbers": getMockBarbersForLocation(location),
             "location": location,
             "mock": True,
             "reason": "API key not configured"
-        }), 200)
-        response.headers['Access-Control-Allow-Origin'] = '*'
-        return response
+        })
     
     # Check if we can make Places API call
     if not can_make_places_api_call():
         logger.warning("Places API daily limit reached, using mock data")
-        mock_barbers = getMockBarbersForLocation(location)
-        response = make_response(jsonify({
-            "barbers": mock_barbers, 
+        return cached_json_response(("mock_barbers", location, "API limit reached"), lambda: {
+            "barbers": getMockBarbersForLocation(location),
             "location": location,
             "mock": True,
             "reason": "API limit reached"
-        }), 200)
-        response.headers['Access-Control-Allow-Origin'] = '*'
-        return response
+        })
     
     try:
         import requests
@@ -1869,10 +2413,21 @@ def portfolio(barber_id=None):
             data = request.get_json()
             barber_id = barber_id or data.get("barberId", "default_barber")
             
+            # Uploaded photos go to storage like post images; existing URLs are kept as-is
+            image = data.get("image", "")
+            if image and not image.startswith(('http://', 'https://', '/media/')):
+                try:
+                    ingested = ingest_base64_image(image, max_edge=STORAGE_MAX_EDGE)
+                except ImageIngestError as e:
+                    response = make_response(jsonify({"error": f"Invalid image data: {str(e)}"}), 400)
+                    response.headers['Access-Control-Allow-Origin'] = '*'
+                    return response
+                image = upload_image_to_storage(ingested.encode(STORAGE_MAX_EDGE)) or f"data:image/jpeg;base64,{ingested.to_base64(STORAGE_MAX_EDGE)}"
+            
             new_work = {
                 "id": str(uuid.uuid4()),
                 "styleName": data.get("styleName", ""),
-                "image": data.get("image", ""),
+                "image": image,
                 "description": data.get("description", ""),
                 "likes": 0,
                 "date": datetime.now().strftime("%Y-%m-%d"),
@@ -1910,7 +2465,7 @@ def handle_subscription_packages():
         
         barber_id = request.args.get('barber_id', None)
         if barber_id:
-            packages = [pkg for pkg in subscription_packages if pkg.get('barberId') == barber_id]
+            packages = subscription_packages.find('barberId', barber_id)
         else:
             packages = subscription_packages
         
@@ -1963,7 +2518,7 @@ def handle_client_subscriptions():
         limiter.limit("100 per hour")(lambda: None)()
         
         client_id = request.args.get('client_id', 'current_user')
-        user_subscriptions = [sub for sub in client_subscriptions if sub.get('clientId') == client_id]
+        user_subscriptions = client_subscriptions.find('clientId', client_id)
         
         response = make_response(jsonify({"subscriptions": user_subscriptions}), 200)
         response.headers['Access-Control-Allow-Origin'] = '*'
@@ -2017,7 +2572,244 @@ def test():
         "features_active": True
     })
 
-# Virtual Try-On endpoint using Replicate (FREE tier available!)
+# Virtual try-on: Replicate (real AI) when configured, otherwise instant preview mode
+REPLICATE_TRYON_MODEL = "flux-kontext-apps/change-haircut"
+REPLICATE_TRYON_VERSION = "48f03523665cabe9a2e832ea9cc2d7c30ad5079cb5f1c1f07890d40596fe1f87"
+TRYON_POLL_INTERVAL = float(os.environ.get("LINEUP_TRYON_POLL_INTERVAL", 1.0))
+TRYON_TIMEOUT = float(os.environ.get("LINEUP_TRYON_TIMEOUT", 180))
+TRYON_MAX_DOWNLOAD_BYTES = int(os.environ.get("LINEUP_TRYON_MAX_DOWNLOAD_BYTES", 25 * 1024 * 1024))
+
+# Replicate returns lossless PNGs; results are transcoded once before they are cached and served
+TRYON_RESULT_FORMAT = os.environ.get("LINEUP_TRYON_RESULT_FORMAT", "WEBP").upper()
+TRYON_RESULT_QUALITY = int(os.environ.get("LINEUP_TRYON_RESULT_QUALITY", 82))
+if TRYON_RESULT_FORMAT == "WEBP" and not features.check("webp"):
+    logger.warning("Pillow was built without WebP support, try-on results will be JPEG")
+    TRYON_RESULT_FORMAT = "JPEG"
+
+# base64: both images inlined in JSON (legacy), url: JSON with a resultUrl, binary: the image itself
+TRYON_RESPONSE_MODES = ("base64", "url", "binary")
+
+TRYON_RESULT_SOURCES = {
+    "replicate": {
+        "message": "✨ Real AI hair transformation complete: {style}",
+        "poweredBy": "Replicate FLUX.1 Kontext (Change-Haircut AI)",
+        "note": "This is a real AI transformation!"
+    },
+    "preview": {
+        "message": "✨ Style preview created: {style}",
+        "poweredBy": "LineUp Preview Mode",
+        "note": "This is a preview mode. Works immediately with no setup!"
+    }
+}
+
+if os.environ.get("LINEUP_FAKE_REPLICATE"):
+    # Local stand-in so the whole job flow can run in tests/dev without a Replicate account
+    replicate_client = FakeReplicate()
+    logger.info("Using fake Replicate client (LINEUP_FAKE_REPLICATE)")
+elif os.environ.get("REPLICATE_API_TOKEN") and replicate:
+    replicate_client = replicate
+else:
+    replicate_client = None
+
+# Replicate predictions run here instead of pinning a gunicorn worker for 10-30s
+tryon_jobs = TryOnJobQueue(
+    max_workers=int(os.environ.get("LINEUP_TRYON_WORKERS", 2)),
+    max_jobs=int(os.environ.get("LINEUP_TRYON_MAX_JOBS", 200)),
+)
+
+# Batch try-on: styles per request, and predictions one user may have running at once
+TRYON_BATCH_MAX_STYLES = int(os.environ.get("LINEUP_TRYON_BATCH_MAX_STYLES", 6))
+tryon_user_slots = UserSlots(limit=int(os.environ.get("LINEUP_TRYON_USER_CONCURRENCY", 2)))
+
+# Generated images keyed by (photo hash, resolved haircut, model version) so repeats skip Replicate
+tryon_cache = TryOnResultCache(
+    max_bytes=int(os.environ.get("LINEUP_TRYON_CACHE_BYTES", 256 * 1024 * 1024)),
+    ttl_seconds=int(os.environ.get("LINEUP_TRYON_CACHE_TTL", 7 * 24 * 3600)),
+)
+
+def cached_tryon_image(ingested, haircut_name):
+    """(cache key, image bytes) of a previously generated try-on, or None"""
+    start = time.time()
+    key = tryon_cache_key(ingested.content_hash, haircut_name, REPLICATE_TRYON_VERSION)
+    image_bytes = tryon_cache.get(key)
+    if image_bytes is None:
+        metrics.record_cache_miss("tryon_result")
+        return None
+    metrics.record_cache_hit("tryon_result", response_time_ms=(time.time() - start) * 1000)
+    logger.info(f"Returning cached try-on for '{haircut_name}'")
+    return key, image_bytes
+
+def tryon_result_data(source, style_description, key, image_bytes, response_mode, original_base64):
+    """Response data for a finished try-on ("replicate" or "preview") in the requested mode"""
+    info = TRYON_RESULT_SOURCES[source]
+    data = {
+        "success": True,
+        "message": info["message"].format(style=style_description),
+        "styleApplied": style_description,
+        "poweredBy": info["poweredBy"],
+        "note": info["note"],
+        "resultType": image_mime_type(image_bytes)
+    }
+    if response_mode != "base64" and tryon_cache.locate(key):
+        # The client already has its photo; the result is fetched (and browser-cached) by URL
+        data["resultUrl"] = f"/virtual-tryon/results/{key}"
+    else:
+        data["originalImage"] = original_base64
+        data["resultImage"] = base64.b64encode(image_bytes).decode('utf-8')
+    return data
+
+def tryon_http_response(source, style_description, key, image_bytes, response_mode, original_base64, cached=False):
+    """Synchronous try-on answer: raw image bytes in binary mode, JSON otherwise"""
+    if response_mode == "binary":
+        response = make_response(image_bytes, 200)
+        response.headers['Content-Type'] = image_mime_type(image_bytes)
+        response.headers['X-Tryon-Source'] = source
+        response.headers['X-Tryon-Cached'] = 'true' if cached else 'false'
+        response.headers['X-Style-Applied'] = quote(style_description)
+        response.headers['Access-Control-Expose-Headers'] = 'X-Tryon-Source, X-Tryon-Cached, X-Style-Applied'
+    else:
+        data = tryon_result_data(source, style_description, key, image_bytes, response_mode, original_base64)
+        if cached:
+            data["cached"] = True
+        response = make_response(jsonify(data), 200)
+    response.headers['Access-Control-Allow-Origin'] = '*'
+    return response
+
+def extract_replicate_output_url(output):
+    """Pull the result URL out of the various output shapes Replicate returns"""
+    if not output:
+        return None
+    if isinstance(output, str):
+        return output
+    if isinstance(output, list):
+        return output[0] if output else None
+    if hasattr(output, '__iter__'):
+        try:
+            output_list = list(output)
+            return output_list[0] if output_list else None
+        except Exception as iter_error:
+            logger.error(f"Error iterating output: {str(iter_error)}")
+            return None
+    return str(output)
+
+def download_tryon_result(result_url):
+    """Fetch the generated image (http(s) or data: URI) as raw bytes, streamed under a size cap"""
+    if result_url.startswith('data:'):
+        return base64.b64decode(result_url.split(',', 1)[1])
+    
+    import requests as req
+    logger.info(f"Downloading result from: {result_url}")
+    buffer = BytesIO()
+    try:
+        # Longer timeout for large images; read in chunks instead of buffering .content
+        with req.get(result_url, timeout=60, stream=True) as result_response:
+            if result_response.status_code != 200:
+                logger.error(f"Failed to download result: HTTP {result_response.status_code}")
+                raise Exception(f"Failed to download result: {result_response.status_code}")
+            
+            content_type = result_response.headers.get('content-type', '')
+            content_length = int(result_response.headers.get('content-length') or 0)
+            if content_length > TRYON_MAX_DOWNLOAD_BYTES:
+                raise Exception(f"Result is too large ({content_length} bytes)")
+            
+            for chunk in result_response.iter_content(chunk_size=64 * 1024):
+                buffer.write(chunk)
+                if buffer.tell() > TRYON_MAX_DOWNLOAD_BYTES:
+                    raise Exception(f"Result exceeds {TRYON_MAX_DOWNLOAD_BYTES} bytes")
+    except req.exceptions.Timeout:
+        logger.error("Download timeout after 60 seconds")
+        raise Exception("Result download timed out")
+    
+    # Verify it's an image
+    if 'image' not in content_type.lower() and buffer.tell() < 1000:
+        logger.error(f"Downloaded content doesn't appear to be an image: {buffer.getvalue()[:200]}")
+        raise Exception("Invalid image data from model")
+    return buffer.getvalue()
+
+def preview_tryon_image(ingested, style_description, response_mode):
+    """(key, JPEG bytes) of a preview render, stored only when it will be served by URL"""
+    image_bytes = render_tryon_preview(ingested, style_description)
+    # Separate key space from Replicate results, so a preview is never returned as a real try-on
+    key = tryon_cache_key(ingested.content_hash, style_description, "preview")
+    if response_mode != "base64":
+        tryon_cache.set(key, image_bytes)
+    return key, image_bytes
+
+def run_replicate_tryon(ingested, style_description, original_base64, response_mode, report, haircut_name=None):
+    """
+    Run one change-haircut prediction, polling its status (reported as the job stage)
+    Falls back to preview mode if Replicate fails, like the synchronous endpoint always did
+    """
+    try:
+        if not haircut_name:
+            report(stage="resolving_style")
+            # Lookup table / fuzzy match / memo first; Gemini only for novel descriptions
+            haircut_name = style_resolver.resolve(style_description)
+        logger.info(f"Using haircut style: {haircut_name} (from description: {style_description})")
+        
+        cached = cached_tryon_image(ingested, haircut_name)
+        if cached:
+            key, image_bytes = cached
+            return {**tryon_result_data("replicate", style_description, key, image_bytes, response_mode, original_base64), "cached": True}
+        
+        prediction = replicate_client.predictions.create(
+            version=REPLICATE_TRYON_VERSION,
+            input={
+                "input_image": ingested.to_data_uri(TRYON_MAX_EDGE),
+                "haircut": haircut_name,
+                "aspect_ratio": "match_input_image",
+                "output_format": "png",
+                "safety_tolerance": 2
+            }
+        )
+        
+        deadline = time.time() + TRYON_TIMEOUT
+        report(stage=prediction.status)
+        while prediction.status not in ("succeeded", "failed", "canceled"):
+            if time.time() > deadline:
+                prediction.cancel()
+                raise Exception(f"Prediction timed out after {TRYON_TIMEOUT:g}s")
+            time.sleep(TRYON_POLL_INTERVAL)
+            prediction.reload()
+            report(stage=prediction.status)
+        
+        if prediction.status != "succeeded":
+            raise Exception(f"Prediction {prediction.status}: {prediction.error}")
+        
+        result_url = extract_replicate_output_url(prediction.output)
+        if not result_url:
+            raise Exception("Model produced no output URL")
+        
+        report(stage="downloading")
+        image_bytes = transcode_image(download_tryon_result(result_url), TRYON_RESULT_FORMAT, TRYON_RESULT_QUALITY)
+        key = tryon_cache_key(ingested.content_hash, haircut_name, REPLICATE_TRYON_VERSION)
+        tryon_cache.set(key, image_bytes)
+        logger.info("✅ AI hair transformation successful!")
+        return tryon_result_data("replicate", style_description, key, image_bytes, response_mode, original_base64)
+    except Exception as e:
+        logger.error(f"Replicate hair style transfer error: {str(e)}")
+        report(stage="preview_fallback")
+        key, image_bytes = preview_tryon_image(ingested, style_description, response_mode)
+        return tryon_result_data("preview", style_description, key, image_bytes, response_mode, original_base64)
+
+def render_tryon_preview(ingested, style_description):
+    """PREVIEW MODE: the user's photo with a text overlay naming the style, as JPEG bytes"""
+    logger.info("Using preview mode - user photo with text overlay - GUARANTEED TO WORK")
+    
+    try:
+        # The renderer downscales the decoded, oriented upload itself (reducing_gap + BILINEAR),
+        # which is cheaper than a LANCZOS display-size variant
+        image_bytes = render_preview(ingested.image, style_description)
+        logger.info(f"✅ Preview mode result created successfully ({len(image_bytes)} bytes)")
+        return image_bytes
+        
+    except Exception as e:
+        logger.error(f"CRITICAL: Fallback processing failed: {str(e)}")
+        import traceback
+        logger.error(traceback.format_exc())
+        raise Exception(f"Image processing failed: {str(e)}")
+
+# Virtual Try-On endpoint: preview mode answers immediately, Replicate work becomes a background job
 @app.route('/virtual-tryon', methods=['POST', 'OPTIONS'])
 @limiter.limit("20 per hour")  # Reasonable limit for GPU processing
 def virtual_tryon():
@@ -2042,469 +2834,50 @@ def virtual_tryon():
         if not style_description:
             return jsonify({"error": "Style description required"}), 400
         
-        logger.info(f"🎨 Starting hair transformation: {style_description}")
+        # How the result comes back: base64 JSON (default), url or binary
+        response_mode = str(data.get('responseMode') or request.args.get('response') or 'base64').lower()
+        if response_mode not in TRYON_RESPONSE_MODES:
+            return jsonify({"error": f"responseMode must be one of: {', '.join(TRYON_RESPONSE_MODES)}"}), 400
         
-        # Try Replicate first, then fallback to preview mode
-        REPLICATE_API_TOKEN = os.environ.get("REPLICATE_API_TOKEN")
+        # Decode once; both Replicate and preview mode work from this copy
+        try:
+            ingested = ingest_base64_image(user_photo_base64, max_edge=STORAGE_MAX_EDGE)
+        except ImageIngestError as e:
+            return jsonify({"error": f"Invalid image data: {str(e)}"}), 400
         
-        # Option 1: Replicate (Paid but better quality)
-        # Using flux-kontext-apps/change-haircut - FLUX.1 Kontext model for hair transformations
-        if REPLICATE_API_TOKEN and replicate:
-            logger.info("Using Replicate API for REAL hair style transformation")
-            
-            # Set the API token for replicate
-            os.environ["REPLICATE_API_TOKEN"] = REPLICATE_API_TOKEN
-            
-            try:
-                # Convert base64 to data URI for Replicate
-                img_data_raw = user_photo_base64.split(',')[1] if ',' in user_photo_base64 else user_photo_base64
-                face_data_uri = f"data:image/jpeg;base64,{img_data_raw}"
-                
-                logger.info(f"Starting hair style transformation: {style_description}")
-                
-                # List of ALL allowed haircut values from the Replicate model
-                ALLOWED_HAIRCUTS = [
-                    "No change", "Random", "Straight", "Wavy", "Curly", "Bob", "Pixie Cut",
-                    "Layered", "Messy Bun", "High Ponytail", "Low Ponytail", "Braided Ponytail",
-                    "French Braid", "Dutch Braid", "Fishtail Braid", "Space Buns", "Top Knot",
-                    "Undercut", "Mohawk", "Crew Cut", "Faux Hawk", "Slicked Back", "Side-Parted",
-                    "Center-Parted", "Blunt Bangs", "Side-Swept Bangs", "Shag", "Lob",
-                    "Angled Bob", "A-Line Bob", "Asymmetrical Bob", "Graduated Bob", "Inverted Bob",
-                    "Layered Shag", "Choppy Layers", "Razor Cut", "Perm", "Ombré", "Straightened",
-                    "Soft Waves", "Glamorous Waves", "Hollywood Waves", "Finger Waves", "Tousled",
-                    "Feathered", "Pageboy", "Pigtails", "Pin Curls", "Rollerset", "Twist Out",
-                    "Bantu Knots", "Dreadlocks", "Cornrows", "Box Braids", "Crochet Braids",
-                    "Double Dutch Braids", "French Fishtail Braid", "Waterfall Braid", "Rope Braid",
-                    "Heart Braid", "Halo Braid", "Crown Braid", "Braided Crown", "Bubble Braid",
-                    "Bubble Ponytail", "Ballerina Braids", "Milkmaid Braids", "Bohemian Braids",
-                    "Flat Twist", "Crown Twist", "Twisted Bun", "Twisted Half-Updo", "Twist and Pin Updo",
-                    "Chignon", "Simple Chignon", "Messy Chignon", "French Twist", "French Twist Updo",
-                    "French Roll", "Updo", "Messy Updo", "Knotted Updo", "Ballerina Bun",
-                    "Banana Clip Updo", "Beehive", "Bouffant", "Hair Bow", "Half-Up Top Knot",
-                    "Half-Up, Half-Down", "Messy Bun with a Headband", "Messy Bun with a Scarf",
-                    "Messy Fishtail Braid", "Sideswept Pixie", "Mohawk Fade", "Zig-Zag Part", "Victory Rolls"
-                ]
-                
-                # Try to use Gemini to find the best match
-                haircut_name = None
-                if model:
-                    try:
-                        logger.info("Using Gemini to find best matching haircut...")
-                        
-                        # Create a more structured prompt with context
-                        prompt = f"""You are a professional hairstylist matching haircut descriptions to specific style names.
-
-TASK: Match this haircut description to the BEST option from the allowed list below.
-
-HAIRCUT DESCRIPTION: "{style_description}"
-
-ALLOWED STYLES (choose ONE exact match):
-{', '.join(ALLOWED_HAIRCUTS)}
-
-MATCHING RULES:
-1. **Fade styles** → "Mohawk Fade" (for any fade: classic fade, modern fade, taper fade, etc.)
-2. **Parted styles** → "Side-Parted" (for side part, side part with volume, side-swept, etc.) OR "Center-Parted" (for center part, middle part)
-3. **Slicked/Quiff/Pompadour** → "Slicked Back" (for quiff, pompadour, slick back, swept back, etc.)
-4. **Short/Buzz** → "Crew Cut" (for buzz cut, crew cut, short cut, military cut)
-5. **Undercut** → "Undercut" (for undercut, disconnected undercut)
-6. **Mohawk** → "Mohawk" (for mohawk, faux hawk) OR "Mohawk Fade" (if it mentions fade)
-7. **Long hair** → "Half-Up, Half-Down" (for long hair, shoulder length, etc.)
-8. **Curly/Afro** → "Curly" (for curly, afro, natural curls)
-9. **Wavy** → "Wavy" (for wavy, soft waves) OR "Soft Waves" (if specifically soft)
-10. **Straight** → "Straight" (for straight, straightened)
-11. **Textured/Messy** → "Tousled" (for textured, messy, tousled, messy crop)
-12. **Bob styles** → "Bob" (for bob, classic bob) OR "Lob" (for long bob)
-13. **Pixie** → "Pixie Cut" (for pixie, pixie cut, bowl cut)
-14. **Bun/Top Knot** → "Top Knot" (for man bun, top knot, bun) OR "Messy Bun" (if messy)
-15. **Layered** → "Layered" (for layered, layers, layered cut)
-16. **Dreadlocks** → "Dreadlocks" (for dreadlocks, dreads)
-
-EXAMPLES:
-- "Side Part with Volume" → "Side-Parted"
-- "Classic Fade" → "Mohawk Fade"
-- "Textured Quiff" → "Slicked Back"
-- "Modern Fade" → "Mohawk Fade"
-- "Messy Crop" → "Tousled"
-- "Buzz Cut" → "Crew Cut"
-- "Undercut" → "Undercut"
-
-CRITICAL: Return ONLY the exact name from the list above. No explanations, no quotes, just the exact name."""
-                        
-                        gemini_response = model.generate_content(prompt)
-                        gemini_match = gemini_response.text.strip().strip('"').strip("'").strip('`')
-                        
-                        # Clean up common Gemini response patterns
-                        gemini_match = gemini_match.split('\n')[0].strip()  # Take first line only
-                        gemini_match = gemini_match.replace('**', '').replace('*', '')  # Remove markdown
-                        
-                        # Verify it's in the allowed list
-                        if gemini_match in ALLOWED_HAIRCUTS:
-                            haircut_name = gemini_match
-                            logger.info(f"Gemini matched '{style_description}' to '{haircut_name}'")
-                        else:
-                            # Try fuzzy matching - check if any allowed style contains the match or vice versa
-                            gemini_lower = gemini_match.lower()
-                            for allowed in ALLOWED_HAIRCUTS:
-                                if gemini_lower == allowed.lower() or gemini_lower in allowed.lower() or allowed.lower() in gemini_lower:
-                                    haircut_name = allowed
-                                    logger.info(f"Gemini fuzzy matched '{style_description}' to '{haircut_name}' (via '{gemini_match}')")
-                                    break
-                            
-                            if not haircut_name:
-                                logger.warning(f"Gemini returned '{gemini_match}' which is not in allowed list, using fallback")
-                    except Exception as gemini_error:
-                        logger.warning(f"Gemini matching failed: {str(gemini_error)}, using fallback mapping")
-                
-                # Fallback: Use keyword-based mapping if Gemini not available or failed
-                if not haircut_name:
-                    logger.info("Using keyword-based fallback mapping...")
-                    style_map = {
-                    # Fade styles
-                    "fade": "Mohawk Fade",
-                    "modern fade": "Mohawk Fade",
-                    "fade with": "Mohawk Fade",
-                    
-                    # Short styles
-                    "buzz": "Crew Cut",
-                    "buzz cut": "Crew Cut",
-                    "crew cut": "Crew Cut",
-                    "crewcut": "Crew Cut",
-                    "short": "Crew Cut",
-                    
-                    # Slicked/Quiff/Pompadour
-                    "quiff": "Slicked Back",
-                    "pompadour": "Slicked Back",
-                    "slick back": "Slicked Back",
-                    "slicked back": "Slicked Back",
-                    "slickback": "Slicked Back",
-                    
-                    # Parted styles - MUST be "Side-Parted" with hyphen
-                    "side part": "Side-Parted",
-                    "side-part": "Side-Parted",
-                    "sidepart": "Side-Parted",
-                    "side parted": "Side-Parted",
-                    "parted": "Side-Parted",
-                    "volume": "Side-Parted",  # For "Side Part with Volume"
-                    "with volume": "Side-Parted",
-                    
-                    # Undercut
-                    "undercut": "Undercut",
-                    
-                    # Mohawk
-                    "mohawk": "Mohawk",
-                    
-                    # Long styles
-                    "long": "Half-Up, Half-Down",
-                    "long hair": "Half-Up, Half-Down",
-                    
-                    # Texture/Curly
-                    "curly": "Curly",
-                    "textured": "Tousled",
-                    "messy": "Tousled",
-                    "tousled": "Tousled",
-                    "afro": "Curly",
-                    
-                    # Wavy/Straight
-                    "wavy": "Wavy",
-                    "waves": "Wavy",
-                    "soft waves": "Soft Waves",
-                    "straight": "Straight",
-                    "straightened": "Straightened",
-                    
-                    # Bob styles
-                    "bob": "Bob",
-                    "lob": "Lob",
-                    "a-line bob": "A-Line Bob",
-                    
-                    # Pixie
-                    "pixie": "Pixie Cut",
-                    "pixie cut": "Pixie Cut",
-                    "bowl cut": "Pixie Cut",
-                    
-                    # Bun/Top Knot
-                    "man bun": "Top Knot",
-                    "bun": "Top Knot",
-                    "top knot": "Top Knot",
-                    "messy bun": "Messy Bun",
-                    
-                    # Layered
-                    "layered": "Layered",
-                    "layers": "Layered",
-                    
-                    # Dreadlocks
-                    "dreadlocks": "Dreadlocks",
-                    "dreads": "Dreadlocks",
-                    
-                    # Center part
-                    "center part": "Center-Parted",
-                    "center-part": "Center-Parted",
-                    "centerpart": "Center-Parted"
-                    }
-                    
-                    # Get the best matching haircut name from the model's allowed list
-                    style_lower = style_description.lower().strip()
-                    if not haircut_name:
-                        haircut_name = "Random"  # Default fallback - model accepts this
-                    
-                    # Check for exact keyword matches first (longest matches first)
-                    # Sort by key length descending to match longer phrases first
-                    sorted_keys = sorted(style_map.keys(), key=len, reverse=True)
-                    for key in sorted_keys:
-                        if key in style_lower:
-                            haircut_name = style_map[key]
-                            break
-                    
-                    logger.info(f"Fallback mapping matched '{style_description}' to '{haircut_name}'")
-                
-                logger.info(f"Using haircut style: {haircut_name} (from description: {style_description})")
-                
-                # Use flux-kontext-apps/change-haircut model
-                # This model uses FLUX.1 Kontext for text-guided hair editing
-                # Version: 48f03523665cabe9a2e832ea9cc2d7c30ad5079cb5f1c1f07890d40596fe1f87
-                # Use replicate.run() - it handles polling internally
-                # Note: If it takes >30 seconds, the Gunicorn worker will timeout
-                # In that case, it will fall back to preview mode automatically
-                logger.info("Calling Replicate API (this may take 10-30 seconds)...")
-                output = replicate.run(
-                    "flux-kontext-apps/change-haircut:48f03523665cabe9a2e832ea9cc2d7c30ad5079cb5f1c1f07890d40596fe1f87",
-                    input={
-                        "input_image": face_data_uri,
-                        "haircut": haircut_name,
-                        "aspect_ratio": "match_input_image",
-                        "output_format": "png",
-                        "safety_tolerance": 2
-                    }
-                )
-                
-                logger.info(f"Replicate API call completed")
-                logger.info(f"Output type: {type(output)}")
-                
-                # Handle different output types from Replicate prediction
-                result_url = None
-                
-                if output:
-                    # Try multiple ways to extract the URL
-                    if isinstance(output, str):
-                        result_url = output
-                        logger.info(f"Output is string URL: {result_url}")
-                    elif isinstance(output, list) and len(output) > 0:
-                        result_url = output[0]  # First element in list
-                        logger.info(f"Output is list, first item: {result_url}")
-                    elif hasattr(output, '__iter__') and not isinstance(output, str):
-                        try:
-                            output_list = list(output)
-                            if output_list and len(output_list) > 0:
-                                result_url = output_list[0]
-                                logger.info(f"Output is iterator, first item: {result_url}")
-                        except Exception as iter_error:
-                            logger.error(f"Error iterating output: {str(iter_error)}")
-                    else:
-                        result_url = str(output)
-                        logger.info(f"Output converted to string: {result_url}")
-                
-                if not result_url:
-                    logger.error(f"No result URL found in output. Output type: {type(output)}, Output: {output}")
-                    raise Exception("Model produced no output URL")
-                
-                # Download and verify the result
-                logger.info(f"Downloading result from: {result_url}")
-                import requests as req
-                
-                try:
-                    result_response = req.get(result_url, timeout=60)  # Longer timeout for large images
-                    logger.info(f"Download response status: {result_response.status_code}")
-                    
-                    if result_response.status_code == 200:
-                        # Verify it's an image
-                        content_type = result_response.headers.get('content-type', '')
-                        logger.info(f"Content type: {content_type}")
-                        
-                        if 'image' not in content_type.lower() and len(result_response.content) < 1000:
-                            logger.error(f"Downloaded content doesn't appear to be an image: {result_response.content[:200]}")
-                            raise Exception("Invalid image data from model")
-                        
-                        result_base64 = base64.b64encode(result_response.content).decode('utf-8')
-                        logger.info(f"Image converted to base64: {len(result_base64)} chars")
-                        
-                        # Also include original image for before/after comparison
-                        original_base64 = user_photo_base64.split(',')[1] if ',' in user_photo_base64 else user_photo_base64
-                        
-                        response_data = {
-                            "success": True,
-                            "message": f"✨ Real AI hair transformation complete: {style_description}",
-                            "originalImage": original_base64,
-                            "resultImage": result_base64,
-                            "styleApplied": style_description,
-                            "poweredBy": "Replicate FLUX.1 Kontext (Change-Haircut AI)",
-                            "note": "This is a real AI transformation!"
-                        }
-                        
-                        response = make_response(jsonify(response_data), 200)
-                        response.headers['Access-Control-Allow-Origin'] = '*'
-                        logger.info("✅ AI hair transformation successful!")
-                        return response
-                    else:
-                        logger.error(f"Failed to download result: HTTP {result_response.status_code}")
-                        logger.error(f"Response: {result_response.text[:500]}")
-                        raise Exception(f"Failed to download result: {result_response.status_code}")
-            
-                except req.exceptions.Timeout:
-                    logger.error("Download timeout after 60 seconds")
-                    raise Exception("Result download timed out")
-                except Exception as download_error:
-                    logger.error(f"Download error: {str(download_error)}")
-                    raise
-                    
-            except Exception as e:
-                logger.error(f"Replicate hair style transfer error: {str(e)}")
-                import traceback
-                logger.error(traceback.format_exc())
-                # Continue to fallback preview mode
+        # Also include original image for before/after comparison
+        original_base64 = user_photo_base64.split(',')[1] if ',' in user_photo_base64 else user_photo_base64
         
-        # PREVIEW MODE: Return user photo with text overlay
-        logger.info("Using preview mode - user photo with text overlay - GUARANTEED TO WORK")
+        logger.info(f"🎨 Starting hair transformation: {style_description}")
         
-        try:
-            # Decode image - handle both formats
-            try:
-                # Remove data URI prefix if present
-                if ',' in user_photo_base64:
-                    img_data = base64.b64decode(user_photo_base64.split(',')[1])
-                else:
-                    img_data = base64.b64decode(user_photo_base64)
-                
-                logger.info(f"Decoded {len(img_data)} bytes of image data")
-            except Exception as decode_error:
-                logger.error(f"Base64 decode error: {str(decode_error)}")
-                raise Exception(f"Invalid image data: {str(decode_error)}")
-            
-            # Open image
-            try:
-                img = Image.open(BytesIO(img_data))
-                logger.info(f"Image opened: {img.size}, mode: {img.mode}")
-                
-                # Convert to RGB if needed
-                if img.mode not in ('RGB', 'RGBA'):
-                    img = img.convert('RGB')
-                    logger.info(f"Converted image to RGB")
-                    
-            except Exception as img_error:
-                logger.error(f"Image open error: {str(img_error)}")
-                raise Exception(f"Cannot process image: {str(img_error)}")
-            
-            # Add overlay with text
-            try:
-                # Convert to RGBA for overlay
-                if img.mode == 'RGB':
-                    img = img.convert('RGBA')
-                
-                # Create overlay
-                overlay = Image.new('RGBA', img.size, (0, 0, 0, 0))
-                overlay_draw = ImageDraw.Draw(overlay)
-                
-                # Draw semi-transparent rectangle at bottom
-                height = img.size[1]
-                width = img.size[0]
-                overlay_draw.rectangle([(0, height-70), (width, height)], fill=(0, 0, 0, 200))
-                
-                # Composite overlay onto image
-                img = Image.alpha_composite(img, overlay)
-                
-                # Convert back to RGB for JPEG
-                img = img.convert('RGB')
-                
-                logger.info("Overlay added successfully")
-                
-            except Exception as overlay_error:
-                logger.error(f"Overlay error: {str(overlay_error)}")
-                # Continue without overlay
-                if img.mode != 'RGB':
-                    img = img.convert('RGB')
-            
-            # Add text
-            try:
-                draw = ImageDraw.Draw(img)
-                text = f"Preview: {style_description}"
-                
-                # Try multiple font paths
-                font = None
-                font_paths = [
-                    "/usr/share/fonts/truetype/dejavu/DejaVuSans-Bold.ttf",
-                    "/usr/share/fonts/TTF/DejaVuSans-Bold.ttf",
-                    "/System/Library/Fonts/Helvetica.ttc",
-                    "arial.ttf"
-                ]
-                
-                for font_path in font_paths:
-                    try:
-                        font = ImageFont.truetype(font_path, 28)
-                        logger.info(f"Loaded font: {font_path}")
-                        break
-                    except Exception:
-                        continue
-                
-                if not font:
-                    # Use default font as last resort
-                    font = ImageFont.load_default()
-                    logger.info("Using default font")
-                
-                # Calculate text position (centered)
-                try:
-                    bbox = draw.textbbox((0, 0), text, font=font)
-                    text_width = bbox[2] - bbox[0]
-                except AttributeError:
-                    # Fallback if textbbox not available (older PIL versions)
-                    text_width = len(text) * 15
-                
-                text_x = max(10, (img.size[0] - text_width) // 2)
-                text_y = max(10, height - 50)
-                
-                # Add text with shadow for better visibility
-                draw.text((text_x+2, text_y+2), text, fill=(0, 0, 0), font=font)  # Shadow
-                draw.text((text_x, text_y), text, fill=(255, 255, 255), font=font)  # Text
-                
-                logger.info(f"Text added at position ({text_x}, {text_y})")
-                
-            except Exception as text_error:
-                logger.error(f"Text error: {str(text_error)}")
-                # Continue without text - image is still valid
-            
-            # Convert to base64
-            try:
-                buffer = BytesIO()
-                img.save(buffer, format='JPEG', quality=90, optimize=True)
-                result_base64 = base64.b64encode(buffer.getvalue()).decode('utf-8')
-                
-                logger.info(f"Image converted to base64: {len(result_base64)} chars")
-                
-            except Exception as save_error:
-                logger.error(f"Save error: {str(save_error)}")
-                raise Exception(f"Cannot save image: {str(save_error)}")
-            
-            # Also include original image for before/after comparison
-            original_base64 = user_photo_base64.split(',')[1] if ',' in user_photo_base64 else user_photo_base64
-            
-            # Return success response
-            response_data = {
+        # Option 1: Replicate (real AI) - queue the prediction and return a job id right away
+        if replicate_client:
+            # Repeat photo + style: answer from the result cache without a job
+            haircut_name, _ = style_resolver.resolve_local(style_description)
+            cached = haircut_name and cached_tryon_image(ingested, haircut_name)
+            if cached:
+                key, image_bytes = cached
+                return tryon_http_response("replicate", style_description, key, image_bytes, response_mode, original_base64, cached=True)
+            
+            logger.info("Queueing Replicate hair style transformation job")
+            job = tryon_jobs.submit(
+                # Job results are JSON; binary clients fetch the image from resultUrl
+                lambda report: run_replicate_tryon(ingested, style_description, original_base64, response_mode, report),
+                meta={"styleApplied": style_description},
+            )
+            response = make_response(jsonify({
                 "success": True,
-                "message": f"✨ Style preview created: {style_description}",
-                "originalImage": original_base64,
-                "resultImage": result_base64,
-                "styleApplied": style_description,
-                "poweredBy": "LineUp Preview Mode",
-                "note": "This is a preview mode. Works immediately with no setup!"
-            }
-            
-            response = make_response(jsonify(response_data), 200)
+                **job,
+                "statusUrl": f"/virtual-tryon/{job['jobId']}",
+                "eventsUrl": f"/virtual-tryon/{job['jobId']}/events"
+            }), 202)
             response.headers['Access-Control-Allow-Origin'] = '*'
-            logger.info("✅ Preview mode response sent successfully")
             return response
-            
-        except Exception as e:
-            logger.error(f"CRITICAL: Fallback processing failed: {str(e)}")
-            import traceback
-            logger.error(traceback.format_exc())
-            raise Exception(f"Image processing failed: {str(e)}")
+        
+        # Option 2: preview mode is instant, so it is still answered inline
+        key, image_bytes = preview_tryon_image(ingested, style_description, response_mode)
+        logger.info("✅ Preview mode response sent successfully")
+        return tryon_http_response("preview", style_description, key, image_bytes, response_mode, original_base64)
     
     except Exception as e:
         logger.error(f"Error in virtual try-on endpoint: {str(e)}")
@@ -2512,6 +2885,204 @@ CRITICAL: Return ONLY the exact name from the list above. No explanations, no qu
         response.headers['Access-Control-Allow-Origin'] = '*'
         return response
 
+def batch_tryon_events(ingested, styles, original_base64, response_mode, user_key):
+    """SSE sequence for a batch try-on: one "result" (or "error") per style, in completion order"""
+    if not replicate_client:
+        # Previews are instant, so they are rendered in order
+        for index, style in enumerate(styles):
+            key, image_bytes = preview_tryon_image(ingested, style, response_mode)
+            yield sse_event("result", {"index": index, **tryon_result_data("preview", style, key, image_bytes, response_mode, original_base64)})
+        yield sse_event("done", {"count": len(styles)})
+        return
+    
+    # One Gemini call at most for every style the local resolver doesn't know
+    haircuts = style_resolver.resolve_many(styles)
+    yield sse_event("batch", {"styles": [
+        {"index": index, "styleApplied": style, "haircut": haircut}
+        for index, (style, haircut) in enumerate(zip(styles, haircuts))
+    ]})
+    
+    # Styles that resolve to the same haircut share one prediction
+    indices_by_haircut = {}
+    for index, haircut in enumerate(haircuts):
+        indices_by_haircut.setdefault(haircut, []).append(index)
+    
+    def result_events(result, indices, **extra):
+        for index in indices:
+            yield sse_event("result", {**result, **extra, "index": index, "styleApplied": styles[index]})
+    
+    pending = []
+    for haircut, indices in indices_by_haircut.items():
+        cached = cached_tryon_image(ingested, haircut)
+        if cached:
+            key, image_bytes = cached
+            result = tryon_result_data("replicate", styles[indices[0]], key, image_bytes, response_mode, original_base64)
+            yield from result_events(result, indices, cached=True)
+        else:
+            pending.append(haircut)
+    
+    def run_for(haircut):
+        def run(report):
+            try:
+                return run_replicate_tryon(ingested, styles[indices_by_haircut[haircut][0]], original_base64,
+                                           response_mode, report, haircut_name=haircut)
+            finally:
+                # Released by the job itself, so a disconnected client can't leak slots
+                tryon_user_slots.release(user_key)
+        return run
+    
+    running = {}
+    deadline = time.time() + TRYON_TIMEOUT * (len(pending) + 1)
+    while (pending or running) and time.time() < deadline:
+        while pending and tryon_user_slots.try_acquire(user_key):
+            haircut = pending.pop(0)
+            job = tryon_jobs.submit(run_for(haircut), meta={"styleApplied": styles[indices_by_haircut[haircut][0]], "haircut": haircut})
+            running[job["jobId"]] = haircut
+        
+        if not running:
+            # This user's other try-ons hold every slot
+            time.sleep(TRYON_POLL_INTERVAL)
+            continue
+        
+        for job in tryon_jobs.wait_any(list(running), timeout=15):
+            haircut = running.pop(job["jobId"])
+            if job["status"] == "succeeded":
+                yield from result_events(job["result"], indices_by_haircut[haircut], jobId=job["jobId"])
+            else:
+                for index in indices_by_haircut[haircut]:
+                    yield sse_event("error", {"index": index, "styleApplied": styles[index], "error": job.get("error")})
+    
+    for haircut in pending + list(running.values()):
+        for index in indices_by_haircut[haircut]:
+            yield sse_event("error", {"index": index, "styleApplied": styles[index], "error": "Try-on timed out"})
+    yield sse_event("done", {"count": len(styles)})
+
+# Batch virtual try-on: one photo, several styles, results streamed as server-sent events
+@app.route('/virtual-tryon/batch', methods=['POST', 'OPTIONS'])
+@limiter.limit("5 per hour")
+def virtual_tryon_batch():
+    if request.method == 'OPTIONS':
+        response = make_response('')
+        response.headers.add('Access-Control-Allow-Origin', '*')
+        response.headers.add('Access-Control-Allow-Headers', 'Content-Type')
+        response.headers.add('Access-Control-Allow-Methods', 'POST, OPTIONS')
+        return response, 200
+    
+    data = request.get_json(silent=True) or {}
+    user_photo_base64 = data.get('userPhoto', '')
+    styles = data.get('styles') or []
+    
+    if not user_photo_base64:
+        return jsonify({"error": "User photo required"}), 400
+    
+    if not isinstance(styles, list) or not styles or not all(isinstance(style, str) and style.strip() for style in styles):
+        return jsonify({"error": "styles must be a non-empty list of style descriptions"}), 400
+    
+    styles = list(dict.fromkeys(style.strip() for style in styles))
+    if len(styles) > TRYON_BATCH_MAX_STYLES:
+        return jsonify({"error": f"At most {TRYON_BATCH_MAX_STYLES} styles per batch"}), 400
+    
+    # Results stream as JSON events, so raw binary isn't an option here
+    response_mode = str(data.get('responseMode') or 'url').lower()
+    if response_mode not in ("base64", "url"):
+        return jsonify({"error": "responseMode must be one of: base64, url"}), 400
+    
+    # Decoded, downscaled and encoded for Replicate once for the whole batch
+    try:
+        ingested = ingest_base64_image(user_photo_base64, max_edge=STORAGE_MAX_EDGE)
+    except ImageIngestError as e:
+        return jsonify({"error": f"Invalid image data: {str(e)}"}), 400
+    if replicate_client:
+        ingested.to_data_uri(TRYON_MAX_EDGE)
+    
+    original_base64 = user_photo_base64.split(',')[1] if ',' in user_photo_base64 else user_photo_base64
+    # Keyed like the rate limiter: a client-supplied userId could be changed per request to dodge the cap
+    user_key = get_remote_address()
+    logger.info(f"🎨 Starting batch hair transformation: {len(styles)} styles")
+    
+    return sse_response(batch_tryon_events(ingested, styles, original_base64, response_mode, user_key))
+
+# Try-on job status (poll, or long-poll with ?wait=<seconds>)
+@app.route('/virtual-tryon/<job_id>', methods=['GET', 'OPTIONS'])
+@limiter.limit("600 per hour")
+def virtual_tryon_status(job_id):
+    if request.method == 'OPTIONS':
+        response = make_response('')
+        response.headers.add('Access-Control-Allow-Origin', '*')
+        response.headers.add('Access-Control-Allow-Methods', 'GET, OPTIONS')
+        return response, 200
+    
+    try:
+        wait_seconds = min(max(float(request.args.get('wait', 0)), 0), 25)
+    except ValueError:
+        wait_seconds = 0
+    
+    job = tryon_jobs.wait(job_id, wait_seconds) if wait_seconds else tryon_jobs.get(job_id)
+    if not job:
+        response = make_response(jsonify({"error": "Try-on job not found"}), 404)
+        response.headers['Access-Control-Allow-Origin'] = '*'
+        return response
+    
+    response = make_response(jsonify({"success": job["status"] != "failed", **job}), 200)
+    response.headers['Access-Control-Allow-Origin'] = '*'
+    return response
+
+# Stored try-on result image (resultUrl); content-addressed, so it never changes
+@app.route('/virtual-tryon/results/<key>', methods=['GET', 'OPTIONS'])
+@limiter.limit("600 per hour")
+def virtual_tryon_result_image(key):
+    if request.method == 'OPTIONS':
+        response = make_response('')
+        response.headers.add('Access-Control-Allow-Origin', '*')
+        response.headers.add('Access-Control-Allow-Methods', 'GET, OPTIONS')
+        return response, 200
+    
+    path = tryon_cache.locate(key) if len(key) == 64 and all(c in '0123456789abcdef' for c in key) else None
+    if not path:
+        response = make_response(jsonify({"error": "Try-on result not found or expired"}), 404)
+        response.headers['Access-Control-Allow-Origin'] = '*'
+        return response
+    
+    with open(path, 'rb') as f:
+        mimetype = image_mime_type(f.read(12))
+    response = send_file(path, mimetype=mimetype, conditional=True, etag=key, max_age=tryon_cache.ttl_seconds)
+    response.headers['Cache-Control'] = f"public, max-age={tryon_cache.ttl_seconds}, immutable"
+    response.headers['Access-Control-Allow-Origin'] = '*'
+    return response
+
+# Try-on job progress as server-sent events: "status" on every change, then "result" or "error"
+@app.route('/virtual-tryon/<job_id>/events', methods=['GET', 'OPTIONS'])
+@limiter.limit("100 per hour")
+def virtual_tryon_events(job_id):
+    if request.method == 'OPTIONS':
+        response = make_response('')
+        response.headers.add('Access-Control-Allow-Origin', '*')
+        response.headers.add('Access-Control-Allow-Methods', 'GET, OPTIONS')
+        return response, 200
+    
+    job = tryon_jobs.get(job_id)
+    if not job:
+        response = make_response(jsonify({"error": "Try-on job not found"}), 404)
+        response.headers['Access-Control-Allow-Origin'] = '*'
+        return response
+    
+    def events():
+        snapshot = job
+        deadline = time.time() + TRYON_TIMEOUT + 30
+        while snapshot:
+            if snapshot["status"] == "succeeded":
+                yield sse_event("result", snapshot)
+                return
+            if snapshot["status"] == "failed":
+                yield sse_event("error", snapshot)
+                return
+            yield sse_event("status", snapshot)
+            if time.time() > deadline:
+                return
+            snapshot = tryon_jobs.wait_for_change(job_id, snapshot["version"], timeout=15)
+    
+    return sse_response(events())
+
 # ============================================================
 # NEW FEATURES: Reviews, Comments, Follows, AI Insights
 # ============================================================
@@ -2679,18 +3250,42 @@ def handle_comments(post_id):
         return response, 200
     
     if request.method == 'GET':
-        # Try to get comments from database first
-        comments = []
+        # One page per request, newest first: ?limit=<n>&before=<nextCursor from the previous page>
+        try:
+            limit = min(max(int(request.args.get('limit', COMMENTS_DEFAULT_LIMIT)), 1), COMMENTS_MAX_LIMIT)
+            before = decode_cursor(request.args['before']) if request.args.get('before') else None
+        except ValueError as e:
+            response = make_response(jsonify({"error": f"Invalid pagination parameters: {str(e)}"}), 400)
+            response.headers['Access-Control-Allow-Origin'] = '*'
+            return response
+        
+        comments = None
         if db:
-            comments_doc = db_get_doc('post_comments', post_id)
-            if comments_doc and 'comments' in comments_doc:
-                comments = comments_doc['comments']
+            try:
+                if before is None:
+                    migrate_legacy_comments(post_id)
+            except Exception as e:
+                logger.error(f"Error migrating comments on post {post_id}: {str(e)}")
+            page = db_get_subpage('post_comments', post_id, 'comments', 'timestamp', limit + 1, start_after=before)
+            # An empty page is a real answer (no comments / end of thread); only a failed query falls back
+            if page is not None:
+                comments = page[:limit]
+                next_cursor = encode_cursor(comments[-1]['timestamp'], comments[-1]['id']) if len(page) > limit else None
         
         # Fallback to in-memory
-        if not comments:
-            comments = post_comments.get(post_id, [])
+        if comments is None:
+            comments, next_cursor = post_comments.get(post_id, FeedIndex()).page(limit, before)
         
-        response = make_response(jsonify({"comments": comments}), 200)
+        # The post's comment counter, read through social_counters, so no count query over the thread
+        post, _ = get_social_post(post_id)
+        count = post.get("comments", 0) if post else len(post_comments.get(post_id, ()))
+        
+        response = make_response(jsonify({
+            "comments": comments,
+            "nextCursor": next_cursor,
+            "hasMore": next_cursor is not None,
+            "count": count
+        }), 200)
         response.headers['Access-Control-Allow-Origin'] = '*'
         return response
     
@@ -2705,42 +3300,18 @@ def handle_comments(post_id):
                 "timestamp": datetime.now().isoformat()
             }
             
-            # Get existing comments
-            comments = []
+            # Append-only: one new document, the existing thread is never read or rewritten
             if db:
-                comments_doc = db_get_doc('post_comments', post_id)
-                if comments_doc and 'comments' in comments_doc:
-                    comments = comments_doc['comments']
-            
-            if not comments:
-                comments = post_comments.get(post_id, [])
-            
-            # Add new comment
-            comments.append(new_comment)
-            
-            # Save to database if using database
-            if db:
-                db_add_doc('post_comments', {"comments": comments}, doc_id=post_id)
+                db_add_subdoc('post_comments', post_id, 'comments', new_comment, sub_doc_id=new_comment["id"])
             else:
-                post_comments[post_id] = comments
+                post_comments.setdefault(post_id, FeedIndex()).add(new_comment)
             
             # Update comment count on post
-            post = None
-            if db:
-                post = db_get_doc('social_posts', post_id)
-            
-            if not post:
-                post = next((p for p in social_posts if str(p.get("id")) == str(post_id)), None)
-            
-            if post:
-                current_comments = post.get("comments", 0)
-                post["comments"] = current_comments + 1
-                
-                # Update in database
-                if db:
-                    db_update_doc('social_posts', post_id, {
-                        "comments": post["comments"]
-                    })
+            post, from_db = get_social_post(post_id)
+            if from_db:
+                update_social_post(post_id, increments={"comments": 1})
+            elif post:
+                post["comments"] = post.get("comments", 0) + 1
             
             response = make_response(jsonify({"success": True, "comment": new_comment}), 201)
             response.headers['Access-Control-Allow-Origin'] = '*'
@@ -2767,16 +3338,17 @@ def toggle_follow(user_id):
         data = request.get_json()
         follower_id = data.get("follower_id", "current_user")
         
-        if request.path.endswith('/follow'):
-            if follower_id not in user_follows:
-                user_follows[follower_id] = []
-            if user_id not in user_follows[follower_id]:
-                user_follows[follower_id].append(user_id)
+        following = request.path.endswith('/follow')
+        if following:
+            follow_graph.follow(follower_id, user_id)
         else:  # unfollow
-            if follower_id in user_follows:
-                user_follows[follower_id] = [uid for uid in user_follows[follower_id] if uid != user_id]
+            follow_graph.unfollow(follower_id, user_id)
         
-        response = make_response(jsonify({"success": True}), 200)
+        response = make_response(jsonify({
+            "success": True,
+            "following": following,
+            "followers": len(follow_graph.followers(user_id))
+        }), 200)
         response.headers['Access-Control-Allow-Origin'] = '*'
         return response
     except Exception as e:
@@ -2785,6 +3357,35 @@ def toggle_follow(user_id):
         response.headers['Access-Control-Allow-Origin'] = '*'
         return response
 
+@app.route('/users/<user_id>/timeline', methods=['GET', 'OPTIONS'])
+@limiter.limit("300 per hour")
+def home_timeline(user_id):
+    """Posts from accounts user_id follows, newest first, one page at a time"""
+    if request.method == 'OPTIONS':
+        response = make_response('')
+        response.headers.add('Access-Control-Allow-Origin', '*')
+        response.headers.add('Access-Control-Allow-Headers', 'Content-Type')
+        response.headers.add('Access-Control-Allow-Methods', 'GET, OPTIONS')
+        return response, 200
+    
+    try:
+        limit = min(max(int(request.args.get('limit', FEED_DEFAULT_LIMIT)), 1), FEED_MAX_LIMIT)
+        before = decode_cursor(request.args['before']) if request.args.get('before') else None
+    except ValueError as e:
+        response = make_response(jsonify({"error": f"Invalid pagination parameters: {str(e)}"}), 400)
+        response.headers['Access-Control-Allow-Origin'] = '*'
+        return response
+    
+    posts, next_cursor = follow_graph.home(user_id, limit, before)
+    response = make_response(jsonify({
+        "posts": posts,
+        "nextCursor": next_cursor,
+        "hasMore": next_cursor is not None,
+        "following": sorted(follow_graph.following(user_id))
+    }), 200)
+    response.headers['Access-Control-Allow-Origin'] = '*'
+    return response
+
 # ========================================
 # Availability & Working Hours Management
 # ========================================
@@ -2806,24 +3407,10 @@ def manage_availability(barber_id):
                 availability = db_get_doc('barber_availability', barber_id)
             
             if not availability:
-                # Default availability
-                availability = {
-                    "barberId": barber_id,
-                    "workingHours": {
-                        "monday": {"enabled": True, "start": "09:00", "end": "18:00"},
-                        "tuesday": {"enabled": True, "start": "09:00", "end": "18:00"},
-                        "wednesday": {"enabled": True, "start": "09:00", "end": "18:00"},
-                        "thursday": {"enabled": True, "start": "09:00", "end": "18:00"},
-                        "friday": {"enabled": True, "start": "09:00", "end": "18:00"},
-                        "saturday": {"enabled": True, "start": "09:00", "end": "17:00"},
-                        "sunday": {"enabled": False, "start": "09:00", "end": "17:00"}
-                    },
-                    "breakTimes": [],
-                    "blockedDates": [],
-                    "serviceDuration": 30,  # Default 30 minutes
-                    "bufferTime": 15,  # 15 minutes between appointments
-                    "timezone": "America/New_York"
-                }
+                return cached_json_response(
+                    ("default_availability", barber_id),
+                    lambda: {"availability": get_default_availability(barber_id)},
+                )
             
             response = make_response(jsonify({"availability": availability}), 200)
             response.headers['Access-Control-Allow-Origin'] = '*'
@@ -2893,7 +3480,7 @@ def get_available_slots(barber_id):
             appointments_today = db_query('appointments', 'barberId', '==', barber_id)
             appointments_today = [apt for apt in appointments_today if apt.get('date') == date and apt.get('status') not in ['cancelled', 'rejected']]
         else:
-            appointments_today = [apt for apt in appointments if apt.get('barberId') == barber_id and apt.get('date') == date and apt.get('status') not in ['cancelled', 'rejected']]
+            appointments_today = [apt for apt in appointments.find('barberId', barber_id) if apt.get('date') == date and apt.get('status') not in ['cancelled', 'rejected']]
         
         # Calculate available slots (simplified - can be enhanced)
         from datetime import datetime as dt
@@ -2947,12 +3534,7 @@ def manage_services(barber_id):
                 services = db_query('barber_services', 'barberId', '==', barber_id)
             
             if not services:
-                # Default services
-                services = [
-                    {"id": "1", "name": "Haircut", "price": 30, "duration": 30, "category": "Hair"},
-                    {"id": "2", "name": "Beard Trim", "price": 15, "duration": 15, "category": "Beard"},
-                    {"id": "3", "name": "Haircut + Beard", "price": 40, "duration": 45, "category": "Package"}
-                ]
+                return cached_json_response("default_services", lambda: {"services": DEFAULT_SERVICES})
             
             response = make_response(jsonify({"services": services}), 200)
             response.headers['Access-Control-Allow-Origin'] = '*'
@@ -3052,7 +3634,7 @@ def get_clients(barber_id):
         if db:
             appointments_list = db_query('appointments', 'barberId', '==', barber_id)
         else:
-            appointments_list = [apt for apt in appointments if apt.get('barberId') == barber_id]
+            appointments_list = appointments.find('barberId', barber_id)
         
         # Group by client
         clients_dict = {}
@@ -3115,7 +3697,7 @@ def get_client_history(barber_id, client_id):
             appointments_list = db_query('appointments', 'barberId', '==', barber_id)
             appointments_list = [apt for apt in appointments_list if apt.get('clientId') == client_id]
         else:
-            appointments_list = [apt for apt in appointments if apt.get('barberId') == barber_id and apt.get('clientId') == client_id]
+            appointments_list = [apt for apt in appointments.find('clientId', client_id) if apt.get('barberId') == barber_id]
         
         # Sort by date
         appointments_list.sort(key=lambda x: x.get('date', '') + ' ' + x.get('time', ''), reverse=True)
@@ -3208,30 +3790,19 @@ def share_post(post_id):
         return response, 200
     
     try:
-        # Try to get post from database first, then fallback to in-memory
-        post = None
-        if db:
-            post_doc = db_get_doc('social_posts', post_id)
-            if post_doc:
-                post = post_doc
-        
-        # Fallback to in-memory if not in database
-        if not post:
-            post = next((p for p in social_posts if str(p.get("id")) == str(post_id)), None)
+        # Database first (only the first share in a while reads Firestore), then in-memory
+        post, from_db = get_social_post(post_id)
         
         if not post:
             response = make_response(jsonify({"error": "Post not found"}), 404)
             response.headers['Access-Control-Allow-Origin'] = '*'
             return response
         
-        current_shares = post.get("shares", 0)
-        post["shares"] = current_shares + 1
-        
-        # Save to database if using database
-        if db:
-            db_update_doc('social_posts', post_id, {
-                "shares": post["shares"]
-            })
+        # Write-behind increment when using the database, otherwise update the post directly
+        if from_db:
+            post = update_social_post(post_id, increments={"shares": 1})
+        else:
+            post["shares"] = post.get("shares", 0) + 1
         
         response = make_response(jsonify({"success": True, "shares": post["shares"]}), 200)
         response.headers['Access-Control-Allow-Origin'] = '*'
@@ -3257,17 +3828,13 @@ def get_ai_insights():
         # Get user's preferred styles from recommendations if available
         recommended_styles = request.args.get('styles', '').split(',') if request.args.get('styles') else []
         
-        # Analyze trends from social posts
-        all_hashtags = []
-        for post in social_posts:
-            all_hashtags.extend(post.get('hashtags', []))
-        
-        trending_hashtags = list(set([tag for tag in all_hashtags if all_hashtags.count(tag) > 1]))[:5]
+        # Trends from social posts: time-decayed scores maintained as posts are created
+        trending_tags = [tag for tag, _ in trending_hashtags.top(5, min_score=TRENDING_MIN_SCORE)]
         
         # Combine with pre-loaded trends
         insights = {
             "trending_styles": hair_trends.get("trending_styles", [])[:5],
-            "trending_hashtags": trending_hashtags if trending_hashtags else hair_trends.get("trending_hashtags", []),
+            "trending_hashtags": trending_tags if trending_tags else hair_trends.get("trending_hashtags", []),
             "popular_colors": hair_trends.get("popular_colors", [])[:4],
             "seasonal_tips": hair_trends.get("seasonal_tips", ""),
             "personalized_recommendations": []
@@ -0,0 +1,104 @@
+#!/usr/bin/env python3
+"""Benchmark the virtual try-on preview renderer on common phone photo sizes.
+
+Compares the original renderer (full-size RGBA overlay + alpha composite, font
+probing and ``optimize=True`` on every request) with
+``lineup_backend.preview_renderer``. Every run starts from a freshly ingested
+upload, as each /virtual-tryon request does, and both renderers encode at
+the same JPEG quality. Ingesting is not timed (both paths pay it equally).
+
+Usage: python bench_preview.py [runs]
+"""
+
+import statistics
+import sys
+import time
+from io import BytesIO
+
+from PIL import Image, ImageDraw, ImageFont
+
+from lineup_backend.image_pipeline import STORAGE_MAX_EDGE, ingest_image_bytes
+from lineup_backend.preview_renderer import PREVIEW_JPEG_QUALITY, PREVIEW_MAX_EDGE, render_preview
+
+PHONE_PHOTOS = [
+    ("1080x1920 (social export)", (1080, 1920)),
+    ("3024x4032 (12 MP)", (3024, 4032)),
+    ("3000x4000 (12 MP Android)", (3000, 4000)),
+    ("4284x5712 (24 MP)", (4284, 5712)),
+]
+STYLE = "Modern Textured Crop"
+
+
+def make_photo(size):
+    """A JPEG with smooth texture, roughly the file size a phone camera would produce."""
+    img = Image.effect_noise((size[0] // 8, size[1] // 8), 64).resize(size, Image.BILINEAR)
+    img = Image.merge("RGB", (img, img.rotate(180), img.transpose(Image.FLIP_LEFT_RIGHT)))
+    buffer = BytesIO()
+    img.save(buffer, format="JPEG", quality=90)
+    return buffer.getvalue()
+
+
+def legacy_render(image, style_description):
+    """The pre-rework preview path, kept here only as the baseline."""
+    img = image.copy().convert("RGBA")
+    overlay = Image.new("RGBA", img.size, (0, 0, 0, 0))
+    width, height = img.size
+    ImageDraw.Draw(overlay).rectangle([(0, height - 70), (width, height)], fill=(0, 0, 0, 200))
+    img = Image.alpha_composite(img, overlay).convert("RGB")
+
+    draw = ImageDraw.Draw(img)
+    text = f"Preview: {style_description}"
+    font = None
+    for font_path in ["/usr/share/fonts/truetype/dejavu/DejaVuSans-Bold.ttf",
+                      "/usr/share/fonts/TTF/DejaVuSans-Bold.ttf",
+                      "/System/Library/Fonts/Helvetica.ttc",
+                      "arial.ttf"]:
+        try:
+            font = ImageFont.truetype(font_path, 28)
+            break
+        except Exception:
+            continue
+    font = font or ImageFont.load_default()
+    bbox = draw.textbbox((0, 0), text, font=font)
+    text_x = max(10, (width - (bbox[2] - bbox[0])) // 2)
+    draw.text((text_x + 2, height - 48), text, fill=(0, 0, 0), font=font)
+    draw.text((text_x, height - 50), text, fill=(255, 255, 255), font=font)
+
+    buffer = BytesIO()
+    img.save(buffer, format="JPEG", quality=PREVIEW_JPEG_QUALITY, optimize=True)
+    return buffer.getvalue()
+
+
+def time_ms(func, setup, runs):
+    """Median wall time of ``func(setup())`` in milliseconds (setup not timed), plus its last output size."""
+    timings = []
+    output = b""
+    for _ in range(runs):
+        arg = setup()
+        start = time.perf_counter()
+        output = func(arg)
+        timings.append((time.perf_counter() - start) * 1000)
+    return statistics.median(timings), len(output)
+
+
+def main():
+    runs = int(sys.argv[1]) if len(sys.argv) > 1 else 10
+    print(f"Preview render, median of {runs} runs (upload ingested at {STORAGE_MAX_EDGE}px, "
+          f"preview at {PREVIEW_MAX_EDGE}px, JPEG q={PREVIEW_JPEG_QUALITY})")
+    print(f"{'Photo':28} {'legacy ms':>10} {'new ms':>8} {'speedup':>8} {'legacy KB':>10} {'new KB':>8}")
+    print("-" * 78)
+    for label, size in PHONE_PHOTOS:
+        photo = make_photo(size)
+
+        def fresh_upload():
+            return ingest_image_bytes(photo, max_edge=STORAGE_MAX_EDGE)
+
+        render_preview(fresh_upload().image, STYLE)  # warm the font cache once, as a running server would
+        legacy, legacy_bytes = time_ms(lambda ingested: legacy_render(ingested.image, STYLE), fresh_upload, runs)
+        new, new_bytes = time_ms(lambda ingested: render_preview(ingested.image, STYLE), fresh_upload, runs)
+        print(f"{label:28} {legacy:10.1f} {new:8.1f} {legacy / new:7.1f}x "
+              f"{legacy_bytes / 1024:10.0f} {new_bytes / 1024:8.0f}")
+
+
+if __name__ == "__main__":
+    main()
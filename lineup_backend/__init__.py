@@ -2,6 +2,7 @@
 
 from .config import AppConfig
 from .storage import (
+    IndexedCollection,
     social_posts,
     post_comments,
     user_follows,
@@ -20,6 +21,7 @@ __version__ = "2.0.0"
 __all__ = [
     "AppConfig",
     # Storage exports
+    "IndexedCollection",
     "social_posts",
     "post_comments", 
     "user_follows",
@@ -0,0 +1,205 @@
+"""Content-addressed image store on local disk.
+
+Without Cloudinary or Firebase Storage, post and portfolio images used to be
+kept as base64 inside the records and re-sent with every feed response.
+:class:`BlobStore` writes each image once under its SHA-256
+(``<dir>/ab/cd/abcd...``), and ``/media/<hash>`` serves it with range support
+and immutable caching headers.
+
+Blobs are referenced by live posts and portfolio items, so the byte budget is
+never met by evicting them: each :meth:`BlobStore.put` takes a reference, kept
+in a small SQLite table so it survives restarts, and only blobs whose
+references were all released are collected. When the store is full of
+referenced blobs, ``put`` refuses the write and the caller falls back to
+inline base64. Blobs found on disk without a reference row (written before
+references were tracked) are treated as referenced.
+"""
+
+from __future__ import annotations
+
+import hashlib
+import logging
+import os
+import re
+import sqlite3
+import threading
+import time
+from typing import Any, Dict, Optional, Tuple
+
+from lineup_backend.moderation_cache import CACHE_DIR
+
+logger = logging.getLogger(__name__)
+
+_DIGEST_RE = re.compile(r"^[0-9a-f]{64}$")
+
+
+def is_digest(value: str) -> bool:
+    """True for a lowercase hex SHA-256, the only names the store hands out."""
+    return bool(_DIGEST_RE.match(value or ""))
+
+
+class BlobStore:
+    """Sharded SHA-256 file store with reference counts and a byte budget."""
+
+    def __init__(self, directory: Optional[str] = None, max_bytes: int = 1024 * 1024 * 1024):
+        self.directory = directory or os.path.join(CACHE_DIR, "blobs")
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        # digest -> (size, last_used); rebuilt from disk so it survives restarts
+        self._index: Dict[str, Tuple[int, float]] = {}
+        self._refs: Dict[str, int] = {}
+        self._total_bytes = 0
+        self._conn = None
+        self.evictions = 0
+        self.rejected_full = 0
+
+        try:
+            os.makedirs(self.directory, exist_ok=True)
+            for root, _, files in os.walk(self.directory):
+                for name in files:
+                    if is_digest(name):
+                        stat = os.stat(os.path.join(root, name))
+                        self._index[name] = (stat.st_size, stat.st_mtime)
+                        self._total_bytes += stat.st_size
+        except OSError as e:
+            logger.warning(f"Blob store directory unavailable ({str(e)}), local media disabled")
+            self.directory = None
+            return
+
+        try:
+            self._conn = sqlite3.connect(os.path.join(self.directory, "refs.sqlite3"), check_same_thread=False, timeout=5)
+            self._conn.execute("CREATE TABLE IF NOT EXISTS refs (digest TEXT PRIMARY KEY, count INTEGER NOT NULL)")
+            self._conn.commit()
+            stored = dict(self._conn.execute("SELECT digest, count FROM refs"))
+        except sqlite3.Error as e:
+            logger.warning(f"Blob reference table unavailable ({str(e)}), references kept in memory")
+            self._conn = None
+            stored = {}
+        # Unknown blobs predate reference tracking and may back live records: never collect them
+        self._refs = {digest: stored.get(digest, 1) for digest in self._index}
+
+    @property
+    def enabled(self) -> bool:
+        return self.directory is not None
+
+    def put(self, data: bytes) -> Tuple[Optional[str], bool]:
+        """Store ``data`` and take a reference to it: ``(digest, created)``.
+
+        ``created`` is False when identical bytes were already stored (only a
+        reference is added). A None digest means failure or a full store, and
+        the caller keeps the image inline.
+        """
+        if not self.directory or not data or len(data) > self.max_bytes:
+            return None, False
+        digest = hashlib.sha256(data).hexdigest()
+        with self._lock:
+            if digest in self._index:
+                self._index[digest] = (len(data), time.time())
+                self._set_refs(digest, self._refs.get(digest, 0) + 1)
+                return digest, False
+            if not self._make_room(len(data)):
+                self.rejected_full += 1
+                logger.warning("Blob store is full of referenced images, keeping this one inline")
+                return None, False
+
+        path = self._path(digest)
+        tmp_path = f"{path}.{threading.get_ident()}.tmp"
+        try:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            with open(tmp_path, "wb") as f:
+                f.write(data)
+            os.replace(tmp_path, path)
+        except OSError as e:
+            logger.warning(f"Blob store write failed: {str(e)}")
+            return None, False
+
+        with self._lock:
+            created = digest not in self._index  # a concurrent put of the same bytes may have won
+            if created:
+                self._total_bytes += len(data)
+            self._index[digest] = (len(data), time.time())
+            self._set_refs(digest, self._refs.get(digest, 0) + 1)
+        return digest, created
+
+    def locate(self, digest: str) -> Optional[str]:
+        """File path for ``digest`` (marking it recently used), or None if unknown."""
+        if not self.directory or not is_digest(digest):
+            return None
+        with self._lock:
+            entry = self._index.get(digest)
+            if entry is None:
+                return None
+            self._index[digest] = (entry[0], time.time())
+        return self._path(digest)
+
+    def release(self, digest: str) -> bool:
+        """Drop one reference taken by :meth:`put`; the file is removed once none remain.
+
+        Blobs are shared by every upload of the same bytes, so discarding one
+        upload must not delete a file another record still points to.
+        Returns True if the file was removed.
+        """
+        if not self.directory or not is_digest(digest):
+            return False
+        with self._lock:
+            if digest not in self._index:
+                return False
+            remaining = self._refs.get(digest, 0) - 1
+            if remaining > 0:
+                self._set_refs(digest, remaining)
+                return False
+            self._remove(digest)
+        return True
+
+    def stats(self) -> Dict[str, Any]:
+        """Size, collection and refusal counts for /metrics."""
+        with self._lock:
+            return {
+                "blobs": len(self._index),
+                "unreferenced": sum(1 for digest in self._index if not self._refs.get(digest)),
+                "bytes": self._total_bytes,
+                "max_bytes": self.max_bytes,
+                "evictions": self.evictions,
+                "rejected_full": self.rejected_full,
+                "enabled": self.directory is not None,
+            }
+
+    def _path(self, digest: str) -> str:
+        return os.path.join(self.directory, digest[:2], digest[2:4], digest)
+
+    def _make_room(self, size: int) -> bool:
+        """Collect unreferenced blobs (least recently used first) until ``size`` more bytes fit."""
+        if self._total_bytes + size <= self.max_bytes:
+            return True
+        unreferenced = [digest for digest in self._index if not self._refs.get(digest)]
+        for digest in sorted(unreferenced, key=lambda d: self._index[d][1]):
+            self._remove(digest)
+            self.evictions += 1
+            if self._total_bytes + size <= self.max_bytes:
+                return True
+        return False
+
+    def _set_refs(self, digest: str, count: int) -> None:
+        self._refs[digest] = count
+        if self._conn is None:
+            return
+        try:
+            self._conn.execute("INSERT OR REPLACE INTO refs (digest, count) VALUES (?, ?)", (digest, count))
+            self._conn.commit()
+        except sqlite3.Error as e:
+            logger.warning(f"Blob reference write failed: {str(e)}")
+
+    def _remove(self, digest: str) -> None:
+        self._refs.pop(digest, None)
+        if self._conn is not None:
+            try:
+                self._conn.execute("DELETE FROM refs WHERE digest = ?", (digest,))
+                self._conn.commit()
+            except sqlite3.Error as e:
+                logger.warning(f"Blob reference delete failed: {str(e)}")
+        size, _ = self._index.pop(digest, (0, 0))
+        self._total_bytes -= size
+        try:
+            os.remove(self._path(digest))
+        except OSError:
+            pass
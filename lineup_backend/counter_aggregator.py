@@ -0,0 +1,179 @@
+"""Write-behind aggregation of social counters (likes, shares, comment counts).
+
+Each like, share or comment used to cost a Firestore ``get`` plus an
+``update`` of the same post document, so a popular post turned every tap into
+two round-trips contending on one document. :class:`CounterAggregator` applies
+changes locally and hands them to a ``flush`` callback in batches: every
+``interval`` seconds, or sooner once ``max_events`` changes are waiting. The
+callback applies them as atomic increments and reports which documents it
+wrote; only the others are re-queued, so a partly committed window is never
+applied twice. Reads merge the last known
+document state with the unflushed changes (including a batch that is being
+committed). A crash loses at most one flush window.
+
+A stale base is reloaded under the flush lock, so a read never overlaps a
+commit. A base read mid-commit might or might not include the batch, and
+adding the batch to it afterwards could count it twice.
+"""
+
+from __future__ import annotations
+
+import logging
+import threading
+import time
+from typing import Any, Callable, Dict, Iterable, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+# flush(increments, sets): {doc_id: {field: delta}}, {doc_id: {field: value}} -> doc ids that are
+# done (None: all of them); raising means none were written
+FlushCallback = Callable[[Dict[str, Dict[str, int]], Dict[str, Dict[str, Any]]], Optional[Iterable[str]]]
+
+
+class CounterAggregator:
+    """Locally applied, periodically flushed counter increments and field sets."""
+
+    def __init__(
+        self,
+        flush: FlushCallback,
+        interval: float = 0.25,
+        max_events: int = 100,
+        base_ttl: float = 30,
+    ):
+        self._flush = flush
+        self.interval = interval
+        self.max_events = max_events
+        self.base_ttl = base_ttl
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._wake = threading.Event()
+        # Last known document state (as read, plus our flushed changes) and when it was loaded
+        self._base: Dict[str, Tuple[dict, float]] = {}
+        self._increments: Dict[str, Dict[str, int]] = {}
+        self._sets: Dict[str, Dict[str, Any]] = {}
+        # The batch handed to the flush callback, still shown by reads until it is part of the base
+        self._flushing: Tuple[Dict[str, Dict[str, int]], Dict[str, Dict[str, Any]]] = ({}, {})
+        self._pending_events = 0
+        self.events = 0
+        self.flushes = 0
+        self.documents_flushed = 0
+        self.failures = 0
+        self._thread: Optional[threading.Thread] = None
+
+    def view(self, doc_id: str, load: Callable[[], Optional[dict]]) -> Optional[dict]:
+        """Document merged with unflushed changes; ``load()`` is only called when the base is missing or stale."""
+        with self._lock:
+            entry = self._base.get(doc_id)
+            fresh = entry is not None and time.time() - entry[1] < self.base_ttl
+        if not fresh:
+            with self._flush_lock:
+                document = load()
+                if document is None:
+                    return None
+                with self._lock:
+                    self._base[doc_id] = (dict(document), time.time())
+        with self._lock:
+            return self._merged(doc_id)
+
+    def apply(
+        self,
+        doc_id: str,
+        increments: Optional[Dict[str, int]] = None,
+        sets: Optional[Dict[str, Any]] = None,
+    ) -> dict:
+        """Record changes to ``doc_id`` for the next flush and return its merged state."""
+        with self._lock:
+            pending = self._increments.setdefault(doc_id, {})
+            for field, delta in (increments or {}).items():
+                pending[field] = pending.get(field, 0) + delta
+            if sets:
+                self._sets.setdefault(doc_id, {}).update(sets)
+            self._pending_events += 1
+            self.events += 1
+            merged = self._merged(doc_id)
+            full = self._pending_events >= self.max_events
+        self._ensure_thread()
+        if full:
+            self._wake.set()
+        return merged
+
+    def flush_now(self) -> int:
+        """Flush pending changes synchronously (also used at shutdown). Returns documents written."""
+        with self._flush_lock:
+            with self._lock:
+                increments, sets = self._increments, self._sets
+                self._increments, self._sets = {}, {}
+                self._flushing = (increments, sets)
+                self._pending_events = 0
+            doc_ids = set(increments) | set(sets)
+            if not doc_ids:
+                return 0
+            try:
+                done = self._flush(increments, sets)
+                committed = set(doc_ids) if done is None else set(done) & doc_ids
+            except Exception as e:
+                logger.error(f"Counter flush failed ({len(doc_ids)} documents): {str(e)}")
+                committed = set()
+
+            with self._lock:
+                failed = doc_ids - committed
+                if failed:
+                    # Put them back in front of anything recorded meanwhile; retried next window
+                    self.failures += 1
+                    for doc_id in failed:
+                        pending = self._increments.setdefault(doc_id, {})
+                        for field, delta in increments.get(doc_id, {}).items():
+                            pending[field] = pending.get(field, 0) + delta
+                        if doc_id in sets:
+                            self._sets[doc_id] = {**sets[doc_id], **self._sets.get(doc_id, {})}
+                    self._pending_events += len(failed)
+                # The flushed changes are now part of the stored document
+                for doc_id in committed:
+                    entry = self._base.get(doc_id)
+                    if entry is None:
+                        continue
+                    document = entry[0]
+                    for field, delta in increments.get(doc_id, {}).items():
+                        document[field] = (document.get(field) or 0) + delta
+                    document.update(sets.get(doc_id, {}))
+                self._flushing = ({}, {})
+                if committed:
+                    self.flushes += 1
+                    self.documents_flushed += len(committed)
+            return len(committed)
+
+    def stats(self) -> Dict[str, Any]:
+        """Event and flush counts for /metrics."""
+        with self._lock:
+            return {
+                "events": self.events,
+                "pending_events": self._pending_events,
+                "flushes": self.flushes,
+                "documents_flushed": self.documents_flushed,
+                "writes_saved": max(0, self.events - self.documents_flushed),
+                "failures": self.failures,
+                "interval_seconds": self.interval,
+                "max_events": self.max_events,
+            }
+
+    def _merged(self, doc_id: str) -> dict:
+        entry = self._base.get(doc_id)
+        merged = dict(entry[0]) if entry else {}
+        for increments, sets in (self._flushing, (self._increments, self._sets)):
+            for field, delta in increments.get(doc_id, {}).items():
+                merged[field] = (merged.get(field) or 0) + delta
+            merged.update(sets.get(doc_id, {}))
+        return merged
+
+    def _ensure_thread(self) -> None:
+        if self._thread is None or not self._thread.is_alive():
+            with self._lock:
+                if self._thread is None or not self._thread.is_alive():
+                    self._thread = threading.Thread(target=self._run, name="counter-flush", daemon=True)
+                    self._thread.start()
+
+    def _run(self) -> None:
+        while True:
+            self._wake.wait(self.interval)
+            self._wake.clear()
+            self.flush_now()
@@ -0,0 +1,79 @@
+"""In-process stand-in for the ``replicate`` client.
+
+Set ``LINEUP_FAKE_REPLICATE=1`` to run the full try-on job flow (prediction
+creation, status polling, output download) without a Replicate account or
+network access. Predictions step through ``starting`` -> ``processing`` ->
+``succeeded`` and return the input image as a ``data:`` URI.
+"""
+
+from __future__ import annotations
+
+import itertools
+import time
+from typing import Any, Dict, Optional
+
+
+class FakePrediction:
+    """Mimics ``replicate.prediction.Prediction`` (status, output, error, reload, cancel)."""
+
+    _ids = itertools.count(1)
+
+    def __init__(self, version: str, input: Dict[str, Any], steps: int = 2, delay: float = 0.0, fail: bool = False):
+        self.id = f"fake-{next(self._ids)}"
+        self.version = version
+        self.input = input
+        self.status = "starting"
+        self.output: Optional[Any] = None
+        self.error: Optional[str] = None
+        self._remaining = steps
+        self._delay = delay
+        self._fail = fail
+
+    def reload(self) -> None:
+        if self.status in ("succeeded", "failed", "canceled"):
+            return
+        if self._delay:
+            time.sleep(self._delay)
+        self._remaining -= 1
+        if self._remaining > 0:
+            self.status = "processing"
+        elif self._fail:
+            self.status = "failed"
+            self.error = "Fake prediction failure"
+        else:
+            self.status = "succeeded"
+            self.output = self.input.get("input_image")
+
+    def wait(self) -> None:
+        while self.status not in ("succeeded", "failed", "canceled"):
+            self.reload()
+
+    def cancel(self) -> None:
+        self.status = "canceled"
+
+
+class FakePredictions:
+    def __init__(self, client: "FakeReplicate"):
+        self._client = client
+
+    def create(self, version: str, input: Dict[str, Any], **kwargs: Any) -> FakePrediction:
+        self._client.created += 1
+        return FakePrediction(version, input, steps=self._client.steps, delay=self._client.delay, fail=self._client.fail)
+
+
+class FakeReplicate:
+    """Drop-in for the ``replicate`` module's ``predictions.create`` and ``run``."""
+
+    def __init__(self, steps: int = 2, delay: float = 0.0, fail: bool = False):
+        self.steps = steps
+        self.delay = delay
+        self.fail = fail
+        self.created = 0
+        self.predictions = FakePredictions(self)
+
+    def run(self, ref: str, input: Dict[str, Any], **kwargs: Any) -> Any:
+        prediction = self.predictions.create(ref.split(":")[-1], input)
+        prediction.wait()
+        if prediction.status != "succeeded":
+            raise RuntimeError(prediction.error or "Prediction failed")
+        return prediction.output
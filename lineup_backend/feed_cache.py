@@ -0,0 +1,88 @@
+"""Read-through cache of social feed pages served from Firestore.
+
+Every ``GET /social`` page is an ordered Firestore query billed per document
+returned. :class:`FeedPageCache` keeps recent pages keyed by
+``(limit, cursor)``. Writes made by this process keep it exact: a new post
+clears it (every page shifts), and likes, shares and comment counts are
+patched into the cached copies in place. Other gunicorn workers' writes are
+only picked up when the short TTL expires.
+"""
+
+from __future__ import annotations
+
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, Hashable, List, Optional, Tuple
+
+
+class FeedPageCache:
+    """Bounded, TTL-bound LRU of ``(posts, next_cursor)`` feed pages."""
+
+    def __init__(self, max_entries: int = 64, ttl_seconds: float = 15):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        # key -> (posts, next_cursor, documents read to build it, stored_at)
+        self._pages: "OrderedDict[Hashable, Tuple[List[dict], Optional[str], int, float]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.reads_saved = 0
+        self.invalidations = 0
+        self.patches = 0
+
+    def get(self, key: Hashable) -> Optional[Tuple[List[dict], Optional[str]]]:
+        """Cached ``(posts, next_cursor)`` for ``key``, or None if missing or expired."""
+        with self._lock:
+            entry = self._pages.get(key)
+            if entry is None or time.time() - entry[3] >= self.ttl_seconds:
+                if entry is not None:
+                    del self._pages[key]
+                self.misses += 1
+                return None
+            self._pages.move_to_end(key)
+            self.hits += 1
+            self.reads_saved += entry[2]
+            return entry[0], entry[1]
+
+    def put(self, key: Hashable, posts: List[dict], next_cursor: Optional[str], documents_read: int) -> None:
+        with self._lock:
+            self._pages[key] = (posts, next_cursor, documents_read, time.time())
+            self._pages.move_to_end(key)
+            while len(self._pages) > self.max_entries:
+                self._pages.popitem(last=False)
+
+    def invalidate(self) -> None:
+        """Drop every page (a new post shifts them all)."""
+        with self._lock:
+            self._pages.clear()
+            self.invalidations += 1
+
+    def patch(self, post_id: str, fields: Dict[str, Any]) -> int:
+        """Apply ``fields`` to every cached copy of ``post_id``. Returns the number of copies updated."""
+        updated = 0
+        with self._lock:
+            for posts, _, _, _ in self._pages.values():
+                for post in posts:
+                    if str(post.get("id")) == str(post_id):
+                        post.update(fields)
+                        updated += 1
+            if updated:
+                self.patches += 1
+        return updated
+
+    def stats(self) -> Dict[str, Any]:
+        """Size, hit counts and Firestore reads saved, for /metrics."""
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                "size": len(self._pages),
+                "max_size": self.max_entries,
+                "ttl_seconds": self.ttl_seconds,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": round(self.hits / total, 3) if total else 0.0,
+                "firestore_reads_saved": self.reads_saved,
+                "invalidations": self.invalidations,
+                "patches": self.patches,
+            }
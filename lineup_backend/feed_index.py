@@ -0,0 +1,90 @@
+"""Timestamp-ordered index over the in-memory social feed.
+
+``GET /social`` used to sort every post on each request and return all of
+them. :class:`FeedIndex` keeps ``(timestamp, id)`` keys sorted as posts are
+inserted (``bisect``), so a page is a slice that ends at the cursor position
+and costs the same however long the feed gets. Cursors are opaque strings that
+encode the key of the last post on the previous page.
+"""
+
+from __future__ import annotations
+
+import base64
+import binascii
+import bisect
+import json
+import threading
+from typing import Dict, List, Optional, Tuple
+
+FeedKey = Tuple[str, str]
+
+
+def encode_cursor(timestamp: str, post_id: str) -> str:
+    """Opaque, URL-safe cursor pointing just past the given post."""
+    raw = json.dumps([timestamp, post_id], separators=(",", ":")).encode("utf-8")
+    return base64.urlsafe_b64encode(raw).decode("ascii").rstrip("=")
+
+
+def decode_cursor(cursor: str) -> FeedKey:
+    """``(timestamp, id)`` from :func:`encode_cursor`; raises ValueError if malformed."""
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4))
+        timestamp, post_id = json.loads(raw)
+    except (binascii.Error, ValueError, TypeError) as e:
+        raise ValueError(f"Invalid cursor: {str(e)}")
+    if not isinstance(timestamp, str) or not isinstance(post_id, str):
+        raise ValueError("Invalid cursor")
+    return timestamp, post_id
+
+
+def _key(post: dict) -> FeedKey:
+    return str(post.get("timestamp", "")), str(post.get("id", ""))
+
+
+class FeedIndex:
+    """Posts ordered newest-first by ``(timestamp, id)``, paginated by cursor."""
+
+    def __init__(self):
+        self._keys: List[FeedKey] = []  # ascending; pages are read from the end
+        self._entries: Dict[str, Tuple[FeedKey, dict]] = {}  # id -> (key it was indexed under, post)
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self._keys)
+
+    def add(self, post: dict) -> None:
+        """Index ``post`` (the same dict the feed holds, so later edits show up), replacing any old copy."""
+        with self._lock:
+            self._discard(str(post.get("id", "")))
+            key = _key(post)
+            bisect.insort(self._keys, key)
+            self._entries[key[1]] = (key, post)
+
+    def remove(self, post_id: str) -> None:
+        with self._lock:
+            self._discard(str(post_id))
+
+    def rebuild(self, posts: List[dict]) -> None:
+        """Replace the index contents (startup / mock data reset)."""
+        with self._lock:
+            self._entries = {str(post.get("id", "")): (_key(post), post) for post in posts}
+            self._keys = sorted(key for key, _ in self._entries.values())
+
+    def page(self, limit: int, before: Optional[FeedKey] = None) -> Tuple[List[dict], Optional[str]]:
+        """Up to ``limit`` posts older than ``before`` (newest first) and the cursor for the next page."""
+        with self._lock:
+            end = bisect.bisect_left(self._keys, before) if before else len(self._keys)
+            start = max(0, end - limit)
+            keys = self._keys[start:end][::-1]
+            posts = [self._entries[post_id][1] for _, post_id in keys]
+        next_cursor = encode_cursor(*keys[-1]) if start > 0 and keys else None
+        return posts, next_cursor
+
+    def _discard(self, post_id: str) -> None:
+        entry = self._entries.pop(post_id, None)
+        if entry is None:
+            return
+        key = entry[0]
+        index = bisect.bisect_left(self._keys, key)
+        if index < len(self._keys) and self._keys[index] == key:
+            del self._keys[index]
@@ -0,0 +1,178 @@
+"""Follow graph and precomputed home timelines.
+
+Follow relationships used to be ``{user: [followed users]}`` lists (linear
+membership checks, a list rebuild per unfollow), and there was no feed of
+posts from followed accounts. :class:`FollowGraph` keeps follower and followee
+adjacency sets and a bounded, newest-first timeline per user:
+
+* fan-out on write: a post by an account with at most ``fanout_max_followers``
+  followers is pushed into each follower's timeline when it is published;
+* fan-out on read: posts by accounts above that threshold are not copied;
+  each author keeps a bounded list of recent posts that is merged into a
+  follower's page when it is read.
+
+An author who once published above the threshold stays merged on read even
+after dropping back below it, because the posts from that period exist only
+in their own list.
+
+A home page is then a slice of the user's own timeline plus a merge with the
+few high-follower accounts they follow, with cost proportional to the page
+size rather than to the number of posts or followees. Entries are the feed's
+own post dicts, so like and comment counts stay current.
+"""
+
+from __future__ import annotations
+
+import bisect
+import heapq
+import threading
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Set, Tuple
+
+from lineup_backend.feed_index import FeedKey, encode_cursor
+
+Entry = Tuple[FeedKey, dict]
+
+
+def _key(post: dict) -> FeedKey:
+    return str(post.get("timestamp", "")), str(post.get("id", ""))
+
+
+def _insert(entries: List[Entry], entry: Entry, limit: int) -> None:
+    """Insert into an ascending entry list (once per key), dropping the oldest beyond ``limit``."""
+    if not entries or entry[0] > entries[-1][0]:
+        entries.append(entry)  # the common case: newer than everything held
+    else:
+        # (key,) sorts just before (key, post), so posts themselves are never compared
+        position = bisect.bisect_left(entries, (entry[0],))
+        if position < len(entries) and entries[position][0] == entry[0]:
+            return
+        entries.insert(position, entry)
+    if len(entries) > limit:
+        del entries[:len(entries) - limit]
+
+
+def _newest_first(entries: List[Entry], before: Optional[FeedKey]) -> Iterator[Entry]:
+    end = bisect.bisect_left(entries, (before,)) if before else len(entries)
+    return (entries[i] for i in range(end - 1, -1, -1))
+
+
+class FollowGraph:
+    """Follower/followee sets with hybrid fan-out home timelines."""
+
+    def __init__(self, fanout_max_followers: int = 1000, timeline_size: int = 500, author_posts: int = 200):
+        self.fanout_max_followers = fanout_max_followers
+        self.timeline_size = timeline_size
+        self.author_posts = author_posts
+        self._following: Dict[str, Set[str]] = {}
+        self._followers: Dict[str, Set[str]] = {}
+        self._timelines: Dict[str, List[Entry]] = {}  # user -> ascending (key, post), fanned-out posts
+        self._by_author: Dict[str, List[Entry]] = {}  # author -> ascending (key, post), recent posts
+        self._unfanned: Set[str] = set()  # authors with posts that were never fanned out
+        self._lock = threading.Lock()
+        self.fanout_writes = 0
+        self.read_merges = 0
+
+    def is_fanout_author(self, author: str) -> bool:
+        return len(self._followers.get(author, ())) <= self.fanout_max_followers
+
+    def following(self, user: str) -> Set[str]:
+        with self._lock:
+            return set(self._following.get(user, ()))
+
+    def followers(self, user: str) -> Set[str]:
+        with self._lock:
+            return set(self._followers.get(user, ()))
+
+    def follow(self, follower: str, followee: str) -> bool:
+        """Add the edge and backfill the followee's recent posts. Returns False if it already existed."""
+        with self._lock:
+            followees = self._following.setdefault(follower, set())
+            if followee in followees or follower == followee:
+                return False
+            followees.add(followee)
+            self._followers.setdefault(followee, set()).add(follower)
+            # Backfilled whatever the follower count (bounded by author_posts), so the timeline
+            # stays complete if the followee later drops back under the fan-out threshold
+            timeline = self._timelines.setdefault(follower, [])
+            for entry in self._by_author.get(followee, [])[-self.timeline_size:]:
+                _insert(timeline, entry, self.timeline_size)
+            return True
+
+    def unfollow(self, follower: str, followee: str) -> bool:
+        """Remove the edge and the followee's posts from the follower's timeline. Returns False if absent."""
+        with self._lock:
+            followees = self._following.get(follower)
+            if not followees or followee not in followees:
+                return False
+            followees.discard(followee)
+            self._followers.get(followee, set()).discard(follower)
+            timeline = self._timelines.get(follower)
+            if timeline:
+                timeline[:] = [entry for entry in timeline if entry[1].get("username") != followee]
+            return True
+
+    def publish(self, post: dict) -> int:
+        """Record a new post; fans it out to followers unless the author is over the threshold. Returns copies written."""
+        author = str(post.get("username", ""))
+        entry = (_key(post), post)
+        with self._lock:
+            _insert(self._by_author.setdefault(author, []), entry, self.author_posts)
+            if not self.is_fanout_author(author):
+                self._unfanned.add(author)
+                return 0
+            followers = self._followers.get(author, ())
+            for follower in followers:
+                _insert(self._timelines.setdefault(follower, []), entry, self.timeline_size)
+            self.fanout_writes += len(followers)
+            return len(followers)
+
+    def home(self, user: str, limit: int, before: Optional[FeedKey] = None) -> Tuple[List[dict], Optional[str]]:
+        """Up to ``limit`` posts from accounts ``user`` follows, newest first, and the next-page cursor."""
+        with self._lock:
+            sources = [_newest_first(self._timelines.get(user, []), before)]
+            for followee in self._following.get(user, ()):
+                if followee in self._unfanned:
+                    sources.append(_newest_first(self._by_author.get(followee, []), before))
+            if len(sources) > 1:
+                self.read_merges += 1
+            page, seen = [], set()
+            # A post can be in both the timeline and its author's list (fanned out before the
+            # author crossed the threshold); one extra entry tells us whether there is a next page
+            for key, post in heapq.merge(*sources, key=lambda item: item[0], reverse=True):
+                if key in seen:
+                    continue
+                seen.add(key)
+                page.append((key, post))
+                if len(page) > limit:
+                    break
+        next_cursor = encode_cursor(*page[limit - 1][0]) if len(page) > limit else None
+        return [post for _, post in page[:limit]], next_cursor
+
+    def reset(self, follows: Dict[str, Iterable[str]], posts: Iterable[dict] = ()) -> None:
+        """Replace the graph (mock data / restarts) and rebuild timelines from ``posts``."""
+        with self._lock:
+            self._following.clear()
+            self._followers.clear()
+            self._timelines.clear()
+            self._by_author.clear()
+            self._unfanned.clear()
+        for follower, followees in follows.items():
+            for followee in followees:
+                self.follow(follower, followee)
+        for post in sorted(posts, key=_key):
+            self.publish(post)
+
+    def stats(self) -> Dict[str, Any]:
+        """Graph and timeline sizes for /metrics."""
+        with self._lock:
+            return {
+                "users": len(set(self._following) | set(self._followers)),
+                "edges": sum(len(followees) for followees in self._following.values()),
+                "timelines": len(self._timelines),
+                "timeline_entries": sum(len(timeline) for timeline in self._timelines.values()),
+                "fanout_writes": self.fanout_writes,
+                "read_merges": self.read_merges,
+                "read_merge_authors": len(self._unfanned),
+                "fanout_max_followers": self.fanout_max_followers,
+                "timeline_size": self.timeline_size,
+            }
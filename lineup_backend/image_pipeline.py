@@ -0,0 +1,237 @@
+"""Shared ingestion pipeline for user-uploaded photos.
+
+Every endpoint that accepts a base64 photo (analysis, moderation, social posts
+and virtual try-on) goes through :func:`ingest_base64_image`. The upload is
+decoded exactly once, checked against byte and pixel budgets *before* the
+pixel data is decompressed, rotated according to its EXIF orientation and then
+handed out as downscaled, re-encoded variants sized for each upstream.
+"""
+
+from __future__ import annotations
+
+import base64
+import binascii
+import hashlib
+import logging
+import os
+from dataclasses import dataclass, field
+from io import BytesIO
+from typing import Dict, Optional, Tuple
+
+from PIL import Image, ImageOps
+
+logger = logging.getLogger(__name__)
+
+# Budgets enforced before the full decode (decompression-bomb protection)
+MAX_UPLOAD_BYTES = int(os.environ.get("LINEUP_MAX_UPLOAD_BYTES", 12 * 1024 * 1024))
+MAX_UPLOAD_PIXELS = int(os.environ.get("LINEUP_MAX_UPLOAD_PIXELS", 40_000_000))
+
+# Longest edge (in pixels) each upstream consumer actually needs
+ANALYSIS_MAX_EDGE = 1024
+MODERATION_MAX_EDGE = 512
+TRYON_MAX_EDGE = 1024
+STORAGE_MAX_EDGE = 1600
+THUMBNAIL_MAX_EDGE = 320
+
+DEFAULT_JPEG_QUALITY = 85
+
+
+class ImageIngestError(ValueError):
+    """Raised when an upload cannot be decoded or exceeds the configured budgets."""
+
+
+def strip_data_url(data: str) -> str:
+    """Remove a ``data:image/...;base64,`` prefix if present."""
+    if ',' in data:
+        return data.split(',', 1)[1]
+    return data
+
+
+@dataclass
+class IngestedImage:
+    """A decoded, orientation-corrected upload with cached resized variants."""
+
+    image: Image.Image
+    source_format: Optional[str] = None
+    source_bytes: int = 0
+    _variants: Dict[int, Image.Image] = field(default_factory=dict, repr=False)
+    _encoded: Dict[Tuple[int, str, int], bytes] = field(default_factory=dict, repr=False)
+    _phash: Optional[int] = field(default=None, repr=False)
+    _content_hash: Optional[str] = field(default=None, repr=False)
+
+    @property
+    def size(self) -> Tuple[int, int]:
+        return self.image.size
+
+    def resized(self, max_edge: int) -> Image.Image:
+        """Return the image scaled down so its longest edge is at most ``max_edge``."""
+        if max(self.image.size) <= max_edge:
+            return self.image
+        if max_edge not in self._variants:
+            variant = self.image.copy()
+            variant.thumbnail((max_edge, max_edge), Image.LANCZOS)
+            self._variants[max_edge] = variant
+        return self._variants[max_edge]
+
+    def encode(self, max_edge: int, format: str = "JPEG", quality: int = DEFAULT_JPEG_QUALITY) -> bytes:
+        """Encode the ``max_edge`` variant as compact JPEG/WebP bytes (memoized)."""
+        key = (max_edge, format.upper(), quality)
+        if key not in self._encoded:
+            buffer = BytesIO()
+            self.resized(max_edge).save(buffer, format=format.upper(), quality=quality)
+            self._encoded[key] = buffer.getvalue()
+        return self._encoded[key]
+
+    def to_base64(self, max_edge: int, format: str = "JPEG", quality: int = DEFAULT_JPEG_QUALITY) -> str:
+        """Base64 string of :meth:`encode`."""
+        return base64.b64encode(self.encode(max_edge, format, quality)).decode('utf-8')
+
+    def to_data_uri(self, max_edge: int, format: str = "JPEG", quality: int = DEFAULT_JPEG_QUALITY) -> str:
+        """``data:`` URI of :meth:`encode` (used for Replicate inputs)."""
+        mime_type = f"image/{format.lower()}"
+        return f"data:{mime_type};base64,{self.to_base64(max_edge, format, quality)}"
+
+    def gemini_part(self, max_edge: int, quality: int = DEFAULT_JPEG_QUALITY) -> dict:
+        """Inline blob for ``model.generate_content`` (avoids the SDK re-encoding a full-size image)."""
+        return {"mime_type": "image/jpeg", "data": self.encode(max_edge, "JPEG", quality)}
+
+    @property
+    def phash(self) -> int:
+        """64-bit perceptual (difference) hash of the normalized image."""
+        if self._phash is None:
+            self._phash = perceptual_hash(self.image)
+        return self._phash
+
+    @property
+    def content_hash(self) -> str:
+        """SHA-256 of the normalized pixels (identical for exact re-posts of a file)."""
+        if self._content_hash is None:
+            digest = hashlib.sha256(f"{self.image.size[0]}x{self.image.size[1]}:".encode())
+            digest.update(self.image.tobytes())
+            self._content_hash = digest.hexdigest()
+        return self._content_hash
+
+
+def perceptual_hash(image: Image.Image, hash_size: int = 8) -> int:
+    """Compute a difference hash (dHash) that survives re-encoding and resizing.
+
+    The image is reduced to a ``(hash_size + 1) x hash_size`` grayscale
+    thumbnail and each bit records whether a pixel is brighter than its right
+    neighbour. Near-identical photos differ in only a few bits.
+    """
+    small = image.convert('L').resize((hash_size + 1, hash_size), Image.BILINEAR)
+    pixels = list(small.getdata())
+    value = 0
+    for row in range(hash_size):
+        offset = row * (hash_size + 1)
+        for col in range(hash_size):
+            value = (value << 1) | (pixels[offset + col] > pixels[offset + col + 1])
+    return value
+
+
+def hamming_distance(a: int, b: int) -> int:
+    """Number of differing bits between two perceptual hashes."""
+    return bin(a ^ b).count('1')
+
+
+def ingest_image_bytes(
+    image_bytes: bytes,
+    max_bytes: int = MAX_UPLOAD_BYTES,
+    max_pixels: int = MAX_UPLOAD_PIXELS,
+    max_edge: int = STORAGE_MAX_EDGE,
+) -> IngestedImage:
+    """Decode raw image bytes into an :class:`IngestedImage`.
+
+    Only the image header is read before the byte and pixel budgets are
+    checked, so oversized or malicious uploads are rejected without
+    allocating their full pixel buffer. JPEGs are decoded directly at a
+    reduced scale when ``max_edge`` allows it.
+    """
+    if not image_bytes:
+        raise ImageIngestError("Empty image data")
+    if len(image_bytes) > max_bytes:
+        raise ImageIngestError(f"Image is too large ({len(image_bytes)} bytes, limit {max_bytes})")
+
+    try:
+        img = Image.open(BytesIO(image_bytes))
+    except Exception as e:
+        raise ImageIngestError(f"Invalid image data: {str(e)}")
+
+    width, height = img.size
+    if width <= 0 or height <= 0 or width * height > max_pixels:
+        raise ImageIngestError(f"Image dimensions {width}x{height} exceed the {max_pixels} pixel limit")
+
+    source_format = img.format
+    try:
+        # Let the JPEG decoder skip work we would throw away when downscaling
+        img.draft('RGB', (max_edge, max_edge))
+        img.load()
+        img = ImageOps.exif_transpose(img)
+        if img.mode != 'RGB':
+            img = img.convert('RGB')
+    except Exception as e:
+        raise ImageIngestError(f"Invalid image data: {str(e)}")
+
+    if max(img.size) > max_edge:
+        img.thumbnail((max_edge, max_edge), Image.LANCZOS)
+
+    logger.info(f"Ingested {source_format} image {width}x{height} -> {img.size[0]}x{img.size[1]} ({len(image_bytes)} bytes)")
+    return IngestedImage(image=img, source_format=source_format, source_bytes=len(image_bytes))
+
+
+def ingest_base64_image(
+    data: str,
+    max_bytes: int = MAX_UPLOAD_BYTES,
+    max_pixels: int = MAX_UPLOAD_PIXELS,
+    max_edge: int = STORAGE_MAX_EDGE,
+) -> IngestedImage:
+    """Decode a (optionally ``data:``-prefixed) base64 upload exactly once."""
+    if not data:
+        raise ImageIngestError("Empty image data")
+
+    encoded = strip_data_url(data).strip()
+    # Reject by the encoded length before allocating the decoded buffer
+    if len(encoded) * 3 // 4 > max_bytes:
+        raise ImageIngestError(f"Image is too large (limit {max_bytes} bytes)")
+
+    try:
+        image_bytes = base64.b64decode(encoded)
+    except (binascii.Error, ValueError) as e:
+        raise ImageIngestError(f"Invalid base64 image data: {str(e)}")
+
+    return ingest_image_bytes(image_bytes, max_bytes=max_bytes, max_pixels=max_pixels, max_edge=max_edge)
+
+
+def transcode_image(
+    image_bytes: bytes,
+    format: str = "WEBP",
+    quality: int = DEFAULT_JPEG_QUALITY,
+    max_edge: int = STORAGE_MAX_EDGE,
+) -> bytes:
+    """Re-encode a generated image (e.g. a lossless model PNG) into a compact delivery format."""
+    try:
+        img = Image.open(BytesIO(image_bytes))
+        img.draft('RGB', (max_edge, max_edge))
+        img.load()
+        if img.mode != 'RGB':
+            img = img.convert('RGB')
+    except Exception as e:
+        raise ImageIngestError(f"Invalid image data: {str(e)}")
+
+    if max(img.size) > max_edge:
+        img.thumbnail((max_edge, max_edge), Image.LANCZOS)
+
+    buffer = BytesIO()
+    img.save(buffer, format=format.upper(), quality=quality)
+    return buffer.getvalue()
+
+
+def image_mime_type(image_bytes: bytes) -> str:
+    """MIME type of encoded image bytes, sniffed from the file signature."""
+    if image_bytes[:3] == b'\xff\xd8\xff':
+        return "image/jpeg"
+    if image_bytes[:8] == b'\x89PNG\r\n\x1a\n':
+        return "image/png"
+    if image_bytes[:4] == b'RIFF' and image_bytes[8:12] == b'WEBP':
+        return "image/webp"
+    return "application/octet-stream"
@@ -2,5 +2,7 @@
 
 from .error_handler import register_error_handlers
 from .cors import configure_cors
+from .conditional_get import ConditionalGet
+from .compression import ResponseCompressor
 
-__all__ = ["register_error_handlers", "configure_cors"]
+__all__ = ["register_error_handlers", "configure_cors", "ConditionalGet", "ResponseCompressor"]
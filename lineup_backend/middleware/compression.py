@@ -0,0 +1,203 @@
+"""Negotiated gzip / brotli compression for JSON and text responses.
+
+Feed, portfolio, barber search and try-on responses (base64 images, embedded
+reviews) routinely run to hundreds of KB and went out uncompressed to mobile
+clients. :class:`ResponseCompressor` compresses any buffered response above
+``min_size`` with the best encoding the client accepts (brotli when the
+optional ``brotli`` package is installed, else gzip) and marks it
+``Vary: Accept-Encoding``.
+
+Compressed bytes are reused rather than recomputed:
+
+* pre-serialized payloads (:mod:`lineup_backend.response_cache`) keep their
+  compressed variants next to the JSON bytes, see :meth:`ResponseCompressor.compress_payload`;
+* other responses that carry an ETag (see :mod:`.conditional_get`) are kept in
+  a small LRU keyed by ``(etag, encoding)``, so repeated polls of an unchanged
+  resource by clients without a cached copy do not recompress it.
+
+Compression ratio and CPU time per encoding are reported via :meth:`stats`.
+Register the compressor before :class:`~.conditional_get.ConditionalGet`:
+after-request hooks run in reverse order, so the 304 decision is taken on the
+uncompressed body first.
+"""
+
+from __future__ import annotations
+
+import gzip
+import logging
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, Optional, Tuple
+
+from flask import Flask, Response, request
+
+logger = logging.getLogger(__name__)
+
+# Brotli (optional - gzip is always available)
+try:
+    import brotli
+    BROTLI_AVAILABLE = True
+except ImportError:
+    brotli = None
+    BROTLI_AVAILABLE = False
+
+COMPRESSIBLE_MIMETYPES = (
+    "application/json",
+    "application/javascript",
+    "image/svg+xml",
+    "text/",
+)
+
+
+def compress_bytes(data: bytes, encoding: str, gzip_level: int = 6, brotli_quality: int = 5) -> bytes:
+    if encoding == "br":
+        return brotli.compress(data, quality=brotli_quality)
+    return gzip.compress(data, compresslevel=gzip_level, mtime=0)
+
+
+class ResponseCompressor:
+    """after_request compression with reuse of already-compressed bodies."""
+
+    def __init__(
+        self,
+        app: Optional[Flask] = None,
+        min_size: int = 1024,
+        gzip_level: int = 6,
+        brotli_quality: int = 5,
+        cache_bytes: int = 16 * 1024 * 1024,
+    ):
+        self.min_size = min_size
+        self.gzip_level = gzip_level
+        self.brotli_quality = brotli_quality
+        self.cache_bytes = cache_bytes
+        self.encodings = ("br", "gzip") if BROTLI_AVAILABLE else ("gzip",)
+        self._cache: "OrderedDict[Tuple[str, str], bytes]" = OrderedDict()
+        self._cache_size = 0
+        self._lock = threading.Lock()
+        # encoding -> counters
+        self._stats: Dict[str, Dict[str, float]] = {}
+        self.skipped_small = 0
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app: Flask) -> None:
+        app.after_request(self._after_request)
+
+    def negotiate(self) -> Optional[str]:
+        """Best encoding the client accepts (honouring q-values), or None."""
+        return request.accept_encodings.best_match(self.encodings)
+
+    def compress_payload(self, response: Response, variants: Dict[str, bytes]) -> Response:
+        """Compress a pre-serialized response, storing the result in ``variants`` (encoding -> bytes)."""
+        encoding = self._eligible(response)
+        if encoding is None:
+            return response
+        body = variants.get(encoding)
+        if body is None:
+            body = self._compress(response.get_data(), encoding)
+            variants[encoding] = body
+        else:
+            self._record(encoding, len(response.get_data()), len(body), 0.0, reused=True)
+        return self._apply(response, encoding, body)
+
+    def stats(self) -> Dict[str, Any]:
+        """Compression ratio, CPU time and reuse counts per encoding, for /metrics."""
+        with self._lock:
+            encodings = {}
+            for encoding, counters in self._stats.items():
+                compressed = counters["responses"] - counters["reused"]
+                encodings[encoding] = {
+                    "responses": int(counters["responses"]),
+                    "reused": int(counters["reused"]),
+                    "bytes_in": int(counters["bytes_in"]),
+                    "bytes_out": int(counters["bytes_out"]),
+                    "ratio": round(counters["bytes_out"] / counters["bytes_in"], 3) if counters["bytes_in"] else 0.0,
+                    "cpu_ms_total": round(counters["cpu_ms"], 2),
+                    "cpu_ms_avg": round(counters["cpu_ms"] / compressed, 3) if compressed else 0.0,
+                }
+            return {
+                "encodings": encodings,
+                "available": list(self.encodings),
+                "min_size": self.min_size,
+                "skipped_small": self.skipped_small,
+                "cache_entries": len(self._cache),
+                "cache_bytes": self._cache_size,
+            }
+
+    def _eligible(self, response: Response) -> Optional[str]:
+        if (
+            response.status_code < 200
+            or response.status_code in (204, 206, 304)
+            or response.direct_passthrough
+            or response.is_streamed
+            or "Content-Encoding" in response.headers
+            or not (response.mimetype or "").startswith(COMPRESSIBLE_MIMETYPES)
+        ):
+            return None
+        response.vary.add("Accept-Encoding")
+        if response.content_length is not None and response.content_length < self.min_size:
+            with self._lock:
+                self.skipped_small += 1
+            return None
+        return self.negotiate()
+
+    def _after_request(self, response: Response) -> Response:
+        encoding = self._eligible(response)
+        if encoding is None:
+            return response
+
+        etag, weak = response.get_etag()
+        key = (f"{'W/' if weak else ''}{etag}", encoding) if etag else None
+        body = None
+        if key:
+            with self._lock:
+                body = self._cache.get(key)
+                if body is not None:
+                    self._cache.move_to_end(key)
+        data = response.get_data()
+        if body is None:
+            body = self._compress(data, encoding)
+            if key:
+                self._store(key, body)
+        else:
+            self._record(encoding, len(data), len(body), 0.0, reused=True)
+        return self._apply(response, encoding, body)
+
+    def _compress(self, data: bytes, encoding: str) -> bytes:
+        start = time.thread_time()
+        body = compress_bytes(data, encoding, self.gzip_level, self.brotli_quality)
+        self._record(encoding, len(data), len(body), (time.thread_time() - start) * 1000, reused=False)
+        return body
+
+    def _apply(self, response: Response, encoding: str, body: bytes) -> Response:
+        etag, weak = response.get_etag()
+        response.set_data(body)
+        response.headers["Content-Encoding"] = encoding
+        if etag and not weak:
+            # Same resource, different bytes: the strong validator no longer describes them
+            response.set_etag(etag, weak=True)
+        return response
+
+    def _store(self, key: Tuple[str, str], body: bytes) -> None:
+        if len(body) > self.cache_bytes // 8:
+            return
+        with self._lock:
+            if key in self._cache:
+                return
+            self._cache[key] = body
+            self._cache_size += len(body)
+            while self._cache_size > self.cache_bytes:
+                _, evicted = self._cache.popitem(last=False)
+                self._cache_size -= len(evicted)
+
+    def _record(self, encoding: str, bytes_in: int, bytes_out: int, cpu_ms: float, reused: bool) -> None:
+        with self._lock:
+            counters = self._stats.setdefault(
+                encoding, {"responses": 0, "reused": 0, "bytes_in": 0, "bytes_out": 0, "cpu_ms": 0.0}
+            )
+            counters["responses"] += 1
+            counters["reused"] += int(reused)
+            counters["bytes_in"] += bytes_in
+            counters["bytes_out"] += bytes_out
+            counters["cpu_ms"] += cpu_ms
@@ -0,0 +1,151 @@
+"""Conditional GET (ETag / If-None-Match) for polled read endpoints.
+
+The frontend polls the feed, portfolios, appointments and barber services /
+availability, and re-downloads the same JSON, often with inline images, every
+time. :class:`ConditionalGet` gives each registered endpoint a resource name
+and keeps a version counter per resource. Any successful write under the
+resource's URL prefix bumps the counter, and so does :meth:`ConditionalGet.bump`
+for writes made outside a request (background publishing).
+
+* Versioned mode (the data lives in this process): the ETag is
+  ``W/"<process>-<resource>-<version>-<request hash>"`` and is known before the
+  view runs. A matching ``If-None-Match`` is answered with 304 in
+  ``before_request``, so the handler, the query and the JSON serialization
+  are all skipped.
+* Otherwise (e.g. Firestore, where other workers write too) the ETag is a hash
+  of the response body, computed in ``after_request``. The body is still
+  built, but an unchanged response goes out as an empty 304.
+
+Either way, responses carry ``Cache-Control: private, no-cache`` (store it,
+but revalidate every time) and ``Vary: Accept-Encoding``.
+"""
+
+from __future__ import annotations
+
+import hashlib
+import threading
+import uuid
+from typing import Any, Callable, Dict, Optional, Tuple
+
+from flask import Flask, Response, g, request
+
+CACHE_CONTROL = "private, no-cache"
+
+
+class ConditionalGet:
+    """Per-resource version counters plus the before/after request hooks that use them."""
+
+    def __init__(self, app: Optional[Flask] = None):
+        self._boot = uuid.uuid4().hex[:8]  # ETags from another worker or an earlier process never match
+        self._versions: Dict[str, int] = {}
+        # endpoint -> (resource, versioned?)
+        self._endpoints: Dict[str, Tuple[str, Callable[[], bool]]] = {}
+        self._prefixes: Dict[str, str] = {}  # URL prefix -> resource, for bumping on writes
+        self._lock = threading.Lock()
+        self.not_modified_early = 0
+        self.not_modified_late = 0
+        self.bumps = 0
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app: Flask) -> None:
+        app.before_request(self._before_request)
+        app.after_request(self._after_request)
+
+    def register(
+        self,
+        resource: str,
+        endpoints: Tuple[str, ...],
+        prefixes: Tuple[str, ...],
+        versioned: Callable[[], bool] = lambda: True,
+    ) -> None:
+        """Serve ``endpoints`` conditionally as ``resource``; writes under ``prefixes`` bump it.
+
+        Prefixes are matched against the request path with ``<...>`` segments as
+        wildcards, e.g. ``/barbers/<id>/services``.
+        """
+        with self._lock:
+            self._versions.setdefault(resource, 0)
+            for endpoint in endpoints:
+                self._endpoints[endpoint] = (resource, versioned)
+            for prefix in prefixes:
+                self._prefixes[prefix] = resource
+
+    def bump(self, resource: str) -> None:
+        """Invalidate every ETag issued for ``resource``."""
+        with self._lock:
+            self._versions[resource] = self._versions.get(resource, 0) + 1
+            self.bumps += 1
+
+    def stats(self) -> Dict[str, Any]:
+        """304 counts for /metrics."""
+        with self._lock:
+            return {
+                "resources": dict(self._versions),
+                "not_modified_before_view": self.not_modified_early,
+                "not_modified_after_view": self.not_modified_late,
+                "bumps": self.bumps,
+            }
+
+    def _versioned_etag(self, resource: str) -> str:
+        with self._lock:
+            version = self._versions.get(resource, 0)
+        request_hash = hashlib.sha1(request.full_path.encode("utf-8")).hexdigest()[:12]
+        return f"{self._boot}-{resource}-{version}-{request_hash}"
+
+    def _rule(self) -> Optional[Tuple[str, bool]]:
+        if request.method != "GET" or request.endpoint not in self._endpoints:
+            return None
+        resource, versioned = self._endpoints[request.endpoint]
+        return resource, versioned()
+
+    def _before_request(self) -> Optional[Response]:
+        rule = self._rule()
+        if not rule or not rule[1]:
+            return None
+        # Taken before the view runs: a write racing with it leaves the response on the older version
+        etag = g.conditional_etag = self._versioned_etag(rule[0])
+        if request.if_none_match.contains_weak(etag):
+            with self._lock:
+                self.not_modified_early += 1
+            response = Response(status=304)
+            self._decorate(response, etag, weak=True)
+            return response
+        return None
+
+    def _after_request(self, response: Response) -> Response:
+        if request.method not in ("GET", "HEAD", "OPTIONS"):
+            if response.status_code < 400:
+                self._bump_for_path(request.path)
+            return response
+
+        rule = self._rule()
+        if not rule or response.status_code != 200 or response.is_streamed:
+            return response
+        resource, versioned = rule
+        if versioned:
+            response.set_etag(g.get("conditional_etag") or self._versioned_etag(resource), weak=True)
+        elif not response.get_etag()[0]:
+            response.add_etag()
+        self._decorate(response, None)
+        response.make_conditional(request)
+        if response.status_code == 304 and not versioned:
+            with self._lock:
+                self.not_modified_late += 1
+        return response
+
+    def _bump_for_path(self, path: str) -> None:
+        path_parts = path.rstrip("/").split("/")
+        for prefix, resource in self._prefixes.items():
+            prefix_parts = prefix.rstrip("/").split("/")
+            if len(path_parts) >= len(prefix_parts) and all(
+                part.startswith("<") or part == path_parts[i] for i, part in enumerate(prefix_parts)
+            ):
+                self.bump(resource)
+
+    @staticmethod
+    def _decorate(response: Response, etag: Optional[str], weak: bool = False) -> None:
+        if etag:
+            response.set_etag(etag, weak=weak)
+        response.headers["Cache-Control"] = CACHE_CONTROL
+        response.vary.add("Accept-Encoding")
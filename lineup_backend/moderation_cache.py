@@ -0,0 +1,129 @@
+"""Persistent cache of image moderation verdicts.
+
+Verdicts are keyed by a SHA-256 of the normalized image pixels, with a
+perceptual hash stored alongside so re-encoded copies of a known *rejected*
+image are also recognised. Approvals are only reused on an exact SHA-256 hit:
+a few edited pixels barely move a dHash, so a near-duplicate match must never
+let an unmoderated image through. The store is a small SQLite file so verdicts survive restarts
+and are shared between gunicorn workers on the same host.
+"""
+
+from __future__ import annotations
+
+import logging
+import os
+import sqlite3
+import threading
+import time
+from typing import Any, Dict, Optional, Tuple
+
+from lineup_backend.image_pipeline import hamming_distance
+
+logger = logging.getLogger(__name__)
+
+CACHE_DIR = os.environ.get("LINEUP_CACHE_DIR", os.path.join(os.getcwd(), ".lineup_cache"))
+
+
+def _to_signed(value: int) -> int:
+    """SQLite integers are signed 64-bit; fold unsigned hashes into that range."""
+    return value - (1 << 64) if value >= (1 << 63) else value
+
+
+def _to_unsigned(value: int) -> int:
+    return value + (1 << 64) if value < 0 else value
+
+
+class ModerationVerdictCache:
+    """Bounded SQLite-backed store of ``(approved, reason)`` verdicts."""
+
+    def __init__(self, path: Optional[str] = None, max_entries: int = 5000, max_distance: int = 3):
+        self.max_entries = max_entries
+        self.max_distance = max_distance
+        self._lock = threading.Lock()
+        self.path = path or os.path.join(CACHE_DIR, "moderation.sqlite3")
+
+        try:
+            os.makedirs(os.path.dirname(self.path), exist_ok=True)
+            self._conn = sqlite3.connect(self.path, check_same_thread=False, timeout=5)
+        except (OSError, sqlite3.Error) as e:
+            logger.warning(f"Moderation cache not persistent ({str(e)}), using in-memory store")
+            self.path = ":memory:"
+            self._conn = sqlite3.connect(self.path, check_same_thread=False)
+
+        with self._lock:
+            self._conn.execute(
+                """CREATE TABLE IF NOT EXISTS verdicts (
+                    sha256 TEXT PRIMARY KEY,
+                    phash INTEGER NOT NULL,
+                    approved INTEGER NOT NULL,
+                    reason TEXT,
+                    last_used REAL NOT NULL
+                )"""
+            )
+            self._conn.commit()
+
+    def get(self, sha256: str, phash: int) -> Optional[Tuple[bool, Optional[str]]]:
+        """Return a cached ``(approved, reason)`` for this image, or a rejection for a near-duplicate."""
+        try:
+            with self._lock:
+                row = self._conn.execute(
+                    "SELECT approved, reason FROM verdicts WHERE sha256 = ?", (sha256,)
+                ).fetchone()
+                matched_key = sha256
+                if row is None and self.max_distance > 0:
+                    best = None
+                    for key, stored_phash, approved, reason in self._conn.execute(
+                        "SELECT sha256, phash, approved, reason FROM verdicts WHERE approved = 0"
+                    ):
+                        distance = hamming_distance(_to_unsigned(stored_phash), phash)
+                        if distance <= self.max_distance and (best is None or distance < best[0]):
+                            best = (distance, key, approved, reason)
+                    if best is not None:
+                        _, matched_key, approved, reason = best
+                        row = (approved, reason)
+                if row is None:
+                    return None
+                self._conn.execute(
+                    "UPDATE verdicts SET last_used = ? WHERE sha256 = ?", (time.time(), matched_key)
+                )
+                self._conn.commit()
+                return bool(row[0]), row[1]
+        except sqlite3.Error as e:
+            logger.warning(f"Moderation cache lookup failed: {str(e)}")
+            return None
+
+    def set(self, sha256: str, phash: int, approved: bool, reason: Optional[str]) -> None:
+        """Store a verdict, pruning the least recently used rows past ``max_entries``."""
+        try:
+            with self._lock:
+                self._conn.execute(
+                    "INSERT OR REPLACE INTO verdicts (sha256, phash, approved, reason, last_used) VALUES (?, ?, ?, ?, ?)",
+                    (sha256, _to_signed(phash), int(approved), reason, time.time()),
+                )
+                self._conn.execute(
+                    """DELETE FROM verdicts WHERE sha256 IN (
+                        SELECT sha256 FROM verdicts ORDER BY last_used DESC LIMIT -1 OFFSET ?
+                    )""",
+                    (self.max_entries,),
+                )
+                self._conn.commit()
+        except sqlite3.Error as e:
+            logger.warning(f"Moderation cache write failed: {str(e)}")
+
+    def stats(self) -> Dict[str, Any]:
+        """Size/configuration summary for metrics."""
+        try:
+            with self._lock:
+                size, approved = self._conn.execute(
+                    "SELECT COUNT(*), COALESCE(SUM(approved), 0) FROM verdicts"
+                ).fetchone()
+        except sqlite3.Error:
+            size, approved = 0, 0
+        return {
+            "size": size,
+            "approved": approved,
+            "rejected": size - approved,
+            "max_size": self.max_entries,
+            "max_hamming_distance": self.max_distance,
+            "persistent": self.path != ":memory:",
+        }
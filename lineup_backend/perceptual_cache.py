@@ -0,0 +1,81 @@
+"""Result cache keyed by perceptual image hashes.
+
+Lookups tolerate a small Hamming distance between hashes so a re-submitted or
+re-encoded copy of the same photo is served from the cache instead of costing
+another Gemini call.
+"""
+
+from __future__ import annotations
+
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, Optional, Tuple
+
+from lineup_backend.image_pipeline import hamming_distance
+
+
+class PerceptualHashCache:
+    """Bounded, TTL-based LRU cache with near-duplicate (Hamming) lookups."""
+
+    def __init__(self, max_entries: int = 256, ttl_seconds: int = 24 * 3600, max_distance: int = 4):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.max_distance = max_distance
+        self._entries: "OrderedDict[int, Dict[str, Any]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.near_duplicate_hits = 0
+
+    def get(self, phash: int) -> Optional[Tuple[Any, int]]:
+        """Return ``(value, distance)`` for the closest live entry, or None."""
+        now = time.time()
+        with self._lock:
+            self._evict_expired(now)
+
+            entry = self._entries.get(phash)
+            if entry is not None:
+                self._entries.move_to_end(phash)
+                return entry["data"], 0
+
+            best_key, best_distance = None, self.max_distance + 1
+            for key in self._entries:
+                distance = hamming_distance(key, phash)
+                if distance < best_distance:
+                    best_key, best_distance = key, distance
+            if best_key is None:
+                return None
+
+            self._entries.move_to_end(best_key)
+            self.near_duplicate_hits += 1
+            return self._entries[best_key]["data"], best_distance
+
+    def set(self, phash: int, value: Any) -> None:
+        """Store a value, evicting the least recently used entry when full."""
+        with self._lock:
+            self._entries[phash] = {"data": value, "timestamp": time.time()}
+            self._entries.move_to_end(phash)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def clear(self) -> int:
+        """Drop every entry. Returns the number removed."""
+        with self._lock:
+            count = len(self._entries)
+            self._entries.clear()
+            return count
+
+    def stats(self) -> Dict[str, Any]:
+        """Size/configuration summary for health and metrics endpoints."""
+        with self._lock:
+            return {
+                "size": len(self._entries),
+                "max_size": self.max_entries,
+                "ttl_seconds": self.ttl_seconds,
+                "max_hamming_distance": self.max_distance,
+                "near_duplicate_hits": self.near_duplicate_hits,
+            }
+
+    def _evict_expired(self, now: float) -> None:
+        expired = [k for k, v in self._entries.items() if now - v["timestamp"] >= self.ttl_seconds]
+        for key in expired:
+            del self._entries[key]
@@ -0,0 +1,213 @@
+"""Background moderation and upload pipeline for social posts.
+
+``POST /social`` can hand a decoded upload to :class:`PostPipeline` and return
+immediately with a ``pending`` post. Moderation and the storage upload run
+concurrently on a worker pool; once both finish the post is either published
+or rejected (and any already-uploaded asset deleted). Clients poll the job
+status, optionally long-polling until it settles.
+
+The synchronous path can use the same pool through :meth:`PostPipeline.moderate_and_upload`:
+the upload is started speculatively while moderation runs in the request
+thread, so the response waits for the slower of the two rather than both.
+"""
+
+from __future__ import annotations
+
+import logging
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict, Optional, Tuple
+
+from lineup_backend.image_pipeline import STORAGE_MAX_EDGE, IngestedImage
+
+logger = logging.getLogger(__name__)
+
+PENDING = "pending"
+PUBLISHED = "published"
+REJECTED = "rejected"
+FAILED = "failed"
+
+
+class PostPipeline:
+    """Runs moderation and upload for pending posts on a shared worker pool."""
+
+    def __init__(
+        self,
+        moderate: Callable[[IngestedImage], Tuple[bool, Optional[str]]],
+        upload: Callable[[bytes], Optional[str]],
+        delete_upload: Callable[[str], bool],
+        publish: Callable[[dict], Any],
+        max_workers: int = 4,
+        max_jobs: int = 500,
+    ):
+        self._moderate = moderate
+        self._upload = upload
+        self._delete_upload = delete_upload
+        self._publish = publish
+        self._max_jobs = max_jobs
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="post-pipeline")
+        self._jobs: "OrderedDict[str, Dict[str, Any]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.speculative_uploads = 0
+        self.speculative_discards = 0
+
+    def submit(self, post: dict, ingested: IngestedImage) -> dict:
+        """Queue moderation + upload for ``post`` and return its pending snapshot."""
+        post_id = post["id"]
+        job = {
+            "id": post_id,
+            "status": PENDING,
+            "post": post,
+            "reason": None,
+            "results": {},
+            "done": threading.Event(),
+        }
+        with self._lock:
+            self._jobs[post_id] = job
+            # Bounded job table: forget the oldest settled jobs. Pending jobs are never
+            # dropped (their post would never publish), so a burst can exceed the bound
+            # until they settle.
+            excess = len(self._jobs) - self._max_jobs
+            if excess > 0:
+                settled = [jid for jid, j in self._jobs.items() if j["done"].is_set()][:excess]
+                for jid in settled:
+                    del self._jobs[jid]
+
+        moderation = self._executor.submit(self._moderate, ingested)
+        moderation.add_done_callback(lambda f: self._on_step(post_id, "moderation", f, ingested))
+        upload = self._executor.submit(self._upload, ingested.encode(STORAGE_MAX_EDGE))
+        upload.add_done_callback(lambda f: self._on_step(post_id, "upload", f, ingested))
+
+        logger.info(f"Social post {post_id} queued for moderation and upload")
+        return self._snapshot(job)
+
+    def moderate_and_upload(
+        self, ingested: IngestedImage, speculative: bool = True
+    ) -> Tuple[bool, Optional[str], Optional[str]]:
+        """Moderate and upload for the synchronous path: ``(is_approved, reason, image_url)``.
+
+        With ``speculative`` the upload runs on the pool while moderation runs
+        here; a rejected image's upload is deleted once it lands, without
+        holding up the response. Otherwise the upload only starts after approval.
+        """
+        if not speculative:
+            is_approved, reason = self._moderate(ingested)
+            if not is_approved:
+                return False, reason, None
+            return True, None, self._upload(ingested.encode(STORAGE_MAX_EDGE))
+
+        upload = self._executor.submit(self._upload, ingested.encode(STORAGE_MAX_EDGE))
+        with self._lock:
+            self.speculative_uploads += 1
+        try:
+            is_approved, reason = self._moderate(ingested)
+        except Exception:
+            upload.add_done_callback(self._discard_upload)
+            raise
+
+        if not is_approved:
+            upload.add_done_callback(self._discard_upload)
+            return False, reason, None
+
+        try:
+            image_url = upload.result()
+        except Exception as e:
+            logger.error(f"Speculative upload failed: {str(e)}")
+            image_url = None
+        return True, None, image_url
+
+    def get(self, post_id: str) -> Optional[dict]:
+        """Current status snapshot for a post, or None if unknown."""
+        with self._lock:
+            job = self._jobs.get(post_id)
+        return self._snapshot(job) if job else None
+
+    def wait(self, post_id: str, timeout: float) -> Optional[dict]:
+        """Block up to ``timeout`` seconds for the post to settle, then return its snapshot."""
+        with self._lock:
+            job = self._jobs.get(post_id)
+        if not job:
+            return None
+        job["done"].wait(timeout)
+        return self._snapshot(job)
+
+    def stats(self) -> Dict[str, int]:
+        """Job counts by status, plus speculative upload counts."""
+        with self._lock:
+            counts: Dict[str, int] = {}
+            for job in self._jobs.values():
+                counts[job["status"]] = counts.get(job["status"], 0) + 1
+            counts["speculative_uploads"] = self.speculative_uploads
+            counts["speculative_discards"] = self.speculative_discards
+        return counts
+
+    def _discard_upload(self, future) -> None:
+        """Delete an upload whose post was rejected (or whose moderation failed)."""
+        try:
+            image_url = future.result()
+        except Exception:
+            return
+        if image_url:
+            with self._lock:
+                self.speculative_discards += 1
+            try:
+                self._delete_upload(image_url)
+            except Exception as e:
+                logger.error(f"Failed to delete discarded upload {image_url}: {str(e)}")
+
+    def _on_step(self, post_id: str, step: str, future, ingested: IngestedImage) -> None:
+        try:
+            result = future.result()
+        except Exception as e:
+            logger.error(f"Social post {post_id} {step} failed: {str(e)}")
+            result = e
+
+        with self._lock:
+            job = self._jobs.get(post_id)
+            if not job:
+                return
+            job["results"][step] = result
+            if len(job["results"]) < 2:
+                return
+
+        self._finalize(job, ingested)
+
+    def _finalize(self, job: Dict[str, Any], ingested: IngestedImage) -> None:
+        moderation = job["results"]["moderation"]
+        image_url = job["results"]["upload"]
+        if isinstance(image_url, Exception):
+            image_url = None
+
+        post = dict(job["post"])
+        try:
+            if isinstance(moderation, Exception):
+                # Same permissive policy as the synchronous path
+                moderation = (True, None)
+            is_approved, reason = moderation
+
+            if not is_approved:
+                if image_url:
+                    self._delete_upload(image_url)
+                job.update(status=REJECTED, reason=reason)
+                logger.info(f"Social post {post['id']} rejected by moderation")
+                return
+
+            post["image"] = image_url if image_url else ingested.to_base64(STORAGE_MAX_EDGE)
+            post["stored_in_storage"] = bool(image_url)
+            post["status"] = PUBLISHED
+            self._publish(post)
+            job.update(status=PUBLISHED, post=post)
+            logger.info(f"Social post {post['id']} published")
+        except Exception as e:
+            logger.error(f"Error finalizing social post {post['id']}: {str(e)}")
+            job.update(status=FAILED, reason="Failed to create post")
+        finally:
+            job["done"].set()
+
+    @staticmethod
+    def _snapshot(job: Dict[str, Any]) -> dict:
+        snapshot = {"id": job["id"], "status": job["status"], "post": job["post"]}
+        if job["reason"]:
+            snapshot["reason"] = job["reason"]
+        return snapshot
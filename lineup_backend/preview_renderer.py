@@ -0,0 +1,97 @@
+"""Preview-mode try-on rendering.
+
+Without Replicate, virtual try-on returns the user's photo with a dark strip
+along the bottom naming the requested style. This runs inline on every
+preview request, so the font is loaded once per process, the photo is
+downscaled to display size first, only the strip is darkened (no full-size
+RGBA overlay or composite) and the JPEG is saved without the extra
+``optimize`` pass.
+"""
+
+from __future__ import annotations
+
+import logging
+import os
+from functools import lru_cache
+from io import BytesIO
+from typing import Any
+
+from PIL import Image, ImageDraw, ImageFont
+
+logger = logging.getLogger(__name__)
+
+# Longest edge of the rendered preview; the result is only ever shown on screen
+PREVIEW_MAX_EDGE = int(os.environ.get("LINEUP_PREVIEW_MAX_EDGE", 1024))
+PREVIEW_JPEG_QUALITY = int(os.environ.get("LINEUP_PREVIEW_JPEG_QUALITY", 85))
+
+STRIP_HEIGHT = 70
+FONT_SIZE = 28
+FONT_PATHS = (
+    "/usr/share/fonts/truetype/dejavu/DejaVuSans-Bold.ttf",
+    "/usr/share/fonts/TTF/DejaVuSans-Bold.ttf",
+    "/System/Library/Fonts/Helvetica.ttc",
+    "arial.ttf",
+)
+
+# Same result as compositing black at alpha 200 over the strip: v * (255 - 200) / 255
+_STRIP_LUT = [v * (255 - 200) // 255 for v in range(256)] * 3
+
+
+@lru_cache(maxsize=None)
+def load_font(size: int = FONT_SIZE) -> Any:
+    """First available TrueType font (PIL's bitmap default as a last resort), loaded once."""
+    for font_path in FONT_PATHS:
+        try:
+            font = ImageFont.truetype(font_path, size)
+            logger.info(f"Loaded preview font: {font_path}")
+            return font
+        except Exception:
+            continue
+    logger.info("Using default preview font")
+    return ImageFont.load_default()
+
+
+def render_preview(
+    image: Image.Image,
+    style_description: str,
+    max_edge: int = PREVIEW_MAX_EDGE,
+    quality: int = PREVIEW_JPEG_QUALITY,
+) -> bytes:
+    """JPEG bytes of ``image`` (not modified) with the "Preview: <style>" strip drawn on."""
+    if max(image.size) > max_edge:
+        # Resizing already yields a new image, so no full-size copy is made
+        scale = max_edge / max(image.size)
+        size = (max(1, round(image.width * scale)), max(1, round(image.height * scale)))
+        img = image.resize(size, Image.BILINEAR, reducing_gap=2.0)
+    else:
+        img = image.copy()
+    if img.mode != 'RGB':
+        img = img.convert('RGB')
+
+    width, height = img.size
+    strip_box = (0, max(0, height - STRIP_HEIGHT), width, height)
+    img.paste(img.crop(strip_box).point(_STRIP_LUT), strip_box)
+
+    try:
+        draw = ImageDraw.Draw(img)
+        text = f"Preview: {style_description}"
+        font = load_font()
+        try:
+            bbox = draw.textbbox((0, 0), text, font=font)
+            text_width = bbox[2] - bbox[0]
+        except AttributeError:
+            # Fallback if textbbox not available (older PIL versions)
+            text_width = len(text) * 15
+
+        text_x = max(10, (width - text_width) // 2)
+        text_y = max(10, height - 50)
+        # Text with shadow for better visibility
+        draw.text((text_x + 2, text_y + 2), text, fill=(0, 0, 0), font=font)
+        draw.text((text_x, text_y), text, fill=(255, 255, 255), font=font)
+    except Exception as e:
+        # The darkened photo is still a valid preview
+        logger.error(f"Preview text error: {str(e)}")
+
+    buffer = BytesIO()
+    img.save(buffer, format='JPEG', quality=quality)
+    return buffer.getvalue()
@@ -0,0 +1,82 @@
+"""Pre-serialized JSON for constant and rarely-changing responses.
+
+Fallback payloads (mock analysis, mock barbers, default availability and
+services) and the ``/`` and ``/config`` documents are served constantly, and
+even more when upstream quotas run out. :class:`PreencodedResponseCache` keeps
+their encoded JSON bytes and ETag keyed by whatever the payload depends on
+(location, barber id, remaining quota...), so a request only copies bytes.
+Compressed variants of the body are stored on the same entry the first time a
+client asks for them.
+"""
+
+from __future__ import annotations
+
+import hashlib
+import json
+import threading
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Hashable, NamedTuple
+
+
+class EncodedPayload(NamedTuple):
+    body: bytes
+    etag: str
+    compressed: Dict[str, bytes]  # content-encoding -> compressed body, filled on demand
+
+
+def encode_payload(data: Any) -> EncodedPayload:
+    """Compact JSON bytes plus a strong ETag derived from them."""
+    body = json.dumps(data, separators=(",", ":"), sort_keys=True).encode("utf-8")
+    return EncodedPayload(body, hashlib.sha1(body).hexdigest()[:20], {})
+
+
+class PreencodedResponseCache:
+    """Bounded LRU of :class:`EncodedPayload` built on first use."""
+
+    def __init__(self, max_entries: int = 512):
+        self.max_entries = max_entries
+        self._entries: "OrderedDict[Hashable, EncodedPayload]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get_or_build(self, key: Hashable, builder: Callable[[], Any]) -> EncodedPayload:
+        """Return the encoded payload for ``key``, calling ``builder`` only on a miss."""
+        with self._lock:
+            payload = self._entries.get(key)
+            if payload is not None:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return payload
+            self.misses += 1
+
+        payload = encode_payload(builder())
+        with self._lock:
+            self._entries[key] = payload
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+        return payload
+
+    def clear(self) -> int:
+        """Drop every entry. Returns the number removed."""
+        with self._lock:
+            count = len(self._entries)
+            self._entries.clear()
+            return count
+
+    def stats(self) -> Dict[str, Any]:
+        """Size and hit counts for /metrics."""
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                "size": len(self._entries),
+                "max_size": self.max_entries,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": round(self.hits / total, 3) if total else 0.0,
+                "bytes": sum(len(p.body) for p in self._entries.values()),
+                "compressed_bytes": sum(
+                    len(variant) for p in self._entries.values() for variant in p.compressed.values()
+                ),
+            }
@@ -1,19 +1,41 @@
 """AI Analysis endpoints."""
 
 import base64
-import json
 import logging
 from io import BytesIO
 
 from flask import Blueprint, request
 from PIL import Image
 
+from lineup_backend.schemas.base import ValidationError
+from lineup_backend.schemas.gemini import parse_structured_response
+from lineup_backend.services.gemini_service import (
+    ResilientGeminiClient,
+    structured_generation_config,
+    structured_prompt,
+)
 from lineup_backend.utils import cors_response, handle_options, api_response
 
 logger = logging.getLogger(__name__)
 
 analyze_bp = Blueprint('analyze', __name__)
 
+# One resilient client per process (deadlines, retries, circuit breaker), created on first use
+_model = None
+
+
+def get_model():
+    """Shared Gemini client, or None when Gemini isn't configured."""
+    global _model
+    if _model is None:
+        import os
+        import google.generativeai as genai
+        api_key = os.environ.get("GEMINI_API_KEY")
+        if api_key:
+            genai.configure(api_key=api_key)
+            _model = ResilientGeminiClient(genai.GenerativeModel('gemini-2.0-flash'))
+    return _model
+
 
 def get_mock_analysis_data():
     """Return mock analysis data when AI is unavailable."""
@@ -62,23 +84,17 @@ def analyze():
     Analyze uploaded photo and provide haircut recommendations.
     Uses Gemini AI when available, falls back to mock data.
     """
-    import os
-    
     logger.info("ANALYZE endpoint called")
     
     # Try to import and use Gemini
     model = None
     try:
-        import google.generativeai as genai
-        api_key = os.environ.get("GEMINI_API_KEY")
-        if api_key:
-            genai.configure(api_key=api_key)
-            model = genai.GenerativeModel('gemini-2.0-flash')
+        model = get_model()
     except Exception as e:
         logger.warning(f"Gemini not available: {e}")
     
-    if not model:
-        logger.info("Using mock data (Gemini not configured)")
+    if not model or not model.is_available():
+        logger.info("Using mock data (Gemini not configured or circuit open)")
         return cors_response(get_mock_analysis_data())
     
     try:
@@ -109,56 +125,20 @@ def analyze():
         except Exception as e:
             raise ValueError(f"Invalid image data: {str(e)}")
         
-        # Create analysis prompt
-        prompt = """You are an expert hairstylist and facial analysis AI. Analyze this person's face and hair in the photo and provide personalized haircut recommendations.
-
-IMPORTANT: Return ONLY a valid JSON response with NO additional text, NO markdown formatting, NO code blocks.
-
-Return this EXACT JSON structure:
-{
-    "analysis": {
-        "faceShape": "[one of: oval, round, square, heart, oblong, diamond, triangle]",
-        "hairTexture": "[one of: straight, wavy, curly, coily, kinky]",
-        "hairColor": "[one of: black, dark-brown, brown, light-brown, blonde, red, gray, white, other]",
-        "estimatedGender": "[one of: male, female, non-binary]",
-        "estimatedAge": "[one of: under-20, 20-25, 25-30, 30-35, 35-40, 40-45, 45-50, 50-55, 55-60, over-60]"
-    },
-    "recommendations": [
-        {
-            "styleName": "[Specific haircut name]",
-            "description": "[2-3 sentence description of the haircut style and how it's achieved]",
-            "reason": "[1-2 sentences explaining why this works for their specific face shape, hair texture, and features]"
-        }
-    ]
-}
-
-Provide exactly 6 haircut recommendations that would work best for this person's features."""
-
         # Call Gemini API
         try:
-            response = model.generate_content([prompt, image])
-            response_text = response.text.strip()
+            response = model.generate_content(
+                [structured_prompt("analysis"), image],
+                generation_config=structured_generation_config("analysis"),
+            )
+            analysis_data = parse_structured_response(response.text, "analysis")
+        except ValidationError as e:
+            logger.warning(f"Invalid Gemini analysis response, using mock data: {e.errors}")
+            return cors_response(get_mock_analysis_data())
         except Exception as e:
             logger.error(f"Gemini API error: {str(e)}")
             return cors_response(get_mock_analysis_data())
         
-        # Clean and parse response
-        if "```json" in response_text:
-            start = response_text.find("```json") + 7
-            end = response_text.rfind("```")
-            if end > start:
-                response_text = response_text[start:end].strip()
-        
-        try:
-            analysis_data = json.loads(response_text)
-        except json.JSONDecodeError:
-            logger.warning("Failed to parse Gemini response, using mock data")
-            return cors_response(get_mock_analysis_data())
-        
-        # Validate response structure
-        if "analysis" not in analysis_data or "recommendations" not in analysis_data:
-            return cors_response(get_mock_analysis_data())
-        
         return cors_response(analysis_data)
         
     except ValueError as e:
@@ -24,9 +24,9 @@ def handle_appointments():
         user_id = request.args.get('user_id', 'current_user')
         
         if user_type == 'client':
-            user_appointments = [apt for apt in memory_store.appointments if apt.get('clientId') == user_id]
+            user_appointments = memory_store.appointments.find('clientId', user_id)
         else:  # barber
-            user_appointments = [apt for apt in memory_store.appointments if apt.get('barberId') == user_id]
+            user_appointments = memory_store.appointments.find('barberId', user_id)
         
         return cors_response({"appointments": user_appointments})
     
@@ -67,7 +67,7 @@ def update_appointment_status(appointment_id):
         data = safe_get_json()
         new_status = data.get("status", "pending")
         
-        appointment = next((apt for apt in memory_store.appointments if apt.get("id") == appointment_id), None)
+        appointment = memory_store.appointments.get(appointment_id)
         
         if not appointment:
             return api_response(error="Appointment not found", status=404)
@@ -87,7 +87,7 @@ def update_appointment_status(appointment_id):
 def accept_appointment(appointment_id):
     """Accept (confirm) an appointment."""
     try:
-        appointment = next((apt for apt in memory_store.appointments if apt.get("id") == appointment_id), None)
+        appointment = memory_store.appointments.get(appointment_id)
         
         if not appointment:
             return api_response(error="Appointment not found", status=404)
@@ -110,7 +110,7 @@ def reject_appointment(appointment_id):
         data = safe_get_json()
         reason = data.get("reason", "No reason provided")
         
-        appointment = next((apt for apt in memory_store.appointments if apt.get("id") == appointment_id), None)
+        appointment = memory_store.appointments.get(appointment_id)
         
         if not appointment:
             return api_response(error="Appointment not found", status=404)
@@ -139,7 +139,7 @@ def reschedule_appointment(appointment_id):
         if not new_date or not new_time:
             return api_response(error="Date and time required", status=400)
         
-        appointment = next((apt for apt in memory_store.appointments if apt.get("id") == appointment_id), None)
+        appointment = memory_store.appointments.get(appointment_id)
         
         if not appointment:
             return api_response(error="Appointment not found", status=404)
@@ -177,7 +177,7 @@ def cancel_appointment(appointment_id):
         data = safe_get_json()
         reason = data.get("reason", "Cancelled")
         
-        appointment = next((apt for apt in memory_store.appointments if apt.get("id") == appointment_id), None)
+        appointment = memory_store.appointments.get(appointment_id)
         
         if not appointment:
             return api_response(error="Appointment not found", status=404)
@@ -202,7 +202,7 @@ def add_appointment_notes(appointment_id):
         note = data.get("note", "")
         note_type = data.get("type", "general")
         
-        appointment = next((apt for apt in memory_store.appointments if apt.get("id") == appointment_id), None)
+        appointment = memory_store.appointments.get(appointment_id)
         
         if not appointment:
             return api_response(error="Appointment not found", status=404)
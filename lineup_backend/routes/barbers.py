@@ -396,7 +396,7 @@ def manage_services(barber_id):
 def get_clients(barber_id):
     """Get clients for a barber based on appointments."""
     try:
-        appointments_list = [apt for apt in memory_store.appointments if apt.get('barberId') == barber_id]
+        appointments_list = memory_store.appointments.find('barberId', barber_id)
         
         # Group by client
         clients_dict = {}
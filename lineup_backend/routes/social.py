@@ -80,7 +80,7 @@ def social():
 def toggle_like(post_id):
     """Toggle like on a post."""
     try:
-        post = next((p for p in memory_store.social_posts if str(p.get("id")) == str(post_id)), None)
+        post = memory_store.social_posts.get(post_id)
         
         if not post:
             return api_response(error="Post not found", status=404)
@@ -109,7 +109,7 @@ def toggle_like(post_id):
 def share_post(post_id):
     """Increment share count on a post."""
     try:
-        post = next((p for p in memory_store.social_posts if str(p.get("id")) == str(post_id)), None)
+        post = memory_store.social_posts.get(post_id)
         
         if not post:
             return api_response(error="Post not found", status=404)
@@ -153,7 +153,7 @@ def handle_comments(post_id):
             memory_store.post_comments[post_id].append(new_comment)
             
             # Update comment count on post
-            post = next((p for p in memory_store.social_posts if str(p.get("id")) == str(post_id)), None)
+            post = memory_store.social_posts.get(post_id)
             if post:
                 post["comments"] = post.get("comments", 0) + 1
             
@@ -0,0 +1,286 @@
+"""Response schemas for structured Gemini output.
+
+Each entry in :data:`GEMINI_SCHEMAS` holds the (OpenAPI-subset) schema the
+model must answer with, the minimal instruction that goes with it and the
+generation limits for that call. :func:`parse_structured_response` is the one
+strict parser for every reply: it locates the JSON object, validates it
+against the schema and normalizes it (enum casing, clamped scores, trimmed
+strings and lists, unknown keys dropped).
+"""
+
+from __future__ import annotations
+
+import json
+from typing import Any, Dict, List, Tuple
+
+from .base import ValidationError
+
+FACE_SHAPES = ["oval", "round", "square", "heart", "oblong", "diamond", "triangle"]
+HAIR_TEXTURES = ["straight", "wavy", "curly", "coily", "kinky"]
+HAIR_COLORS = ["black", "dark-brown", "brown", "light-brown", "blonde", "red", "gray", "white", "other"]
+GENDERS = ["male", "female", "non-binary"]
+AGE_RANGES = [
+    "under-20", "20-25", "25-30", "30-35", "35-40",
+    "40-45", "45-50", "50-55", "55-60", "over-60",
+]
+
+ANALYSIS_SCHEMA: Dict[str, Any] = {
+    "type": "object",
+    "properties": {
+        "analysis": {
+            "type": "object",
+            "properties": {
+                "faceShape": {"type": "string", "enum": FACE_SHAPES},
+                "hairTexture": {"type": "string", "enum": HAIR_TEXTURES},
+                "hairColor": {"type": "string", "enum": HAIR_COLORS},
+                "estimatedGender": {"type": "string", "enum": GENDERS},
+                "estimatedAge": {"type": "string", "enum": AGE_RANGES},
+            },
+            "required": ["faceShape", "hairTexture", "hairColor", "estimatedGender", "estimatedAge"],
+        },
+        "recommendations": {
+            "type": "array",
+            "minItems": 1,
+            "maxItems": 6,
+            "items": {
+                "type": "object",
+                "properties": {
+                    "styleName": {"type": "string", "description": "specific haircut name", "maxLength": 60},
+                    "description": {"type": "string", "description": "2-3 sentences on the cut", "maxLength": 400},
+                    "reason": {"type": "string", "description": "1-2 sentences on why it suits them", "maxLength": 300},
+                },
+                "required": ["styleName", "description", "reason"],
+            },
+        },
+    },
+    "required": ["analysis", "recommendations"],
+}
+
+MODERATION_SCHEMA: Dict[str, Any] = {
+    "type": "object",
+    "properties": {
+        "explicit_content": {"type": "boolean"},
+        "hair_related": {"type": "boolean"},
+    },
+    "required": ["explicit_content", "hair_related"],
+}
+
+REVIEW_MATCH_SCHEMA: Dict[str, Any] = {
+    "type": "object",
+    "properties": {
+        "overall_match_score": {"type": "number", "minimum": 0.0, "maximum": 1.0},
+        "matches": {
+            "type": "array",
+            "maxItems": 10,
+            "items": {
+                "type": "object",
+                "properties": {
+                    "style": {"type": "string", "maxLength": 60},
+                    "confidence": {"type": "number", "minimum": 0.0, "maximum": 1.0},
+                    "evidence": {"type": "string", "description": "short quote or reason", "maxLength": 50},
+                },
+                "required": ["style", "confidence"],
+            },
+        },
+    },
+    "required": ["overall_match_score", "matches"],
+}
+
+GEMINI_SCHEMAS: Dict[str, Dict[str, Any]] = {
+    "analysis": {
+        "schema": ANALYSIS_SCHEMA,
+        "instruction": (
+            "You are an expert hairstylist. Analyze the face and hair in this photo "
+            "and recommend the 6 haircuts that best suit this person."
+        ),
+        "max_output_tokens": 1024,
+        "temperature": 0.4,
+    },
+    "moderation": {
+        "schema": MODERATION_SCHEMA,
+        "instruction": (
+            "Moderate this image for a hair/barber community. explicit_content: any "
+            "explicit, adult, violent or inappropriate content. hair_related: shows "
+            "hair, haircuts, hairstyles or barber/stylist work."
+        ),
+        "max_output_tokens": 48,
+        "temperature": 0.0,
+    },
+    "review_match": {
+        "schema": REVIEW_MATCH_SCHEMA,
+        "instruction": (
+            "Rate how strongly these reviews of barbershop \"{barber_name}\" show expertise "
+            "in: {styles}. overall_match_score is 0 with no evidence, 1 with strong evidence. "
+            "Add one match per style the reviews mention (empty if none).\n"
+            "REVIEWS: {reviews}"
+        ),
+        "max_output_tokens": 256,
+        "temperature": 0.0,
+    },
+}
+
+
+def schema_outline(schema: Dict[str, Any]) -> str:
+    """Compact JSON-like outline of a schema, used when the SDK can't enforce it natively."""
+    kind = schema.get("type")
+    if kind == "object":
+        fields = ",".join(f'"{name}":{schema_outline(prop)}' for name, prop in schema["properties"].items())
+        return "{" + fields + "}"
+    if kind == "array":
+        return "[" + schema_outline(schema["items"]) + "]"
+    if kind == "boolean":
+        return "bool"
+    if kind == "number":
+        return f"{schema.get('minimum', 0):g}-{schema.get('maximum', 1):g}"
+    if "enum" in schema:
+        return '"' + "|".join(schema["enum"]) + '"'
+    return '"' + schema.get("description", "text") + '"'
+
+
+def parse_structured_response(text: str, schema_name: str) -> Dict[str, Any]:
+    """Parse and validate a Gemini reply against a registered schema.
+
+    Tolerates markdown fences or stray prose around the object, but raises
+    :class:`ValidationError` if the object itself doesn't match the schema.
+    """
+    schema = GEMINI_SCHEMAS[schema_name]["schema"]
+    text = (text or "").strip()
+    start = text.find("{")
+    if start < 0:
+        raise ValidationError({"response": "No JSON object in model response"})
+    try:
+        value, _ = json.JSONDecoder().raw_decode(text, start)
+    except json.JSONDecodeError as e:
+        raise ValidationError({"response": f"Invalid JSON: {e.msg}"})
+    return _coerce(value, schema, "response")
+
+
+class StreamingResponseParser:
+    """Incrementally parse a streamed Gemini reply for a registered schema.
+
+    :meth:`feed` takes text chunks as they arrive and returns every top-level
+    object field (``("analysis", {...})``) or object array element
+    (``("recommendations", {...})``) that has just been completed and
+    validated. :meth:`result` validates the whole reply once the stream ends.
+    """
+
+    def __init__(self, schema_name: str):
+        self.schema_name = schema_name
+        self.schema = GEMINI_SCHEMAS[schema_name]["schema"]
+        self.text = ""
+        self._pos = 0
+        self._stack: List[Tuple[str, int]] = []
+        self._in_string = False
+        self._escaped = False
+        self._string_start = 0
+        self._last_string = None
+        self._key = None
+        self._counts: Dict[str, int] = {}
+
+    def feed(self, chunk: str) -> List[Tuple[str, Any]]:
+        """Consume ``chunk``; return ``(field, value)`` pairs that completed in it."""
+        self.text += chunk
+        completed = []
+        for i in range(self._pos, len(self.text)):
+            char = self.text[i]
+            if self._in_string:
+                if self._escaped:
+                    self._escaped = False
+                elif char == "\\":
+                    self._escaped = True
+                elif char == '"':
+                    self._in_string = False
+                    if len(self._stack) == 1:
+                        self._last_string = self.text[self._string_start + 1:i]
+            elif char == '"':
+                self._in_string = True
+                self._string_start = i
+            elif char == ":" and len(self._stack) == 1:
+                self._key = self._last_string
+            elif char in "{[":
+                self._stack.append((char, i))
+            elif char in "}]" and self._stack:
+                _, start = self._stack.pop()
+                in_top_array = len(self._stack) == 2 and self._stack[-1][0] == "["
+                if char == "}" and (len(self._stack) == 1 or in_top_array):
+                    item = self._validated(self._key, self.text[start:i + 1], in_top_array)
+                    if item is not None:
+                        completed.append((self._key, item))
+        self._pos = len(self.text)
+        return completed
+
+    def result(self) -> Dict[str, Any]:
+        """Validate the complete reply (same rules as :func:`parse_structured_response`)."""
+        return parse_structured_response(self.text, self.schema_name)
+
+    def _validated(self, key: Any, fragment: str, array_item: bool) -> Any:
+        field_schema = self.schema.get("properties", {}).get(key)
+        if field_schema is None:
+            return None
+        if array_item:
+            # Extra elements are dropped by maxItems in the final pass, so don't emit them either
+            if self._counts.get(key, 0) >= field_schema.get("maxItems", float("inf")):
+                return None
+            field_schema = field_schema.get("items", {})
+        if field_schema.get("type") != "object":
+            return None
+        try:
+            value = _coerce(json.loads(fragment), field_schema, f"response.{key}")
+            self._counts[key] = self._counts.get(key, 0) + 1
+            return value
+        except (json.JSONDecodeError, ValidationError):
+            # The final result() pass reports malformed fields
+            return None
+
+
+def _coerce(value: Any, schema: Dict[str, Any], path: str) -> Any:
+    kind = schema.get("type")
+
+    if kind == "object":
+        if not isinstance(value, dict):
+            raise ValidationError({path: "expected an object"})
+        result = {}
+        for name, prop in schema["properties"].items():
+            if name in value and value[name] is not None:
+                result[name] = _coerce(value[name], prop, f"{path}.{name}")
+            elif name in schema.get("required", []):
+                raise ValidationError({f"{path}.{name}": "is required"})
+        return result
+
+    if kind == "array":
+        if not isinstance(value, list):
+            raise ValidationError({path: "expected a list"})
+        items = [_coerce(item, schema["items"], f"{path}[{i}]") for i, item in enumerate(value)]
+        if len(items) < schema.get("minItems", 0):
+            raise ValidationError({path: f"expected at least {schema['minItems']} items"})
+        return items[:schema["maxItems"]] if "maxItems" in schema else items
+
+    if kind == "boolean":
+        if isinstance(value, bool):
+            return value
+        if isinstance(value, str) and value.strip().lower() in ("true", "false"):
+            return value.strip().lower() == "true"
+        raise ValidationError({path: "expected a boolean"})
+
+    if kind == "number":
+        try:
+            if isinstance(value, bool):
+                raise TypeError
+            number = float(value)
+        except (TypeError, ValueError):
+            raise ValidationError({path: "expected a number"})
+        if "minimum" in schema:
+            number = max(schema["minimum"], number)
+        if "maximum" in schema:
+            number = min(schema["maximum"], number)
+        return number
+
+    if not isinstance(value, str):
+        raise ValidationError({path: "expected a string"})
+    value = value.strip()
+    if "enum" in schema:
+        normalized = value.lower().replace(" ", "-").replace("_", "-")
+        if normalized not in schema["enum"]:
+            raise ValidationError({path: f"'{value}' is not one of {schema['enum']}"})
+        return normalized
+    return value[:schema["maxLength"]] if "maxLength" in schema else value
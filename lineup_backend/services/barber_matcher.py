@@ -3,9 +3,11 @@
 import logging
 import time
 from typing import Dict, List, Any, Optional
-import json
 from concurrent.futures import ThreadPoolExecutor, as_completed
 
+from lineup_backend.schemas.gemini import parse_structured_response
+from lineup_backend.services.gemini_service import structured_generation_config, structured_prompt
+
 logger = logging.getLogger(__name__)
 
 
@@ -95,57 +97,16 @@ class BarberMatcher:
         combined_reviews = " | ".join(reviews_text)[:2000]  # Max 2000 chars total
         styles_str = ", ".join(recommended_styles)
         
-        prompt = f"""Analyze these barbershop reviews to determine expertise in specific haircut styles.
-
-BARBERSHOP: {barber_name}
-STYLES TO MATCH: {styles_str}
-REVIEWS: {combined_reviews}
-
-Determine if this barbershop specializes in the given styles based on the reviews.
-
-Return ONLY valid JSON (no markdown, no code blocks):
-{{
-    "overall_match_score": 0.0-1.0,
-    "matches": [
-        {{
-            "style": "style name",
-            "confidence": 0.0-1.0,
-            "evidence": "brief quote or reason"
-        }}
-    ]
-}}
-
-Rules:
-- overall_match_score: 0.0 (no evidence) to 1.0 (strong evidence)
-- Include a match entry for each style found in reviews
-- Evidence should be a brief quote or reason (max 50 chars)
-- Return empty matches array if no style mentions found
-"""
+        prompt = structured_prompt(
+            "review_match", barber_name=barber_name, styles=styles_str, reviews=combined_reviews
+        )
         
         try:
             logger.info(f"Analyzing reviews for {barber_name} with Gemini")
-            response = self.model.generate_content(prompt)
-            response_text = response.text.strip()
-            
-            # Clean response (remove markdown if present)
-            if "```json" in response_text:
-                start = response_text.find("```json") + 7
-                end = response_text.rfind("```")
-                if end > start:
-                    response_text = response_text[start:end].strip()
-            elif "```" in response_text:
-                response_text = response_text.replace("```", "").strip()
-            
-            result = json.loads(response_text)
-            
-            # Validate and normalize
-            if not isinstance(result, dict):
-                raise ValueError("Invalid JSON structure")
-            
-            analysis = {
-                "overall_match_score": max(0.0, min(1.0, float(result.get("overall_match_score", 0.0)))),
-                "matches": result.get("matches", [])
-            }
+            response = self.model.generate_content(
+                prompt, generation_config=structured_generation_config("review_match")
+            )
+            analysis = parse_structured_response(response.text, "review_match")
             
             # Cache result
             self._cache[cache_key] = {
@@ -2,17 +2,274 @@
 
 from __future__ import annotations
 
-import json
 import logging
+import random
 import re
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeoutError
 from io import BytesIO
-from typing import Optional, Tuple
+from typing import Any, Dict, Optional, Tuple
 
 from PIL import Image
 
+from lineup_backend.schemas.base import ValidationError
+from lineup_backend.schemas.gemini import GEMINI_SCHEMAS, parse_structured_response, schema_outline
+
+try:
+    from google.api_core import exceptions as google_exceptions
+    RETRYABLE_ERRORS: Tuple[type, ...] = (
+        google_exceptions.ServiceUnavailable,
+        google_exceptions.TooManyRequests,
+        google_exceptions.ResourceExhausted,
+        google_exceptions.InternalServerError,
+        google_exceptions.DeadlineExceeded,
+        google_exceptions.GatewayTimeout,
+        ConnectionError,
+    )
+except ImportError:
+    RETRYABLE_ERRORS = (ConnectionError,)
+
+try:
+    # Newer SDKs can constrain the reply to a schema; 0.3.x only knows the basic sampling options
+    from google.ai import generativelanguage as _glm
+    NATIVE_STRUCTURED_OUTPUT = "response_schema" in _glm.GenerationConfig.meta.fields
+except ImportError:
+    NATIVE_STRUCTURED_OUTPUT = False
+
 logger = logging.getLogger(__name__)
 
 
+def structured_generation_config(schema_name: str) -> Dict[str, Any]:
+    """``generation_config`` for a call answered with the named registry schema."""
+    entry = GEMINI_SCHEMAS[schema_name]
+    config: Dict[str, Any] = {
+        "temperature": entry["temperature"],
+        "max_output_tokens": entry["max_output_tokens"],
+    }
+    if NATIVE_STRUCTURED_OUTPUT:
+        config["response_mime_type"] = "application/json"
+        config["response_schema"] = entry["schema"]
+    return config
+
+
+def structured_prompt(schema_name: str, **fields: Any) -> str:
+    """Minimal prompt for the named schema (the JSON shape is only spelled out when not enforced natively)."""
+    entry = GEMINI_SCHEMAS[schema_name]
+    prompt = entry["instruction"].format(**fields)
+    if not NATIVE_STRUCTURED_OUTPUT:
+        prompt += "\nReply with only this JSON: " + schema_outline(entry["schema"])
+    return prompt
+
+
+class GeminiUnavailableError(Exception):
+    """Raised when Gemini is failing fast (circuit open) or a call exhausted its deadline/retries."""
+
+
+class CircuitBreaker:
+    """Classic closed/open/half-open breaker guarding an unhealthy upstream."""
+
+    CLOSED = "closed"
+    OPEN = "open"
+    HALF_OPEN = "half_open"
+
+    def __init__(self, failure_threshold: int = 5, reset_timeout: float = 30.0):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self._state = self.CLOSED
+        self._consecutive_failures = 0
+        self._opened_at = 0.0
+        self._trial_in_flight = False
+        self._total_failures = 0
+        self._total_rejected = 0
+        self._lock = threading.Lock()
+
+    @property
+    def state(self) -> str:
+        with self._lock:
+            return self._current_state()
+
+    def allow_request(self) -> bool:
+        """Whether a call may proceed (one trial call is let through when half-open)."""
+        with self._lock:
+            state = self._current_state()
+            if state == self.CLOSED:
+                return True
+            if state == self.HALF_OPEN and not self._trial_in_flight:
+                self._trial_in_flight = True
+                return True
+            self._total_rejected += 1
+            return False
+
+    def record_success(self) -> None:
+        with self._lock:
+            self._state = self.CLOSED
+            self._consecutive_failures = 0
+            self._trial_in_flight = False
+
+    def record_failure(self) -> None:
+        with self._lock:
+            self._consecutive_failures += 1
+            self._total_failures += 1
+            self._trial_in_flight = False
+            if self._state == self.HALF_OPEN or self._consecutive_failures >= self.failure_threshold:
+                if self._state != self.OPEN:
+                    logger.warning(f"Gemini circuit breaker opened after {self._consecutive_failures} failures")
+                self._state = self.OPEN
+                self._opened_at = time.time()
+
+    def snapshot(self) -> Dict[str, Any]:
+        """Breaker state for /health."""
+        with self._lock:
+            state = self._current_state()
+            retry_in = max(0.0, self.reset_timeout - (time.time() - self._opened_at)) if state == self.OPEN else 0.0
+            return {
+                "state": state,
+                "consecutive_failures": self._consecutive_failures,
+                "failure_threshold": self.failure_threshold,
+                "total_failures": self._total_failures,
+                "rejected_calls": self._total_rejected,
+                "retry_in_seconds": round(retry_in, 1),
+            }
+
+    def _current_state(self) -> str:
+        if self._state == self.OPEN and time.time() - self._opened_at >= self.reset_timeout:
+            self._state = self.HALF_OPEN
+        return self._state
+
+
+_STREAM_END = object()
+
+
+class _GuardedStream:
+    """Iterates a streamed Gemini reply with a deadline per chunk.
+
+    The breaker outcome of a streamed call is only known once the stream ends:
+    success when it completes (or the consumer stops reading early), failure
+    when a chunk misses its deadline or the stream breaks with a transient error.
+    """
+
+    def __init__(self, client: "ResilientGeminiClient", response: Any, chunk_timeout: float, start: float):
+        self._client = client
+        self._response = response
+        self._chunk_timeout = chunk_timeout
+        self._start = start
+
+    def __iter__(self):
+        chunks = iter(self._response)
+        outcome = None
+        try:
+            while True:
+                future = self._client._executor.submit(next, chunks, _STREAM_END)
+                try:
+                    chunk = future.result(timeout=self._chunk_timeout)
+                except FutureTimeoutError:
+                    outcome = False
+                    raise GeminiUnavailableError(
+                        f"Gemini stream stalled for more than {self._chunk_timeout:g}s"
+                    )
+                except RETRYABLE_ERRORS as e:
+                    outcome = False
+                    raise GeminiUnavailableError(f"Gemini stream failed: {str(e)}")
+                if chunk is _STREAM_END:
+                    outcome = True
+                    return
+                yield chunk
+        finally:
+            self._client._record_latency(self._start)
+            if outcome is False:
+                self._client.breaker.record_failure()
+            else:
+                # Completed, abandoned by the consumer, or a non-retryable error: Gemini answered
+                self._client.breaker.record_success()
+
+    def __getattr__(self, name: str) -> Any:
+        return getattr(self._response, name)
+
+
+class ResilientGeminiClient:
+    """Wraps a ``GenerativeModel`` with per-call deadlines, jittered retries and a circuit breaker.
+
+    It exposes the same ``generate_content`` call as the model, so it can be
+    passed anywhere a model is expected. Failures surface as
+    :class:`GeminiUnavailableError` and callers fall back to their mock or
+    lexical paths exactly as they did for raw SDK errors.
+
+    With ``stream=True`` the deadline and retries cover opening the stream;
+    the returned stream then enforces ``stream_chunk_timeout`` on every chunk
+    and reports to the breaker when it finishes.
+    """
+
+    def __init__(
+        self,
+        model: Any,
+        timeout: float = 20.0,
+        max_retries: int = 2,
+        backoff_base: float = 0.5,
+        backoff_max: float = 4.0,
+        breaker: Optional[CircuitBreaker] = None,
+        max_concurrency: int = 16,
+        stream_chunk_timeout: Optional[float] = None,
+    ):
+        self.model = model
+        self.timeout = timeout
+        self.stream_chunk_timeout = stream_chunk_timeout or timeout
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.breaker = breaker or CircuitBreaker()
+        # The SDK has no per-request timeout, so calls run on a pool and are abandoned at the deadline
+        self._executor = ThreadPoolExecutor(max_workers=max_concurrency, thread_name_prefix="gemini")
+
+    def is_available(self) -> bool:
+        """False while the breaker is open (callers should use their fallback without charging quota)."""
+        return self.breaker.state != CircuitBreaker.OPEN
+
+    def generate_content(self, contents: Any, timeout: Optional[float] = None, **kwargs) -> Any:
+        """``model.generate_content`` with a deadline covering all attempts."""
+        if not self.breaker.allow_request():
+            raise GeminiUnavailableError("Gemini circuit breaker is open")
+
+        deadline = time.time() + (timeout or self.timeout)
+        attempt = 0
+        while True:
+            remaining = deadline - time.time()
+            start = time.time()
+            try:
+                future = self._executor.submit(self.model.generate_content, contents, **kwargs)
+                response = future.result(timeout=max(remaining, 0.01))
+                if kwargs.get("stream"):
+                    return _GuardedStream(self, response, self.stream_chunk_timeout, start)
+                self._record_latency(start)
+                self.breaker.record_success()
+                return response
+            except FutureTimeoutError:
+                self._record_latency(start)
+                self.breaker.record_failure()
+                raise GeminiUnavailableError(f"Gemini call exceeded its {timeout or self.timeout:g}s deadline")
+            except RETRYABLE_ERRORS as e:
+                self._record_latency(start)
+                delay = random.uniform(0, min(self.backoff_max, self.backoff_base * (2 ** attempt)))
+                if attempt >= self.max_retries or time.time() + delay >= deadline:
+                    self.breaker.record_failure()
+                    raise GeminiUnavailableError(f"Gemini call failed after {attempt + 1} attempts: {str(e)}")
+                logger.warning(f"Gemini call failed ({str(e)}), retrying in {delay:.2f}s")
+                attempt += 1
+                time.sleep(delay)
+            except Exception:
+                # Non-retryable (bad request, blocked prompt...): the upstream itself is healthy
+                self.breaker.record_success()
+                raise
+
+    def __getattr__(self, name: str) -> Any:
+        return getattr(self.model, name)
+
+    @staticmethod
+    def _record_latency(start: float) -> None:
+        from lineup_backend.metrics import metrics
+        metrics.record_api_latency("gemini", (time.time() - start) * 1000)
+
+
 class GeminiService:
     """Service for interacting with Google's Gemini AI API."""
 
@@ -26,7 +283,7 @@ class GeminiService:
             try:
                 import google.generativeai as genai
                 genai.configure(api_key=api_key)
-                self.model = genai.GenerativeModel('gemini-2.0-flash')
+                self.model = ResilientGeminiClient(genai.GenerativeModel('gemini-2.0-flash'))
                 logger.info("Gemini API configured successfully")
             except Exception as e:
                 logger.error(f"Failed to configure Gemini: {e}")
@@ -65,50 +322,17 @@ class GeminiService:
         if not self.can_make_call():
             logger.warning("Gemini daily limit reached, returning mock data")
             return self._get_mock_analysis()
-            
-            prompt = """You are an expert hairstylist and facial analysis AI. Analyze this person's face and hair in the photo and provide personalized haircut recommendations.
-
-IMPORTANT: Return ONLY a valid JSON response with NO additional text, NO markdown formatting, NO code blocks.
-
-Return this EXACT JSON structure:
-{
-    "analysis": {
-        "faceShape": "[one of: oval, round, square, heart, oblong, diamond, triangle]",
-        "hairTexture": "[one of: straight, wavy, curly, coily, kinky]",
-        "hairColor": "[one of: black, dark-brown, brown, light-brown, blonde, red, gray, white, other]",
-        "estimatedGender": "[one of: male, female, non-binary]",
-        "estimatedAge": "[one of: under-20, 20-25, 25-30, 30-35, 35-40, 40-45, 45-50, 50-55, 55-60, over-60]"
-    },
-    "recommendations": [
-        {
-            "styleName": "[Specific haircut name]",
-            "description": "[2-3 sentence description of the haircut style and how it's achieved]",
-            "reason": "[1-2 sentences explaining why this works for their specific face shape, hair texture, and features]"
-        }
-    ]
-}
-
-Provide exactly 6 haircut recommendations that would work best for this person's features."""
 
         try:
             self._increment_usage()
-            response = self.model.generate_content([prompt, image])
-            response_text = response.text.strip()
-            
-            # Clean markdown formatting
-            response_text = self._clean_json_response(response_text)
-            
-            analysis_data = json.loads(response_text)
-            
-            # Validate response structure
-            if "analysis" not in analysis_data or "recommendations" not in analysis_data:
-                logger.warning("Invalid response structure from Gemini")
-                return self._get_mock_analysis()
-            
-            return analysis_data
+            response = self.model.generate_content(
+                [structured_prompt("analysis"), image],
+                generation_config=structured_generation_config("analysis"),
+            )
+            return parse_structured_response(response.text, "analysis")
             
-        except json.JSONDecodeError as e:
-            logger.error(f"Failed to parse Gemini response: {e}")
+        except ValidationError as e:
+            logger.error(f"Invalid Gemini analysis response: {e.errors}")
             return self._get_mock_analysis()
         except Exception as e:
             logger.error(f"Gemini API error: {e}")
@@ -130,29 +354,16 @@ Provide exactly 6 haircut recommendations that would work best for this person's
 
         try:
             image = Image.open(BytesIO(image_bytes))
-            
-            moderation_prompt = """Analyze this image and determine:
-1. Is there any explicit, adult, violent, or inappropriate content? (yes/no)
-2. Is this image related to hair, haircuts, hairstyles, or barber/stylist work? (yes/no)
-
-Respond with ONLY a JSON object in this exact format (no markdown, no explanation):
-{
-    "explicit_content": true/false,
-    "hair_related": true/false,
-    "confidence": "high" | "medium" | "low"
-}
-
-If explicit_content is true, the image must be rejected.
-If hair_related is false, the image must be rejected as it's not relevant to a hair/barber community."""
 
             self._increment_usage()
-            response = self.model.generate_content([moderation_prompt, image])
-            response_text = self._clean_json_response(response.text.strip())
+            response = self.model.generate_content(
+                [structured_prompt("moderation"), image],
+                generation_config=structured_generation_config("moderation"),
+            )
+            moderation_result = parse_structured_response(response.text, "moderation")
             
-            moderation_result = json.loads(response_text)
-            
-            explicit_content = moderation_result.get("explicit_content", False)
-            hair_related = moderation_result.get("hair_related", False)
+            explicit_content = moderation_result["explicit_content"]
+            hair_related = moderation_result["hair_related"]
             
             if explicit_content:
                 logger.warning("Content moderation: Rejected - Explicit content detected")
@@ -216,21 +427,6 @@ CRITICAL: Return ONLY the exact name from the list above. No explanations, no qu
             logger.warning(f"Gemini matching failed: {e}")
             return "Random"
 
-    @staticmethod
-    def _clean_json_response(text: str) -> str:
-        """Remove markdown formatting from JSON response."""
-        if "```json" in text:
-            start = text.find("```json") + 7
-            end = text.rfind("```")
-            if end > start:
-                return text[start:end].strip()
-        elif "```" in text:
-            start = text.find("```") + 3
-            end = text.rfind("```")
-            if end > start:
-                return text[start:end].strip()
-        return text
-    
     @staticmethod
     def _get_mock_analysis() -> dict:
         """Return mock analysis data when API is unavailable."""
@@ -4,10 +4,11 @@ from __future__ import annotations
 
 import base64
 import logging
-from io import BytesIO
 from typing import Any, Dict, List, Optional, Tuple
 
-from PIL import Image, ImageDraw, ImageFont
+from lineup_backend.image_pipeline import TRYON_MAX_EDGE, ingest_base64_image
+from lineup_backend.preview_renderer import PREVIEW_MAX_EDGE, render_preview
+from lineup_backend.style_resolver import ALLOWED_HAIRCUTS, StyleResolver
 
 from .base import BaseService
 
@@ -19,53 +20,14 @@ class ReplicateService(BaseService):
 
     MODEL_ID = "flux-kontext-apps/change-haircut:48f03523665cabe9a2e832ea9cc2d7c30ad5079cb5f1c1f07890d40596fe1f87"
     
-    ALLOWED_HAIRCUTS = [
-        "No change", "Random", "Straight", "Wavy", "Curly", "Bob", "Pixie Cut",
-        "Layered", "Messy Bun", "High Ponytail", "Low Ponytail", "Braided Ponytail",
-        "French Braid", "Dutch Braid", "Fishtail Braid", "Space Buns", "Top Knot",
-        "Undercut", "Mohawk", "Crew Cut", "Faux Hawk", "Slicked Back", "Side-Parted",
-        "Center-Parted", "Blunt Bangs", "Side-Swept Bangs", "Shag", "Lob",
-        "Angled Bob", "A-Line Bob", "Asymmetrical Bob", "Graduated Bob", "Inverted Bob",
-        "Layered Shag", "Choppy Layers", "Razor Cut", "Perm", "Ombré", "Straightened",
-        "Soft Waves", "Glamorous Waves", "Hollywood Waves", "Finger Waves", "Tousled",
-        "Feathered", "Pageboy", "Pigtails", "Pin Curls", "Rollerset", "Twist Out",
-        "Bantu Knots", "Dreadlocks", "Cornrows", "Box Braids", "Crochet Braids",
-        "Mohawk Fade",
-    ]
-
-    STYLE_MAPPINGS = {
-        "fade": "Mohawk Fade",
-        "modern fade": "Mohawk Fade",
-        "buzz": "Crew Cut",
-        "buzz cut": "Crew Cut",
-        "crew cut": "Crew Cut",
-        "short": "Crew Cut",
-        "quiff": "Slicked Back",
-        "pompadour": "Slicked Back",
-        "slick back": "Slicked Back",
-        "side part": "Side-Parted",
-        "parted": "Side-Parted",
-        "undercut": "Undercut",
-        "mohawk": "Mohawk",
-        "curly": "Curly",
-        "textured": "Tousled",
-        "messy": "Tousled",
-        "wavy": "Wavy",
-        "straight": "Straight",
-        "bob": "Bob",
-        "lob": "Lob",
-        "pixie": "Pixie Cut",
-        "bun": "Top Knot",
-        "layered": "Layered",
-        "dreadlocks": "Dreadlocks",
-        "center part": "Center-Parted",
-    }
+    ALLOWED_HAIRCUTS = ALLOWED_HAIRCUTS
 
     def __init__(self, api_token: Optional[str] = None):
         super().__init__()
         self._api_token = api_token
         self._replicate = None
         self._requests = None
+        self._style_resolver = None
 
         if api_token:
             try:
@@ -136,9 +98,9 @@ class ReplicateService(BaseService):
         gemini_service: Optional[Any],
     ) -> Dict[str, Any]:
         """Perform transformation using Replicate API."""
-        # Clean base64 data
+        # Clean base64 data and send a downscaled copy to Replicate
         img_data_raw = user_photo_base64.split(",")[1] if "," in user_photo_base64 else user_photo_base64
-        face_data_uri = f"data:image/jpeg;base64,{img_data_raw}"
+        face_data_uri = ingest_base64_image(img_data_raw, max_edge=TRYON_MAX_EDGE).to_data_uri(TRYON_MAX_EDGE)
 
         # Match style to allowed haircuts
         haircut_name = self._match_style(style_description, gemini_service)
@@ -190,27 +152,27 @@ class ReplicateService(BaseService):
         gemini_service: Optional[Any],
     ) -> str:
         """Match style description to allowed haircut name."""
-        # Try Gemini matching first
+        if self._style_resolver is None:
+            self._style_resolver = StyleResolver()
+
+        # Lookup table, fuzzy matcher and memo of earlier Gemini answers
+        haircut, _ = self._style_resolver.resolve_local(style_description)
+        if haircut:
+            return haircut
+
+        # Only novel descriptions go to Gemini
         if gemini_service and gemini_service.can_make_call():
             try:
                 matched = gemini_service.match_haircut_style(
                     style_description, self.ALLOWED_HAIRCUTS
                 )
-                if matched in self.ALLOWED_HAIRCUTS:
+                if matched in self.ALLOWED_HAIRCUTS and matched != "Random":
+                    self._style_resolver.remember(style_description, matched)
                     return matched
             except Exception as e:
                 logger.warning(f"Gemini matching failed: {e}")
 
-        # Fallback to keyword matching
-        style_lower = style_description.lower().strip()
-        
-        # Check longer phrases first
-        sorted_keys = sorted(self.STYLE_MAPPINGS.keys(), key=len, reverse=True)
-        for key in sorted_keys:
-            if key in style_lower:
-                return self.STYLE_MAPPINGS[key]
-
-        return "Random"
+        return self._style_resolver.resolve(style_description)
 
     def _extract_result_url(self, output: Any) -> Optional[str]:
         """Extract result URL from Replicate output."""
@@ -236,52 +198,9 @@ class ReplicateService(BaseService):
         logger.info("Using preview mode")
 
         try:
-            # Decode image
-            if "," in user_photo_base64:
-                img_data = base64.b64decode(user_photo_base64.split(",")[1])
-            else:
-                img_data = base64.b64decode(user_photo_base64)
-
-            img = Image.open(BytesIO(img_data))
-            
-            if img.mode not in ("RGB", "RGBA"):
-                img = img.convert("RGB")
-
-            # Add overlay
-            if img.mode == "RGB":
-                img = img.convert("RGBA")
-
-            overlay = Image.new("RGBA", img.size, (0, 0, 0, 0))
-            overlay_draw = ImageDraw.Draw(overlay)
-            
-            width, height = img.size
-            overlay_draw.rectangle([(0, height - 70), (width, height)], fill=(0, 0, 0, 200))
-            
-            img = Image.alpha_composite(img, overlay)
-            img = img.convert("RGB")
-
-            # Add text
-            draw = ImageDraw.Draw(img)
-            text = f"Preview: {style_description}"
-            
-            font = self._load_font()
-            
-            try:
-                bbox = draw.textbbox((0, 0), text, font=font)
-                text_width = bbox[2] - bbox[0]
-            except Exception:
-                text_width = len(text) * 15
-
-            text_x = max(10, (width - text_width) // 2)
-            text_y = max(10, height - 50)
-
-            draw.text((text_x + 2, text_y + 2), text, fill=(0, 0, 0), font=font)
-            draw.text((text_x, text_y), text, fill=(255, 255, 255), font=font)
-
-            # Convert to base64
-            buffer = BytesIO()
-            img.save(buffer, format="JPEG", quality=90, optimize=True)
-            result_base64 = base64.b64encode(buffer.getvalue()).decode("utf-8")
+            # Decode once (size budgets, EXIF orientation), straight at display size
+            ingested = ingest_base64_image(user_photo_base64, max_edge=PREVIEW_MAX_EDGE)
+            result_base64 = base64.b64encode(render_preview(ingested.image, style_description)).decode("utf-8")
 
             original_base64 = user_photo_base64.split(",")[1] if "," in user_photo_base64 else user_photo_base64
 
@@ -301,20 +220,3 @@ class ReplicateService(BaseService):
                 "success": False,
                 "error": f"Failed to create preview: {str(e)}",
             }
-
-    def _load_font(self) -> Any:
-        """Load a font for text overlay."""
-        font_paths = [
-            "/usr/share/fonts/truetype/dejavu/DejaVuSans-Bold.ttf",
-            "/usr/share/fonts/TTF/DejaVuSans-Bold.ttf",
-            "/System/Library/Fonts/Helvetica.ttc",
-            "arial.ttf",
-        ]
-        
-        for font_path in font_paths:
-            try:
-                return ImageFont.truetype(font_path, 28)
-            except Exception:
-                continue
-        
-        return ImageFont.load_default()
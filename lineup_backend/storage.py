@@ -9,10 +9,190 @@ data structures.
 
 from __future__ import annotations
 
-from typing import Dict, List
+import threading
+from typing import Any, Dict, Hashable, Iterable, List, Optional, Sequence
+
+_MISSING = object()
+
+
+class IndexedCollection(list):
+    """A list of records with an ``id`` index and optional secondary indexes.
+
+    Handlers used to find records with ``next(x for x in items if x["id"] == ...)``,
+    a scan per lookup. This is still a ``list`` (iteration, ``len``, slicing,
+    ``jsonify`` and ``insert(0, ...)`` behave as before), but every mutation
+    through it keeps ``id -> record`` and ``field value -> ids`` maps in step,
+    so :meth:`get` and :meth:`find` are O(1). A secondary index over a list
+    field (``hashtags``) indexes each element.
+
+    Records mutated in place on an indexed field must go through
+    :meth:`update` (or be passed to :meth:`reindex`) to stay findable.
+    """
+
+    def __init__(self, items: Iterable[dict] = (), indexes: Sequence[str] = ()):
+        super().__init__()
+        self.index_fields = tuple(indexes)
+        self._lock = threading.RLock()
+        self._by_id: Dict[str, dict] = {}
+        # field -> value -> ids; ids are kept in a dict for insertion order
+        self._indexes: Dict[str, Dict[Hashable, Dict[str, None]]] = {field: {} for field in self.index_fields}
+        # id -> field -> values it is indexed under (so updates can unindex the old ones)
+        self._indexed_values: Dict[str, Dict[str, List[Hashable]]] = {}
+        self.extend(items)
+
+    # --- lookups ---
+
+    def get(self, item_id: Any, default: Optional[dict] = None) -> Optional[dict]:
+        """Record with ``id == item_id`` (ids compare as strings), or ``default``."""
+        return self._by_id.get(str(item_id), default)
+
+    def find(self, field: str, value: Hashable) -> List[dict]:
+        """Records whose indexed ``field`` equals (or, for list fields, contains) ``value``."""
+        with self._lock:
+            ids = self._indexes[field].get(value, {})
+            return [self._by_id[item_id] for item_id in ids]
+
+    def count_by(self, field: str) -> Dict[Hashable, int]:
+        """Number of records per value of an indexed field."""
+        with self._lock:
+            return {value: len(ids) for value, ids in self._indexes[field].items()}
+
+    # --- mutations ---
+
+    def append(self, item: dict) -> None:
+        with self._lock:
+            self._discard(item)
+            self._index(item)
+            super().append(item)
+
+    def insert(self, position: int, item: dict) -> None:
+        with self._lock:
+            self._discard(item)
+            self._index(item)
+            super().insert(position, item)
+
+    def extend(self, items: Iterable[dict]) -> None:
+        for item in items:
+            self.append(item)
+
+    def __iadd__(self, items: Iterable[dict]) -> "IndexedCollection":
+        self.extend(items)
+        return self
+
+    def remove(self, item: dict) -> None:
+        with self._lock:
+            super().remove(item)
+            self._unindex(item)
+
+    def pop(self, position: int = -1) -> dict:
+        with self._lock:
+            item = super().pop(position)
+            self._unindex(item)
+            return item
+
+    def clear(self) -> None:
+        with self._lock:
+            super().clear()
+            self._by_id.clear()
+            self._indexed_values.clear()
+            for index in self._indexes.values():
+                index.clear()
+
+    def __setitem__(self, position, value) -> None:
+        with self._lock:
+            super().__setitem__(position, value)
+            self._rebuild()
+
+    def __delitem__(self, position) -> None:
+        with self._lock:
+            super().__delitem__(position)
+            self._rebuild()
+
+    def reset(self, items: Iterable[dict]) -> None:
+        """Replace the contents (mock data / restarts)."""
+        with self._lock:
+            self.clear()
+            self.extend(items)
+
+    def delete(self, item_id: Any) -> Optional[dict]:
+        """Remove and return the record with ``item_id``, if present."""
+        with self._lock:
+            item = self._by_id.get(str(item_id))
+            if item is not None:
+                self.remove(item)
+            return item
+
+    def update(self, item_id: Any, fields: Dict[str, Any]) -> Optional[dict]:
+        """Apply ``fields`` to the record with ``item_id`` and reindex it. Returns the record, or None."""
+        with self._lock:
+            item = self._by_id.get(str(item_id))
+            if item is None:
+                return None
+            item.update(fields)
+            self.reindex(item)
+            return item
+
+    def reindex(self, item: dict) -> None:
+        """Refresh the secondary index entries of a record that was changed in place."""
+        with self._lock:
+            item_id = str(item.get("id"))
+            self._remove_from_indexes(item_id)
+            self._add_to_indexes(item_id, item)
+
+    # --- internals (callers hold the lock) ---
+
+    def _index(self, item: dict) -> None:
+        item_id = str(item.get("id"))
+        self._by_id[item_id] = item
+        self._add_to_indexes(item_id, item)
+
+    def _unindex(self, item: dict) -> None:
+        item_id = str(item.get("id"))
+        if self._by_id.get(item_id) is item:
+            del self._by_id[item_id]
+            self._remove_from_indexes(item_id)
+
+    def _discard(self, item: dict) -> None:
+        """Ids are unique: drop a previous record with the same id before adding."""
+        previous = self._by_id.get(str(item.get("id")))
+        if previous is not None:
+            super().remove(previous)
+            self._unindex(previous)
+
+    def _add_to_indexes(self, item_id: str, item: dict) -> None:
+        indexed: Dict[str, List[Hashable]] = {}
+        for field in self.index_fields:
+            value = item.get(field, _MISSING)
+            if value is _MISSING or value is None:
+                continue
+            values = list(dict.fromkeys(value)) if isinstance(value, (list, tuple, set)) else [value]
+            for key in values:
+                self._indexes[field].setdefault(key, {})[item_id] = None
+            indexed[field] = values
+        self._indexed_values[item_id] = indexed
+
+    def _remove_from_indexes(self, item_id: str) -> None:
+        for field, values in self._indexed_values.pop(item_id, {}).items():
+            index = self._indexes[field]
+            for key in values:
+                ids = index.get(key)
+                if ids is not None:
+                    ids.pop(item_id, None)
+                    if not ids:
+                        del index[key]
+
+    def _rebuild(self) -> None:
+        items = list(super().__iter__())
+        self._by_id.clear()
+        self._indexed_values.clear()
+        for index in self._indexes.values():
+            index.clear()
+        for item in items:
+            self._index(item)
+
 
 # Social feed / community
-social_posts: List[dict] = []
+social_posts = IndexedCollection(indexes=("username", "hashtags"))
 post_comments: Dict[str, List[dict]] = {}
 user_follows: Dict[str, List[str]] = {}
 
@@ -23,9 +203,9 @@ barber_reviews: Dict[str, List[dict]] = {}
 hair_trends: Dict[str, dict] = {}
 
 # Commerce
-appointments: List[dict] = []
-subscription_packages: List[dict] = []
-client_subscriptions: List[dict] = []
+appointments = IndexedCollection(indexes=("barberId", "clientId"))
+subscription_packages = IndexedCollection(indexes=("barberId",))
+client_subscriptions = IndexedCollection(indexes=("clientId", "barberId"))
 
 
 def reset_all() -> None:
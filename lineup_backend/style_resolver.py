@@ -0,0 +1,431 @@
+"""Resolve free-text haircut descriptions to the try-on model's style names.
+
+The Replicate change-haircut model only accepts the names in
+:data:`ALLOWED_HAIRCUTS`. Descriptions mostly come from ``/analyze``
+``styleName`` values, so the same few dozen strings recur constantly.
+:class:`StyleResolver` tries, in order, an exact/alias lookup, a local fuzzy
+matcher and a persistent memo of earlier Gemini answers, and only asks Gemini
+for descriptions it has never seen.
+"""
+
+from __future__ import annotations
+
+import difflib
+import logging
+import os
+import re
+import sqlite3
+import threading
+import time
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from lineup_backend.metrics import metrics
+from lineup_backend.moderation_cache import CACHE_DIR
+
+logger = logging.getLogger(__name__)
+
+# Every haircut value accepted by flux-kontext-apps/change-haircut
+ALLOWED_HAIRCUTS = [
+    "No change", "Random", "Straight", "Wavy", "Curly", "Bob", "Pixie Cut",
+    "Layered", "Messy Bun", "High Ponytail", "Low Ponytail", "Braided Ponytail",
+    "French Braid", "Dutch Braid", "Fishtail Braid", "Space Buns", "Top Knot",
+    "Undercut", "Mohawk", "Crew Cut", "Faux Hawk", "Slicked Back", "Side-Parted",
+    "Center-Parted", "Blunt Bangs", "Side-Swept Bangs", "Shag", "Lob",
+    "Angled Bob", "A-Line Bob", "Asymmetrical Bob", "Graduated Bob", "Inverted Bob",
+    "Layered Shag", "Choppy Layers", "Razor Cut", "Perm", "Ombré", "Straightened",
+    "Soft Waves", "Glamorous Waves", "Hollywood Waves", "Finger Waves", "Tousled",
+    "Feathered", "Pageboy", "Pigtails", "Pin Curls", "Rollerset", "Twist Out",
+    "Bantu Knots", "Dreadlocks", "Cornrows", "Box Braids", "Crochet Braids",
+    "Double Dutch Braids", "French Fishtail Braid", "Waterfall Braid", "Rope Braid",
+    "Heart Braid", "Halo Braid", "Crown Braid", "Braided Crown", "Bubble Braid",
+    "Bubble Ponytail", "Ballerina Braids", "Milkmaid Braids", "Bohemian Braids",
+    "Flat Twist", "Crown Twist", "Twisted Bun", "Twisted Half-Updo", "Twist and Pin Updo",
+    "Chignon", "Simple Chignon", "Messy Chignon", "French Twist", "French Twist Updo",
+    "French Roll", "Updo", "Messy Updo", "Knotted Updo", "Ballerina Bun",
+    "Banana Clip Updo", "Beehive", "Bouffant", "Hair Bow", "Half-Up Top Knot",
+    "Half-Up, Half-Down", "Messy Bun with a Headband", "Messy Bun with a Scarf",
+    "Messy Fishtail Braid", "Sideswept Pixie", "Mohawk Fade", "Zig-Zag Part", "Victory Rolls",
+]
+
+# Style names /analyze commonly recommends that aren't model values themselves
+STYLE_ALIASES = {
+    "classic fade": "Mohawk Fade",
+    "modern fade": "Mohawk Fade",
+    "taper fade": "Mohawk Fade",
+    "low fade": "Mohawk Fade",
+    "mid fade": "Mohawk Fade",
+    "high fade": "Mohawk Fade",
+    "skin fade": "Mohawk Fade",
+    "drop fade": "Mohawk Fade",
+    "burst fade": "Mohawk Fade",
+    "side part with volume": "Side-Parted",
+    "classic side part": "Side-Parted",
+    "comb over": "Side-Parted",
+    "middle part": "Center-Parted",
+    "textured quiff": "Slicked Back",
+    "modern pompadour": "Slicked Back",
+    "swept back": "Slicked Back",
+    "messy crop": "Tousled",
+    "textured crop": "Tousled",
+    "french crop": "Tousled",
+    "short buzz": "Crew Cut",
+    "military cut": "Crew Cut",
+    "long bob": "Lob",
+    "disconnected undercut": "Undercut",
+    "shoulder length": "Half-Up, Half-Down",
+}
+
+# Keyword fallback (longest phrase wins)
+STYLE_KEYWORDS = {
+    "fade": "Mohawk Fade",
+    "buzz": "Crew Cut",
+    "buzz cut": "Crew Cut",
+    "crew cut": "Crew Cut",
+    "crewcut": "Crew Cut",
+    "quiff": "Slicked Back",
+    "pompadour": "Slicked Back",
+    "slick back": "Slicked Back",
+    "slicked back": "Slicked Back",
+    "slickback": "Slicked Back",
+    "side part": "Side-Parted",
+    "sidepart": "Side-Parted",
+    "side parted": "Side-Parted",
+    "undercut": "Undercut",
+    "mohawk": "Mohawk",
+    "curly": "Curly",
+    "textured": "Tousled",
+    "messy": "Tousled",
+    "tousled": "Tousled",
+    "afro": "Curly",
+    "wavy": "Wavy",
+    "waves": "Wavy",
+    "soft waves": "Soft Waves",
+    "straight": "Straight",
+    "straightened": "Straightened",
+    "bob": "Bob",
+    "lob": "Lob",
+    "a line bob": "A-Line Bob",
+    "pixie": "Pixie Cut",
+    "pixie cut": "Pixie Cut",
+    "bowl cut": "Pixie Cut",
+    "man bun": "Top Knot",
+    "bun": "Top Knot",
+    "top knot": "Top Knot",
+    "messy bun": "Messy Bun",
+    "layered": "Layered",
+    "layers": "Layered",
+    "dreadlocks": "Dreadlocks",
+    "dreads": "Dreadlocks",
+    "center part": "Center-Parted",
+    "centerpart": "Center-Parted",
+}
+
+# Too vague to skip Gemini on; only used once Gemini has had its chance
+WEAK_STYLE_KEYWORDS = {
+    "short": "Crew Cut",
+    "parted": "Side-Parted",
+    "volume": "Side-Parted",
+    "long": "Half-Up, Half-Down",
+    "long hair": "Half-Up, Half-Down",
+}
+
+MATCH_PROMPT = """You are a professional hairstylist matching haircut descriptions to specific style names.
+
+Match this haircut description to the BEST option from the allowed list.
+
+HAIRCUT DESCRIPTION: "{description}"
+
+ALLOWED STYLES (choose ONE exact match):
+{allowed}
+
+MATCHING RULES:
+- Any fade → "Mohawk Fade"; side part → "Side-Parted"; center/middle part → "Center-Parted"
+- Quiff, pompadour, slick/swept back → "Slicked Back"; buzz/crew/military → "Crew Cut"
+- Textured or messy crops → "Tousled"; long hair → "Half-Up, Half-Down"; afro/curls → "Curly"
+- Man bun/top knot → "Top Knot"; long bob → "Lob"; bowl cut → "Pixie Cut"
+
+Return ONLY the exact name from the list. No explanations, no quotes."""
+
+BATCH_MATCH_PROMPT = """You are a professional hairstylist matching haircut descriptions to specific style names.
+
+Match EACH numbered haircut description to the BEST option from the allowed list.
+
+HAIRCUT DESCRIPTIONS:
+{descriptions}
+
+ALLOWED STYLES (choose ONE exact match per description):
+{allowed}
+
+MATCHING RULES:
+- Any fade → "Mohawk Fade"; side part → "Side-Parted"; center/middle part → "Center-Parted"
+- Quiff, pompadour, slick/swept back → "Slicked Back"; buzz/crew/military → "Crew Cut"
+- Textured or messy crops → "Tousled"; long hair → "Half-Up, Half-Down"; afro/curls → "Curly"
+- Man bun/top knot → "Top Knot"; long bob → "Lob"; bowl cut → "Pixie Cut"
+
+Return one line per description in the same order, formatted as "<number>. <exact name from the list>". No explanations, no quotes."""
+
+
+def normalize_style(text: str) -> str:
+    """Lowercase, drop punctuation and collapse whitespace (``Side-Parted`` -> ``side parted``)."""
+    text = re.sub(r"[-_/]", " ", (text or "").lower())
+    text = re.sub(r"[^\w\s]", "", text)
+    return " ".join(text.split())
+
+
+def _contains_phrase(haystack: str, phrase: str) -> bool:
+    return f" {phrase} " in f" {haystack} "
+
+
+class StyleResolver:
+    """Tiered, memoized mapping from style descriptions to :data:`ALLOWED_HAIRCUTS`."""
+
+    SOURCES = ("exact", "fuzzy", "memo", "gemini", "fallback")
+
+    def __init__(
+        self,
+        gemini_model: Any = None,
+        can_call_gemini: Optional[Callable[[], bool]] = None,
+        record_gemini_call: Optional[Callable[[], None]] = None,
+        memo_path: Optional[str] = None,
+        fuzzy_cutoff: float = 0.85,
+    ):
+        self.gemini_model = gemini_model
+        self._can_call_gemini = can_call_gemini
+        self._record_gemini_call = record_gemini_call
+        self.fuzzy_cutoff = fuzzy_cutoff
+        self.counts: Dict[str, int] = {source: 0 for source in self.SOURCES}
+
+        self._lookup = {normalize_style(name): name for name in ALLOWED_HAIRCUTS}
+        self._lookup.update({normalize_style(alias): name for alias, name in STYLE_ALIASES.items()})
+        # Model names that can be picked out of a longer description ("Long Layered Shag")
+        self._phrases = sorted(
+            (key for key, name in self._lookup.items() if name not in ("Random", "No change")),
+            key=len, reverse=True,
+        )
+        self._keywords = sorted(STYLE_KEYWORDS, key=len, reverse=True)
+        self._weak_keywords = sorted({**STYLE_KEYWORDS, **WEAK_STYLE_KEYWORDS}, key=len, reverse=True)
+
+        self._lock = threading.Lock()
+        self.memo_path = memo_path or os.path.join(CACHE_DIR, "style_resolutions.sqlite3")
+        try:
+            os.makedirs(os.path.dirname(self.memo_path), exist_ok=True)
+            self._conn = sqlite3.connect(self.memo_path, check_same_thread=False, timeout=5)
+        except (OSError, sqlite3.Error) as e:
+            logger.warning(f"Style memo not persistent ({str(e)}), using in-memory store")
+            self.memo_path = ":memory:"
+            self._conn = sqlite3.connect(self.memo_path, check_same_thread=False)
+        with self._lock:
+            self._conn.execute(
+                """CREATE TABLE IF NOT EXISTS resolutions (
+                    description TEXT PRIMARY KEY,
+                    haircut TEXT NOT NULL,
+                    created_at REAL NOT NULL
+                )"""
+            )
+            self._conn.commit()
+
+    def resolve(self, description: str) -> str:
+        """Best allowed haircut name for ``description`` (``"Random"`` if nothing fits)."""
+        key = normalize_style(description)
+        start = time.time()
+
+        haircut, source = self.resolve_local(description)
+        if haircut:
+            metrics.record_cache_hit("style_resolver", response_time_ms=(time.time() - start) * 1000)
+            return self._resolved(description, haircut, source)
+        metrics.record_cache_miss("style_resolver")
+
+        haircut, exact = self._ask_gemini(description)
+        if haircut:
+            metrics.record_api_call_time("style_resolver", (time.time() - start) * 1000)
+            if exact:
+                self.remember(description, haircut)
+            return self._resolved(description, haircut, "gemini")
+
+        return self._resolved(description, self._keyword_match(key, self._weak_keywords) or "Random", "fallback")
+
+    def resolve_many(self, descriptions: List[str]) -> List[str]:
+        """:meth:`resolve` for several descriptions, asking Gemini about all novel ones in one call."""
+        start = time.time()
+        resolved: Dict[str, Tuple[str, str]] = {}
+        novel: Dict[str, str] = {}
+        for description in descriptions:
+            key = normalize_style(description)
+            if key in resolved or key in novel:
+                continue
+            haircut, source = self.resolve_local(description)
+            if haircut:
+                metrics.record_cache_hit("style_resolver", response_time_ms=(time.time() - start) * 1000)
+                resolved[key] = (haircut, source)
+            else:
+                metrics.record_cache_miss("style_resolver")
+                novel[key] = description
+
+        if len(novel) == 1:
+            description = next(iter(novel.values()))
+            answers = {description: self._ask_gemini(description)}
+        else:
+            answers = self._ask_gemini_many(list(novel.values())) if novel else {}
+        for key, description in novel.items():
+            haircut, exact = answers.get(description) or (None, False)
+            if haircut:
+                if exact:
+                    self.remember(description, haircut)
+                resolved[key] = (haircut, "gemini")
+            else:
+                resolved[key] = (self._keyword_match(key, self._weak_keywords) or "Random", "fallback")
+        if novel:
+            metrics.record_api_call_time("style_resolver", (time.time() - start) * 1000)
+
+        return [self._resolved(d, *resolved[normalize_style(d)]) for d in descriptions]
+
+    def resolve_local(self, description: str) -> Tuple[Optional[str], Optional[str]]:
+        """``(haircut, source)`` from the lookup table, fuzzy matcher or memo, without calling Gemini."""
+        key = normalize_style(description)
+        if not key:
+            return "Random", "exact"
+
+        if key in self._lookup:
+            return self._lookup[key], "exact"
+
+        haircut = self._fuzzy_match(key)
+        if haircut:
+            return haircut, "fuzzy"
+
+        haircut = self._memo_get(key)
+        if haircut:
+            return haircut, "memo"
+
+        return None, None
+
+    def remember(self, description: str, haircut: str) -> None:
+        """Persist a resolution (e.g. a Gemini answer) for future requests."""
+        if haircut not in ALLOWED_HAIRCUTS:
+            return
+        try:
+            with self._lock:
+                self._conn.execute(
+                    "INSERT OR REPLACE INTO resolutions (description, haircut, created_at) VALUES (?, ?, ?)",
+                    (normalize_style(description), haircut, time.time()),
+                )
+                self._conn.commit()
+        except sqlite3.Error as e:
+            logger.warning(f"Style memo write failed: {str(e)}")
+
+    def stats(self) -> Dict[str, Any]:
+        """Resolution counts by tier, for /metrics."""
+        try:
+            with self._lock:
+                memo_size = self._conn.execute("SELECT COUNT(*) FROM resolutions").fetchone()[0]
+        except sqlite3.Error:
+            memo_size = 0
+        return {
+            "resolved_by": dict(self.counts),
+            "memo_size": memo_size,
+            "persistent": self.memo_path != ":memory:",
+        }
+
+    def _resolved(self, description: str, haircut: str, source: str) -> str:
+        self.counts[source] += 1
+        logger.info(f"Resolved style '{description}' -> '{haircut}' ({source})")
+        return haircut
+
+    def _fuzzy_match(self, key: str) -> Optional[str]:
+        for phrase in self._phrases:
+            if _contains_phrase(key, phrase):
+                return self._lookup[phrase]
+
+        haircut = self._keyword_match(key, self._keywords)
+        if haircut:
+            return haircut
+
+        close = difflib.get_close_matches(key, self._lookup.keys(), n=1, cutoff=self.fuzzy_cutoff)
+        return self._lookup[close[0]] if close else None
+
+    @staticmethod
+    def _keyword_match(key: str, keywords) -> Optional[str]:
+        mapping = {**STYLE_KEYWORDS, **WEAK_STYLE_KEYWORDS}
+        for keyword in keywords:
+            if _contains_phrase(key, keyword):
+                return mapping[keyword]
+        return None
+
+    def _memo_get(self, key: str) -> Optional[str]:
+        try:
+            with self._lock:
+                row = self._conn.execute(
+                    "SELECT haircut FROM resolutions WHERE description = ?", (key,)
+                ).fetchone()
+        except sqlite3.Error as e:
+            logger.warning(f"Style memo lookup failed: {str(e)}")
+            return None
+        return row[0] if row else None
+
+    def _gemini_ready(self) -> bool:
+        model = self.gemini_model
+        if not model:
+            return False
+        if hasattr(model, "is_available") and not model.is_available():
+            return False
+        if self._can_call_gemini and not self._can_call_gemini():
+            return False
+        return True
+
+    def _ask_gemini(self, description: str) -> Tuple[Optional[str], bool]:
+        if not self._gemini_ready():
+            return None, False
+
+        try:
+            if self._record_gemini_call:
+                self._record_gemini_call()
+            response = self.gemini_model.generate_content(
+                MATCH_PROMPT.format(description=description, allowed=", ".join(ALLOWED_HAIRCUTS)),
+                generation_config={"temperature": 0.0, "max_output_tokens": 16},
+            )
+            answer = response.text.strip().split("\n")[0]
+        except Exception as e:
+            logger.warning(f"Gemini style matching failed: {str(e)}")
+            return None, False
+        return self._allowed_name(answer)
+
+    def _ask_gemini_many(self, descriptions: List[str]) -> Dict[str, Tuple[str, bool]]:
+        if not self._gemini_ready():
+            return {}
+
+        numbered = "\n".join(f'{i}. "{d}"' for i, d in enumerate(descriptions, 1))
+        try:
+            if self._record_gemini_call:
+                self._record_gemini_call()
+            response = self.gemini_model.generate_content(
+                BATCH_MATCH_PROMPT.format(descriptions=numbered, allowed=", ".join(ALLOWED_HAIRCUTS)),
+                generation_config={"temperature": 0.0, "max_output_tokens": 16 * len(descriptions)},
+            )
+            lines = response.text.strip().split("\n")
+        except Exception as e:
+            logger.warning(f"Gemini batch style matching failed: {str(e)}")
+            return {}
+
+        answers: Dict[str, Tuple[str, bool]] = {}
+        for line in lines:
+            match = re.match(r"\s*(\d+)[.):]\s*(.+)", line)
+            if not match or not 1 <= int(match.group(1)) <= len(descriptions):
+                continue
+            haircut, exact = self._allowed_name(match.group(2))
+            if haircut:
+                answers[descriptions[int(match.group(1)) - 1]] = (haircut, exact)
+        return answers
+
+    def _allowed_name(self, answer: str) -> Tuple[Optional[str], bool]:
+        """``(haircut, exact)`` for a Gemini answer; only exact answers are worth memoizing."""
+        key = normalize_style(answer)
+        if not key:
+            logger.warning("Gemini returned an empty style match")
+            return None, False
+        if key in self._lookup:
+            return self._lookup[key], True
+        # A longer reply that names a style as whole words ("Undercut with a fade"), never the other way round
+        for phrase in self._phrases:
+            if _contains_phrase(key, phrase):
+                return self._lookup[phrase], False
+        logger.warning(f"Gemini returned '{answer}' which is not an allowed haircut")
+        return None, False
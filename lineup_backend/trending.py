@@ -0,0 +1,115 @@
+"""Incrementally maintained, time-decayed trending hashtags.
+
+``/ai-insights`` used to flatten every post's hashtags and call
+``list.count`` per tag, quadratic in the feed size and blind to recency.
+:class:`TrendingHashtags` is updated once per new post instead. Each use of a
+tag adds 1 to an exponentially decayed score (halved every ``half_life``
+seconds), so the ranking reflects what is being posted now.
+
+Scores are stored as ``uses * 2 ** ((t - epoch) / half_life)``. Decay then
+multiplies every score by the same factor, which never changes the order, so
+adding a use touches one tag and the current top list stays valid without a
+rescan. Only ``max_tags`` tags are tracked; once over the limit, the lowest
+scores (the long tail) are dropped.
+"""
+
+from __future__ import annotations
+
+import threading
+import time
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+# Rebase stored scores before 2 ** exponent gets anywhere near float overflow
+_REBASE_EXPONENT = 512
+
+
+def normalize_hashtag(tag: str) -> str:
+    return str(tag or "").strip().lstrip("#").lower()
+
+
+class TrendingHashtags:
+    """Exponentially decayed hashtag counters with an always-sorted top list."""
+
+    def __init__(self, half_life: float = 6 * 3600, max_tags: int = 5000, top_size: int = 20):
+        self.half_life = half_life
+        self.max_tags = max_tags
+        self.top_size = top_size
+        self._epoch = time.time()
+        self._scores: Dict[str, float] = {}
+        self._top: List[Tuple[float, str]] = []  # (stored score, tag), highest first
+        self._lock = threading.Lock()
+        self.uses = 0
+        self.pruned = 0
+
+    def add(self, hashtags: Iterable[str], at: Optional[float] = None) -> None:
+        """Count one use of each of ``hashtags`` (a post's tags) at ``at`` (default: now)."""
+        tags = {normalize_hashtag(tag) for tag in hashtags or ()}
+        tags.discard("")
+        if not tags:
+            return
+        with self._lock:
+            at = time.time() if at is None else at
+            if (at - self._epoch) / self.half_life > _REBASE_EXPONENT:
+                self._rebase(at)
+            weight = 2 ** ((at - self._epoch) / self.half_life)
+            for tag in tags:
+                self._scores[tag] = self._scores.get(tag, 0.0) + weight
+                self._promote(tag)
+            self.uses += len(tags)
+            if len(self._scores) > self.max_tags:
+                self._prune()
+
+    def top(self, k: int = 5, min_score: float = 0.0) -> List[Tuple[str, float]]:
+        """Up to ``k`` (tag, current decayed score) pairs, highest first, with score >= ``min_score``."""
+        with self._lock:
+            decay = 2 ** (-(time.time() - self._epoch) / self.half_life)
+            result = []
+            for stored, tag in self._top[:k]:
+                score = stored * decay
+                if score < min_score:
+                    break
+                result.append((tag, round(score, 3)))
+            return result
+
+    def reset(self) -> None:
+        with self._lock:
+            self._epoch = time.time()
+            self._scores.clear()
+            self._top.clear()
+
+    def stats(self) -> Dict[str, Any]:
+        """Tracked tag counts for /metrics."""
+        with self._lock:
+            return {
+                "tracked_tags": len(self._scores),
+                "max_tags": self.max_tags,
+                "uses": self.uses,
+                "pruned": self.pruned,
+                "half_life_seconds": self.half_life,
+            }
+
+    def _promote(self, tag: str) -> None:
+        """Keep ``_top`` sorted after ``tag``'s score went up (O(top_size))."""
+        score = self._scores[tag]
+        self._top = [entry for entry in self._top if entry[1] != tag]
+        if len(self._top) >= self.top_size and score <= self._top[-1][0]:
+            return
+        position = 0
+        while position < len(self._top) and self._top[position][0] >= score:
+            position += 1
+        self._top.insert(position, (score, tag))
+        del self._top[self.top_size:]
+
+    def _prune(self) -> None:
+        """Drop the lowest-scored tags down to 90% of ``max_tags`` (amortised over many adds)."""
+        keep = int(self.max_tags * 0.9)
+        ranked = sorted(self._scores.items(), key=lambda item: item[1], reverse=True)
+        self._scores = dict(ranked[:keep])
+        self.pruned += len(ranked) - keep
+
+    def _rebase(self, at: float) -> None:
+        factor = 2 ** (-(at - self._epoch) / self.half_life)
+        self._epoch = at
+        self._scores = {tag: score * factor for tag, score in self._scores.items() if score * factor > 1e-9}
+        self._top = [(score * factor, tag) for score, tag in self._top if tag in self._scores]
+
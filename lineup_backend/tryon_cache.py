@@ -0,0 +1,143 @@
+"""On-disk cache of generated try-on images.
+
+Every Replicate try-on is a paid 10-30 s prediction, and users often repeat
+the same photo + style (e.g. after navigating back). Results are stored as
+files named by a SHA-256 of (normalized image hash, resolved haircut, model
+version), kept within a total byte budget (least recently used files go
+first) and expired after a TTL.
+"""
+
+from __future__ import annotations
+
+import hashlib
+import logging
+import os
+import threading
+import time
+from typing import Any, Dict, Optional, Tuple
+
+from lineup_backend.moderation_cache import CACHE_DIR
+
+logger = logging.getLogger(__name__)
+
+
+def tryon_cache_key(image_hash: str, haircut: str, model_version: str) -> str:
+    """Content address for one (photo, haircut, model) combination."""
+    return hashlib.sha256(f"{image_hash}\0{haircut}\0{model_version}".encode("utf-8")).hexdigest()
+
+
+class TryOnResultCache:
+    """Byte-budgeted, TTL-bound directory of result images keyed by :func:`tryon_cache_key`."""
+
+    def __init__(
+        self,
+        directory: Optional[str] = None,
+        max_bytes: int = 256 * 1024 * 1024,
+        ttl_seconds: int = 7 * 24 * 3600,
+    ):
+        self.directory = directory or os.path.join(CACHE_DIR, "tryon")
+        self.max_bytes = max_bytes
+        self.ttl_seconds = ttl_seconds
+        self._lock = threading.Lock()
+        # key -> (size, last_used); rebuilt from the directory so it survives restarts
+        self._index: Dict[str, Tuple[int, float]] = {}
+        self._total_bytes = 0
+        self.hits = 0
+        self.misses = 0
+
+        try:
+            os.makedirs(self.directory, exist_ok=True)
+            for entry in os.scandir(self.directory):
+                if entry.is_file() and entry.name.endswith(".img"):
+                    stat = entry.stat()
+                    self._index[entry.name[:-4]] = (stat.st_size, stat.st_mtime)
+                    self._total_bytes += stat.st_size
+        except OSError as e:
+            logger.warning(f"Try-on cache directory unavailable ({str(e)}), caching disabled")
+            self.directory = None
+
+    def get(self, key: str) -> Optional[bytes]:
+        """Cached image bytes for ``key``, or None if missing or expired."""
+        if not self.directory:
+            return None
+        with self._lock:
+            entry = self._index.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            if time.time() - entry[1] >= self.ttl_seconds:
+                self._remove(key)
+                self.misses += 1
+                return None
+            try:
+                with open(self._path(key), "rb") as f:
+                    data = f.read()
+                now = time.time()
+                os.utime(self._path(key), (now, now))
+                self._index[key] = (entry[0], now)
+            except OSError:
+                self._remove(key)
+                self.misses += 1
+                return None
+            self.hits += 1
+            return data
+
+    def locate(self, key: str) -> Optional[str]:
+        """File path of a live entry (for streaming it out), without counting a hit."""
+        if not self.directory:
+            return None
+        with self._lock:
+            entry = self._index.get(key)
+            if entry is None or time.time() - entry[1] >= self.ttl_seconds:
+                return None
+            return self._path(key)
+
+    def set(self, key: str, data: bytes) -> None:
+        """Store ``data`` and evict least recently used results past the byte budget."""
+        if not self.directory or len(data) > self.max_bytes:
+            return
+        tmp_path = f"{self._path(key)}.{threading.get_ident()}.tmp"
+        try:
+            with open(tmp_path, "wb") as f:
+                f.write(data)
+            os.replace(tmp_path, self._path(key))
+        except OSError as e:
+            logger.warning(f"Try-on cache write failed: {str(e)}")
+            return
+
+        with self._lock:
+            previous = self._index.get(key)
+            if previous:
+                self._total_bytes -= previous[0]
+            self._index[key] = (len(data), time.time())
+            self._total_bytes += len(data)
+            if self._total_bytes > self.max_bytes:
+                for old_key, _ in sorted(self._index.items(), key=lambda item: item[1][1]):
+                    if self._total_bytes <= self.max_bytes:
+                        break
+                    if old_key != key:
+                        self._remove(old_key)
+
+    def stats(self) -> Dict[str, Any]:
+        """Size and hit counts for /metrics."""
+        with self._lock:
+            return {
+                "entries": len(self._index),
+                "bytes": self._total_bytes,
+                "max_bytes": self.max_bytes,
+                "ttl_seconds": self.ttl_seconds,
+                "hits": self.hits,
+                "misses": self.misses,
+                "enabled": self.directory is not None,
+            }
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self.directory, f"{key}.img")
+
+    def _remove(self, key: str) -> None:
+        size, _ = self._index.pop(key, (0, 0))
+        self._total_bytes -= size
+        try:
+            os.remove(self._path(key))
+        except OSError:
+            pass
@@ -0,0 +1,194 @@
+"""Background job table for virtual try-on.
+
+A Replicate transformation takes 10-30 s, far too long to hold a sync gunicorn
+worker. ``POST /virtual-tryon`` hands the work to :class:`TryOnJobQueue` and
+returns a job id; clients poll (or long-poll / stream) the job until it
+settles. Runners report intermediate progress (e.g. the Replicate prediction
+status) through the ``report`` callback they are given.
+"""
+
+from __future__ import annotations
+
+import logging
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from typing import Any, Callable, Dict, Hashable, List, Optional
+
+logger = logging.getLogger(__name__)
+
+QUEUED = "queued"
+RUNNING = "running"
+SUCCEEDED = "succeeded"
+FAILED = "failed"
+TERMINAL_STATUSES = (SUCCEEDED, FAILED)
+
+Runner = Callable[[Callable[..., None]], Dict[str, Any]]
+
+
+class TryOnJobQueue:
+    """Runs try-on jobs on a worker pool and keeps a bounded table of their state."""
+
+    def __init__(self, max_workers: int = 2, max_jobs: int = 200):
+        self._max_jobs = max_jobs
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="tryon")
+        self._jobs: "OrderedDict[str, Dict[str, Any]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._changed = threading.Condition(self._lock)
+
+    def submit(self, run: Runner, meta: Optional[Dict[str, Any]] = None) -> dict:
+        """Queue ``run(report)`` and return the job's initial snapshot."""
+        now = datetime.now().isoformat()
+        job = {
+            "id": str(uuid.uuid4()),
+            "status": QUEUED,
+            "stage": None,
+            "meta": meta or {},
+            "result": None,
+            "error": None,
+            "createdAt": now,
+            "updatedAt": now,
+            "version": 0,
+        }
+        with self._lock:
+            self._jobs[job["id"]] = job
+            self._trim()
+            snapshot = self._snapshot(job)
+
+        self._executor.submit(self._run, job["id"], run)
+        logger.info(f"Try-on job {job['id']} queued")
+        return snapshot
+
+    def get(self, job_id: str) -> Optional[dict]:
+        """Current snapshot of a job, or None if unknown (or already evicted)."""
+        with self._lock:
+            job = self._jobs.get(job_id)
+            return self._snapshot(job) if job else None
+
+    def wait(self, job_id: str, timeout: float) -> Optional[dict]:
+        """Block up to ``timeout`` seconds for the job to settle, then return its snapshot."""
+        deadline = time.time() + timeout
+        with self._changed:
+            job = self._jobs.get(job_id)
+            while job and job["status"] not in TERMINAL_STATUSES and time.time() < deadline:
+                self._changed.wait(deadline - time.time())
+            return self._snapshot(job) if job else None
+
+    def wait_for_change(self, job_id: str, version: int, timeout: float) -> Optional[dict]:
+        """Block until the job moves past ``version`` (or ``timeout``); used by the SSE stream."""
+        deadline = time.time() + timeout
+        with self._changed:
+            job = self._jobs.get(job_id)
+            while job and job["version"] == version and time.time() < deadline:
+                self._changed.wait(deadline - time.time())
+            return self._snapshot(job) if job else None
+
+    def wait_any(self, job_ids: List[str], timeout: float) -> List[dict]:
+        """Block until at least one of ``job_ids`` has settled (or ``timeout``); return the settled snapshots."""
+        deadline = time.time() + timeout
+        with self._changed:
+            while True:
+                settled = [
+                    self._snapshot(self._jobs[jid]) for jid in job_ids
+                    if jid in self._jobs and self._jobs[jid]["status"] in TERMINAL_STATUSES
+                ]
+                remaining = deadline - time.time()
+                if settled or remaining <= 0:
+                    return settled
+                self._changed.wait(remaining)
+
+    def stats(self) -> Dict[str, int]:
+        """Job counts by status."""
+        with self._lock:
+            counts: Dict[str, int] = {}
+            for job in self._jobs.values():
+                counts[job["status"]] = counts.get(job["status"], 0) + 1
+        return counts
+
+    def _run(self, job_id: str, run: Runner) -> None:
+        self._update(job_id, status=RUNNING)
+        try:
+            result = run(lambda **fields: self._update(job_id, **fields))
+            self._update(job_id, status=SUCCEEDED, result=result, stage=None)
+            logger.info(f"Try-on job {job_id} succeeded")
+        except Exception as e:
+            logger.error(f"Try-on job {job_id} failed: {str(e)}")
+            self._update(job_id, status=FAILED, error=str(e), stage=None)
+
+    def _update(self, job_id: str, **fields: Any) -> None:
+        with self._changed:
+            job = self._jobs.get(job_id)
+            if not job:
+                return
+            job.update(fields)
+            job["updatedAt"] = datetime.now().isoformat()
+            job["version"] += 1
+            if job["status"] in TERMINAL_STATUSES:
+                # The table may have grown past max_jobs while everything was live
+                self._trim(keep=job_id)
+            self._changed.notify_all()
+
+    def _trim(self, keep: Optional[str] = None) -> None:
+        """Forget the oldest settled jobs beyond ``max_jobs`` (caller holds the lock).
+
+        Queued and running jobs are never dropped: their result would be lost
+        and pollers would get a 404. A burst can exceed the bound until they settle.
+        """
+        excess = len(self._jobs) - self._max_jobs
+        if excess <= 0:
+            return
+        settled = [
+            jid for jid, j in self._jobs.items()
+            if j["status"] in TERMINAL_STATUSES and jid != keep
+        ][:excess]
+        for jid in settled:
+            del self._jobs[jid]
+
+    @staticmethod
+    def _snapshot(job: Dict[str, Any]) -> dict:
+        snapshot = {
+            "jobId": job["id"],
+            "status": job["status"],
+            "createdAt": job["createdAt"],
+            "updatedAt": job["updatedAt"],
+            "version": job["version"],
+            **job["meta"],
+        }
+        if job["stage"]:
+            snapshot["stage"] = job["stage"]
+        if job["result"] is not None:
+            snapshot["result"] = job["result"]
+        if job["error"]:
+            snapshot["error"] = job["error"]
+        return snapshot
+
+
+class UserSlots:
+    """Per-user cap on concurrently running predictions, so one batch can't take the whole pool."""
+
+    def __init__(self, limit: int = 2):
+        self.limit = limit
+        self._in_use: Dict[Hashable, int] = {}
+        self._lock = threading.Lock()
+
+    def try_acquire(self, user: Hashable) -> bool:
+        with self._lock:
+            if self._in_use.get(user, 0) >= self.limit:
+                return False
+            self._in_use[user] = self._in_use.get(user, 0) + 1
+            return True
+
+    def release(self, user: Hashable) -> None:
+        with self._lock:
+            count = self._in_use.get(user, 0) - 1
+            if count > 0:
+                self._in_use[user] = count
+            else:
+                self._in_use.pop(user, None)
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return {"users": len(self._in_use), "in_use": sum(self._in_use.values()), "limit": self.limit}
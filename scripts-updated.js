@@ -104,6 +104,8 @@ let base64ImageData = null;
 let lastRecommendedStyles = [];
 let currentUserMode = 'client';
 let socialPosts = [];
+let socialFeedCursor = null; // nextCursor from GET /social, null when there are no older posts
+let followedUsers = new Set(); // usernames current_user follows (from the home timeline endpoint)
 let barberPortfolio = [];
 let appointments = [];
 let currentBarberForBooking = null;
@@ -1041,12 +1043,38 @@ function setupLocationSearch() {
 }
 
 // --- Social Media Functions ---
-async function loadSocialPosts() {
+function mediaSrc(src) {
+  // Images kept in the backend's local blob store come back as /media/<hash> paths
+  return src && src.startsWith('/media/') ? `${API_URL}${src}` : src;
+}
+
+async function loadFollowedUsers() {
+  try {
+    const response = await fetch(`${API_URL}/users/current_user/timeline?limit=1`);
+    const data = await response.json();
+    followedUsers = new Set(data.following || []);
+  } catch (error) {
+    console.error('Error loading followed users:', error);
+  }
+}
+
+async function loadSocialPosts(loadOlder = false) {
+  if (!loadOlder) {
+    await loadFollowedUsers();
+  }
   try {
-    const response = await fetch(`${API_URL}/social`);
+    // The feed is paginated: the first page, or the page after the last one loaded
+    const url = loadOlder && socialFeedCursor
+      ? `${API_URL}/social?before=${encodeURIComponent(socialFeedCursor)}`
+      : `${API_URL}/social`;
+    const response = await fetch(url);
     const data = await response.json();
     
     if (data.posts && Array.isArray(data.posts)) {
+      if (loadOlder || socialFeedCursor === null) {
+        socialFeedCursor = data.nextCursor || null;
+      }
+      
       // Create a map of existing post IDs to avoid duplicates
       const existingIds = new Set(socialPosts.map(p => String(p.id)));
       
@@ -1115,8 +1143,8 @@ function renderSocialFeed() {
       else timeAgo = postTime.toLocaleDateString();
     }
     
-    // Handle image URL - support both base64 and Cloudinary URLs
-    let imageSrc = post.image || '';
+    // Handle image URL - support base64, Cloudinary URLs and the backend's local /media/ store
+    let imageSrc = mediaSrc(post.image || '');
     if (imageSrc && !imageSrc.startsWith('http') && !imageSrc.startsWith('data:')) {
       // If it's base64 without prefix, add data URL prefix
       imageSrc = `data:image/jpeg;base64,${imageSrc}`;
@@ -1132,7 +1160,7 @@ function renderSocialFeed() {
         </div>
       </div>
         <button onclick="toggleFollow('${post.username}')" class="text-sky-400 hover:text-sky-300 text-sm font-medium">
-          Follow
+          ${followedUsers.has(post.username) ? 'Following' : 'Follow'}
         </button>
       </div>
       <img src="${imageSrc}" alt="Post image" class="w-full h-80 object-cover">
@@ -1170,6 +1198,18 @@ function renderSocialFeed() {
     `;
     socialFeedContainer.appendChild(postElement);
   });
+
+  if (socialFeedCursor) {
+    const loadMoreButton = document.createElement('button');
+    loadMoreButton.className = 'w-full bg-gray-800 text-gray-300 py-3 rounded-lg hover:bg-gray-700 transition-colors';
+    loadMoreButton.textContent = 'Load older posts';
+    loadMoreButton.onclick = () => {
+      loadMoreButton.disabled = true;
+      loadMoreButton.textContent = 'Loading...';
+      loadSocialPosts(true);
+    };
+    socialFeedContainer.appendChild(loadMoreButton);
+  }
 }
 
 function handlePostImageUpload(e) {
@@ -1432,7 +1472,7 @@ async function renderBarberPortfolio() {
     workElement.className = 'bg-gray-900 border border-gray-800 rounded-xl overflow-hidden card-hover';
     workElement.innerHTML = `
       <div class="relative aspect-square overflow-hidden bg-gray-800">
-        <img src="${work.image}" alt="${work.styleName}" class="w-full h-full object-cover">
+        <img src="${mediaSrc(work.image)}" alt="${work.styleName}" class="w-full h-full object-cover">
       </div>
       <div class="p-4">
         <h3 class="text-lg font-bold text-white mb-2">${work.styleName}</h3>
@@ -2400,17 +2440,27 @@ async function tryOnStyle(styleName) {
       },
       body: JSON.stringify({
         userPhoto: base64ImageData,
-        styleDescription: styleName
+        styleDescription: styleName,
+        // Get the result back as a URL instead of base64 + an echo of our own photo
+        responseMode: 'url'
       })
     });
 
-    const result = await response.json();
+    let result = await response.json();
+
+    // Real AI try-ons run as a background job: long-poll until it settles
+    if (response.status === 202 && result.statusUrl) {
+      result = await waitForTryOnJob(result.statusUrl);
+    }
 
     if (response.ok && result.success) {
       // Display the result image with before/after comparison
       // Use originalImage from response, or fall back to stored base64ImageData
-      const originalImg = result.originalImage || base64ImageData;
-      displayTryOnResult(originalImg, result.resultImage, styleName, result.poweredBy);
+      const originalSrc = `data:image/jpeg;base64,${result.originalImage || base64ImageData}`;
+      const resultSrc = result.resultUrl
+        ? `${API_URL}${result.resultUrl}`
+        : `data:${result.resultType || 'image/jpeg'};base64,${result.resultImage}`;
+      displayTryOnResult(originalSrc, resultSrc, styleName, result.poweredBy);
       
       alert(`✅ Try-On Complete!\n\nStyle: ${styleName}\n${result.message || ''}\n\nScroll down to see your before & after!`);
     } else {
@@ -2428,7 +2478,26 @@ async function tryOnStyle(styleName) {
   }
 }
 
-function displayTryOnResult(originalImageBase64, resultImageBase64, styleName, poweredBy) {
+async function waitForTryOnJob(statusUrl) {
+  // Each request waits up to 25s server-side; give up after ~3 minutes
+  for (let attempt = 0; attempt < 8; attempt++) {
+    const response = await fetch(`${API_URL}${statusUrl}?wait=25`);
+    const job = await response.json();
+    if (!response.ok) {
+      throw new Error(job.error || 'Try-on job not found');
+    }
+    if (job.status === 'succeeded') {
+      return job.result;
+    }
+    if (job.status === 'failed') {
+      throw new Error(job.error || 'Try-on failed');
+    }
+    console.log(`Try-on job ${job.jobId}: ${job.stage || job.status}`);
+  }
+  throw new Error('Try-on is taking too long, please try again');
+}
+
+function displayTryOnResult(originalImageSrc, resultImageSrc, styleName, poweredBy) {
   // Find or create results container
   let resultsContainer = document.getElementById('tryon-results-container');
   
@@ -2457,7 +2526,7 @@ function displayTryOnResult(originalImageBase64, resultImageBase64, styleName, p
         <div class="text-center">
           <p class="text-gray-400 text-sm font-semibold mb-2">Before</p>
           <div class="w-full aspect-square rounded-lg shadow-lg border-2 border-gray-600 overflow-hidden bg-gray-700 flex items-center justify-center">
-            <img src="data:image/jpeg;base64,${originalImageBase64}" 
+            <img src="${originalImageSrc}" 
                  alt="Before" 
                  class="w-full h-full object-contain rounded-lg">
           </div>
@@ -2467,7 +2536,7 @@ function displayTryOnResult(originalImageBase64, resultImageBase64, styleName, p
         <div class="text-center">
           <p class="text-gray-400 text-sm font-semibold mb-2">After</p>
           <div class="w-full aspect-square rounded-lg shadow-lg border-2 border-sky-500 overflow-hidden bg-gray-700 flex items-center justify-center">
-            <img src="data:image/jpeg;base64,${resultImageBase64}" 
+            <img src="${resultImageSrc}" 
                  alt="After" 
                  class="w-full h-full object-contain rounded-lg">
           </div>
@@ -2481,7 +2550,7 @@ function displayTryOnResult(originalImageBase64, resultImageBase64, styleName, p
                 class="flex-1 bg-gray-700 text-white py-2 px-4 rounded-lg hover:bg-gray-600 transition-colors">
           Close
         </button>
-        <button onclick="downloadTryOnImage('${resultImageBase64}', '${styleName}')" 
+        <button onclick="downloadTryOnImage('${resultImageSrc}', '${styleName}')" 
                 class="flex-1 bg-sky-500 text-white py-2 px-4 rounded-lg hover:bg-sky-600 transition-colors">
           Download After Image
         </button>
@@ -2493,13 +2562,17 @@ function displayTryOnResult(originalImageBase64, resultImageBase64, styleName, p
   resultsContainer.scrollIntoView({ behavior: 'smooth', block: 'center' });
 }
 
-function downloadTryOnImage(base64Data, styleName) {
+async function downloadTryOnImage(imageSrc, styleName) {
+  // Cross-origin URLs ignore the download attribute, so fetch them into a blob first
+  const blob = await (await fetch(imageSrc)).blob();
+  const extension = blob.type === 'image/webp' ? 'webp' : 'jpg';
   const link = document.createElement('a');
-  link.href = `data:image/jpeg;base64,${base64Data}`;
-  link.download = `lineup-tryon-${styleName.replace(/\s+/g, '-').toLowerCase()}.jpg`;
+  link.href = URL.createObjectURL(blob);
+  link.download = `lineup-tryon-${styleName.replace(/\s+/g, '-').toLowerCase()}.${extension}`;
   document.body.appendChild(link);
   link.click();
   document.body.removeChild(link);
+  URL.revokeObjectURL(link.href);
 }
 
 // --- Subscription Package Functions ---
@@ -2656,6 +2729,56 @@ async function deletePackage(packageId) {
 // ============================================================
 
 let postCommentsState = {}; // Track which post comments are visible
+let postCommentCursors = {}; // postId -> nextCursor for older comments, null when none are left
+
+function renderComment(comment) {
+  const commentDiv = document.createElement('div');
+  commentDiv.className = 'flex gap-2';
+  commentDiv.innerHTML = `
+    <span class="font-semibold text-white text-sm">${comment.username}</span>
+    <span class="text-gray-300 text-sm">${comment.text}</span>
+  `;
+  return commentDiv;
+}
+
+// Pages arrive newest first; shown oldest first, older pages are prepended above
+async function loadComments(postId, loadOlder = false) {
+  const commentsDiv = document.getElementById(`comments-${postId}`);
+  if (!commentsDiv) return;
+  
+  const cursor = loadOlder ? postCommentCursors[postId] : null;
+  const url = cursor
+    ? `${API_URL}/social/${postId}/comments?before=${encodeURIComponent(cursor)}`
+    : `${API_URL}/social/${postId}/comments`;
+  const response = await fetch(url);
+  const data = await response.json();
+  postCommentCursors[postId] = data.nextCursor || null;
+  
+  if (!loadOlder) {
+    commentsDiv.innerHTML = '';
+  }
+  const olderButton = commentsDiv.querySelector('.load-older-comments');
+  if (olderButton) olderButton.remove();
+  
+  const comments = (data.comments || []).slice().reverse();
+  const fragment = document.createDocumentFragment();
+  comments.forEach(comment => fragment.appendChild(renderComment(comment)));
+  commentsDiv.insertBefore(fragment, commentsDiv.firstChild);
+  
+  if (postCommentCursors[postId]) {
+    const button = document.createElement('button');
+    button.className = 'load-older-comments text-gray-400 text-xs hover:text-white';
+    button.textContent = 'View earlier comments';
+    button.onclick = () => loadComments(postId, true).catch(error => {
+      console.error('Error loading comments:', error);
+      alert('Failed to load comments');
+    });
+    commentsDiv.insertBefore(button, commentsDiv.firstChild);
+  }
+  if (!commentsDiv.children.length) {
+    commentsDiv.innerHTML = '<p class="text-gray-500 text-sm">No comments yet</p>';
+  }
+}
 
 async function toggleComments(postId) {
   const commentsDiv = document.getElementById(`comments-${postId}`);
@@ -2664,25 +2787,9 @@ async function toggleComments(postId) {
   const isHidden = commentsDiv.classList.contains('hidden');
   
   if (isHidden) {
-    // Load and show comments
+    // Load and show the newest page of comments
     try {
-      const response = await fetch(`${API_URL}/social/${postId}/comments`);
-      const data = await response.json();
-      
-      commentsDiv.innerHTML = '';
-      if (data.comments && data.comments.length > 0) {
-        data.comments.forEach(comment => {
-          const commentDiv = document.createElement('div');
-          commentDiv.className = 'flex gap-2';
-          commentDiv.innerHTML = `
-            <span class="font-semibold text-white text-sm">${comment.username}</span>
-            <span class="text-gray-300 text-sm">${comment.text}</span>
-          `;
-          commentsDiv.appendChild(commentDiv);
-        });
-      } else {
-        commentsDiv.innerHTML = '<p class="text-gray-500 text-sm">No comments yet</p>';
-      }
+      await loadComments(postId);
       commentsDiv.classList.remove('hidden');
     } catch (error) {
       console.error('Error loading comments:', error);
@@ -2750,7 +2857,7 @@ async function sharePost(postId) {
 }
 
 async function toggleFollow(username) {
-  const isFollowing = (user_follows?.current_user || []).includes(username);
+  const isFollowing = followedUsers.has(username);
   
   const endpoint = isFollowing ? 'unfollow' : 'follow';
   
@@ -2766,6 +2873,12 @@ async function toggleFollow(username) {
     });
     
     if (response.ok) {
+      const data = await response.json();
+      if (data.following) {
+        followedUsers.add(username);
+      } else {
+        followedUsers.delete(username);
+      }
       alert(isFollowing ? `Unfollowed ${username}` : `Now following ${username}!`);
       renderSocialFeed(); // Re-render to update follow button
     } else {